@@ -8,7 +8,16 @@ import flywheel
 from PyQt5 import QtGui, QtWidgets, uic
 
 from management.analysis_management import AnalysisManagement
+from management.api_limiter import AdaptiveLimiter, ApiStatus
 from management.app_management import AppManagement
+from management.cache_management import CacheIndex, CacheManagement
+from management.caching_client import CachingClient
+from management.content_store import ContentStore
+from management.download_management import DownloadManagement
+from management.error_reporting import ErrorStatus
+from management.metadata_store import MetadataStore
+from management.session_management import SessionManagement
+from management.settings import load_settings
 from management.tree_management import TreeManagement
 
 
@@ -21,20 +30,47 @@ class AppLauncher(QtWidgets.QMainWindow):
         """
         super(AppLauncher, self).__init__()
         self.CacheDir = Path(os.path.expanduser("~") + "/flywheelIO/")
+        self.CacheDir.mkdir(parents=True, exist_ok=True)
+        self.settings = load_settings(self.CacheDir)
 
         # TODO: allow them to change what they are logged into
-        self.fw_client = flywheel.Client()
+        self.limiter = AdaptiveLimiter(
+            self.settings["api_concurrency"],
+            1,
+            self.settings["api_max_concurrency"],
+            self.settings["api_latency_target"],
+        )
+        self.fw_client = CachingClient(
+            flywheel.Client(),
+            self.limiter,
+            self.settings["client_cache_ttl"],
+            self.settings["client_cache_entries"],
+        )
+        self.metadata_store = MetadataStore(
+            self.CacheDir / ".metadata.sqlite",
+            self.fw_client,
+            self.settings["metadata_ttls"],
+        )
 
         self.source_dir = Path(op.dirname(os.path.realpath(__file__)))
 
         Form, _ = uic.loadUiType(self.source_dir / "resources/app_launcher.ui")
         self.ui = Form()
         self.ui.setupUi(self)
+        # Reports errors of background work from here on
+        self.error_status = ErrorStatus(self)
+
+        self.cache_index = CacheIndex(self.CacheDir)
+        self.content_store = ContentStore(self.CacheDir / ".objects")
 
         # Initialize related component subsets
+        self.download_management = DownloadManagement(self)
         self.tree_management = TreeManagement(self)
+        self.cache_management = CacheManagement(self)
+        self.session_management = SessionManagement(self)
         self.app_management = AppManagement(self)
         self.analysis_management = AnalysisManagement(self)
+        self.api_status = ApiStatus(self)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,337 @@
+import copy
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from glob import glob
+from pathlib import Path
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from management.content_store import hash_file
+from management.error_reporting import report_error
+from management.workers import Worker
+
+
+def save_config(config):
+    """
+    Save the config of a local analysis, replacing the previous one atomically.
+
+    Args:
+        config (dict): Config of the local analysis.
+    """
+    config_file = Path(config["path"]) / "config.json"
+    tmp_path = config_file.with_name(config_file.name + ".part")
+    with open(tmp_path, "w") as fp:
+        json.dump(config, fp, indent=4)
+    os.replace(tmp_path, config_file)
+
+
+class UploadSignals(QObject):
+    """
+    Signals emitted by an UploadJob.
+    """
+
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str, object)
+
+
+class UploadJob(QRunnable):
+    """
+    Upload an output file to a flywheel analysis on a worker thread.
+
+    The upload starts within the limit of API requests, and is retried if the
+    instance refuses it.
+    """
+
+    def __init__(self, analysis, path, limiter):
+        """
+        Initialize job with the file to upload.
+
+        Args:
+            analysis (flywheel.AnalysisOutput): Analysis to upload the file to.
+            path (str): Path to the output file.
+            limiter (AdaptiveLimiter): Limiter of concurrent API requests.
+        """
+        super(UploadJob, self).__init__()
+        self.analysis = analysis
+        self.path = path
+        self.limiter = limiter
+        self.signals = UploadSignals()
+
+    def run(self):
+        """
+        Upload the file, reporting completion or the last failure.
+        """
+        try:
+            self.limiter.upload(self.analysis.upload_file, self.path)
+        except Exception as e:
+            self.signals.failed.emit(self.path, e)
+        else:
+            self.signals.finished.emit(self.path)
+
+
+class AnalysisCommit:
+    """
+    Commit a local analysis to the flywheel instance without blocking the GUI.
+
+    Input references are taken from the analysis config, where they are recorded as
+    files are cached. Inputs of older analyses are resolved with one request per
+    hosting container. The flywheel analysis and each uploaded output are recorded
+    in the config as they complete, so an interrupted commit resumes where it
+    stopped.
+
+    Once committed, an analysis is synced by the same process: the size, modified
+    time and hash of every uploaded output are kept in a manifest, and only outputs
+    that are new or whose content changed are uploaded again. Outputs whose size
+    and modified time are unchanged are not even hashed.
+    """
+
+    # Maximum number of outputs uploaded at once
+    max_workers = 4
+
+    def __init__(self, fw_client, config, on_progress, on_finished):
+        """
+        Initialize commit of a local analysis.
+
+        Args:
+            fw_client (CachingClient): Client to commit with.
+            config (dict): Config of the local analysis.
+            on_progress (callable): Called with a description of the progress.
+            on_finished (callable): Called with the updated config and the outputs
+                that failed to upload once the commit is over.
+        """
+        self.fw_client = fw_client
+        self.config = config
+        self.config.setdefault("manifest", {})
+        # Manifest entries of the outputs being uploaded, keyed by path
+        self.entries = {}
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(self.max_workers)
+        self.pending = set()
+        self.failed = {}
+        self.n_outputs = 0
+        # Flywheel analysis the outputs are uploaded to, once prepared
+        self.analysis = None
+        # Set if the outputs changed again during the commit
+        self.resync = False
+
+    def start(self):
+        """
+        Create the flywheel analysis, if needed, and upload outputs in parallel.
+
+        Workers only read a copy of the config and return their results; the config
+        is updated and saved on the GUI thread.
+        """
+        self.on_progress("Preparing commit...")
+        self.preparer = Worker(self._prepare, copy.deepcopy(self.config))
+        self.preparer.signals.batch.connect(self._prepared)
+        self.preparer.signals.error.connect(self._prepare_failed)
+        QThreadPool.globalInstance().start(self.preparer)
+
+    def _prepare(self, config):
+        """
+        Create the flywheel analysis unless a previous commit did.
+
+        Runs on a worker thread.
+
+        Args:
+            config (dict): Copy of the config of the local analysis.
+
+        Returns:
+            flywheel.AnalysisOutput: Flywheel analysis of the local analysis.
+        """
+        if config.get("analysis_id"):
+            return self.fw_client.get_analysis(config["analysis_id"])
+        analysis_parent = self.fw_client.get(config["container_id"])
+        analysis = self.fw_client.limiter.write(
+            analysis_parent.add_analysis,
+            label=config["analysis_name"],
+            inputs=self._input_refs(config),
+        )
+        self.fw_client.invalidate(analysis_parent.id)
+        return analysis
+
+    def _prepared(self, analysis):
+        """
+        Record the flywheel analysis, so a resumed commit does not create it again,
+        and find the outputs to upload.
+
+        Args:
+            analysis (flywheel.AnalysisOutput): Flywheel analysis of the local
+                analysis.
+        """
+        self.analysis = analysis
+        if self.config.get("analysis_id") != analysis.id:
+            self.config["analysis_id"] = analysis.id
+            save_config(self.config)
+        self.scanner = Worker(
+            self._changed_outputs,
+            copy.deepcopy(self.config["manifest"]),
+            self.config["output"],
+        )
+        self.scanner.signals.batch.connect(self._upload)
+        self.scanner.signals.error.connect(self._prepare_failed)
+        QThreadPool.globalInstance().start(self.scanner)
+
+    @staticmethod
+    def _changed_outputs(manifest, output_dir):
+        """
+        Find the outputs that are new or changed since they were uploaded.
+
+        Outputs whose size or modified time differ from the manifest are hashed in
+        parallel; those with the same hash only have their manifest entry updated.
+
+        Runs on a worker thread.
+
+        Args:
+            manifest (dict): Copy of the manifest of the uploaded outputs.
+            output_dir (str): Directory of the outputs.
+
+        Returns:
+            tuple: Manifest entries of the outputs to upload, keyed by path, and
+                updated manifest entries of unchanged outputs, keyed by name.
+        """
+        candidates = {}
+        for path in glob(output_dir + "/*"):
+            if not Path(path).is_file():
+                continue
+            stat = os.stat(path)
+            entry = {"size": stat.st_size, "mtime": stat.st_mtime}
+            uploaded = manifest.get(Path(path).name, {})
+            if all(uploaded.get(key) == value for key, value in entry.items()):
+                continue
+            candidates[path] = entry
+
+        with ThreadPoolExecutor() as executor:
+            digests = executor.map(hash_file, candidates.keys())
+            for (path, entry), digest in zip(candidates.items(), digests):
+                entry["hash"] = digest
+        changed = {}
+        unchanged = {}
+        for path, entry in candidates.items():
+            name = Path(path).name
+            if manifest.get(name, {}).get("hash") == entry["hash"]:
+                unchanged[name] = entry
+            else:
+                changed[path] = entry
+        return changed, unchanged
+
+    def _input_refs(self, config):
+        """
+        References of the input files of the analysis.
+
+        Args:
+            config (dict): Copy of the config of the local analysis.
+
+        Returns:
+            list: Type and id of the container hosting each file, and its name.
+        """
+        refs = config.get("input_refs", {})
+        containers = {}
+        input_refs = []
+        for file_id, path in config["input_files"].items():
+            if file_id in refs:
+                input_refs.append(refs[file_id])
+                continue
+            # The cache path is .../container_id/file_id/file_name
+            path = Path(path)
+            container_id = path.parents[1].name
+            if container_id not in containers:
+                containers[container_id] = self.fw_client.get(container_id)
+            container = containers[container_id]
+            input_refs.append(
+                {
+                    "type": container.container_type,
+                    "id": container.id,
+                    "name": path.name,
+                }
+            )
+        return input_refs
+
+    def _prepare_failed(self, error):
+        """
+        Report a commit that could not create its flywheel analysis or list its
+        outputs.
+
+        Args:
+            error (Exception): Exception raised while preparing.
+        """
+        report_error(error)
+        self.failed[None] = error
+        self.on_finished(self.config, self.failed)
+
+    def _upload(self, result):
+        """
+        Upload outputs in parallel.
+
+        Args:
+            result (tuple): Manifest entries of the outputs to upload, keyed by
+                path, and updated manifest entries of unchanged outputs, keyed by
+                name.
+        """
+        outputs, unchanged = result
+        if unchanged:
+            self.config["manifest"].update(unchanged)
+            save_config(self.config)
+        self.entries = outputs
+        self.pending = set(outputs)
+        self.n_outputs = len(outputs)
+        if not outputs:
+            self._finish()
+            return
+        self._report_progress()
+        for path in outputs:
+            job = UploadJob(self.analysis, path, self.fw_client.limiter)
+            job.signals.finished.connect(self._uploaded)
+            job.signals.failed.connect(self._upload_failed)
+            self.thread_pool.start(job)
+
+    def _uploaded(self, path):
+        """
+        Record an uploaded output, so it is not uploaded again on resume.
+
+        Args:
+            path (str): Path to the uploaded output.
+        """
+        self.pending.discard(path)
+        self.fw_client.invalidate(self.config["analysis_id"])
+        self.config["manifest"][Path(path).name] = self.entries[path]
+        save_config(self.config)
+        self._report_progress()
+        if not self.pending:
+            self._finish()
+
+    def _upload_failed(self, path, error):
+        """
+        Record an output that could not be uploaded.
+
+        Args:
+            path (str): Path to the output.
+            error (Exception): Exception raised by the last attempt.
+        """
+        report_error(error)
+        self.pending.discard(path)
+        self.failed[path] = error
+        if not self.pending:
+            self._finish()
+
+    def _report_progress(self):
+        """
+        Describe the number of outputs uploaded so far.
+        """
+        done = self.n_outputs - len(self.pending)
+        self.on_progress(f"Committing outputs: {done}/{self.n_outputs} files")
+
+    def _finish(self):
+        """
+        Mark the analysis as committed, or synced, if every output was uploaded.
+        """
+        if not self.failed:
+            now = str(datetime.now())
+            self.config["committed"] = self.config.get("committed") or now
+            self.config["synced"] = now
+            save_config(self.config)
+        self.on_finished(self.config, self.failed)
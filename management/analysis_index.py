@@ -0,0 +1,369 @@
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from PyQt5 import QtGui
+from PyQt5.QtCore import QModelIndex
+
+from management.error_reporting import report_error
+
+
+def output_size(config):
+    """
+    Total size of the outputs of a local analysis.
+
+    Args:
+        config (dict): Config of the local analysis.
+
+    Returns:
+        int: Size of the output files in bytes.
+    """
+    size = 0
+    for root, _, files in os.walk(config["output"]):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+
+class AnalysisIndex:
+    """
+    On-disk index of the local analyses.
+
+    Local analyses are listed from the index rather than by reading the config of
+    every analysis directory. The index is built from the analysis directories when
+    it is created, and updated as analyses are created, edited, committed or
+    deleted.
+    """
+
+    # Columns that analyses can be filtered by
+    filter_columns = ["app_name", "container_id", "committed"]
+
+    def __init__(self, db_path, analysis_base_dir):
+        """
+        Open (or create and build) the index.
+
+        Args:
+            db_path (pathlib.Path): Path to the SQLite database.
+            analysis_base_dir (pathlib.Path): Directory of the local analyses.
+        """
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        with self.lock, self.conn:
+            exists = self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE name = 'analyses'"
+            ).fetchone()
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS analyses ("
+                "path TEXT PRIMARY KEY, analysis_name TEXT, app_name TEXT, "
+                "method TEXT, container_id TEXT, committed INTEGER, size INTEGER, "
+                "config TEXT)"
+            )
+        if not exists:
+            self.rebuild(analysis_base_dir)
+
+    def rebuild(self, analysis_base_dir):
+        """
+        Index every analysis directory that has a config.
+
+        Args:
+            analysis_base_dir (pathlib.Path): Directory of the local analyses.
+        """
+        configs = []
+        for config_file in Path(analysis_base_dir).glob("*/config.json"):
+            try:
+                with open(config_file, "r") as fp:
+                    configs.append(json.load(fp))
+            except (OSError, ValueError) as e:
+                report_error(e)
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM analyses")
+            for config in configs:
+                self._put(config)
+
+    def put(self, config):
+        """
+        Add or update an analysis.
+
+        Args:
+            config (dict): Config of the local analysis.
+        """
+        with self.lock, self.conn:
+            self._put(config)
+
+    def _put(self, config):
+        """
+        Write an analysis into the open transaction.
+
+        Args:
+            config (dict): Config of the local analysis.
+        """
+        values = self.filter_values(config)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                config["path"],
+                config["analysis_name"],
+                values["app_name"],
+                config["method"],
+                values["container_id"],
+                values["committed"],
+                output_size(config),
+                json.dumps(config),
+            ),
+        )
+
+    @staticmethod
+    def filter_values(config):
+        """
+        Values of the filter columns of an analysis.
+
+        Args:
+            config (dict): Config of the local analysis.
+
+        Returns:
+            dict: Values keyed by filter column.
+        """
+        return {
+            "app_name": config["app_name"],
+            "container_id": config["container_id"],
+            "committed": int(config["committed"] is not None),
+        }
+
+    def get(self, path):
+        """
+        Config of an analysis.
+
+        Args:
+            path (str): Directory of the local analysis.
+
+        Returns:
+            dict: Config of the analysis, or None if it is not indexed.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT config FROM analyses WHERE path = ?", (path,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, path):
+        """
+        Remove an analysis.
+
+        Args:
+            path (str): Directory of the local analysis.
+        """
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM analyses WHERE path = ?", (path,))
+
+    def _where(self, filters):
+        """
+        SQL condition selecting the analyses that match filters.
+
+        Args:
+            filters (dict): Values to match, keyed by filter column.
+
+        Returns:
+            tuple: Condition and its parameters.
+        """
+        conditions = ["1"]
+        params = []
+        for column in self.filter_columns:
+            if filters.get(column) is not None:
+                conditions.append(f"{column} = ?")
+                params.append(filters[column])
+        return " AND ".join(conditions), params
+
+    def count(self, filters):
+        """
+        Count the analyses that match filters.
+
+        Args:
+            filters (dict): Values to match, keyed by filter column.
+
+        Returns:
+            int: Number of matching analyses.
+        """
+        where, params = self._where(filters)
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT COUNT(*) FROM analyses WHERE {where}", params
+            ).fetchone()[0]
+
+    def page(self, filters, offset, limit):
+        """
+        List a page of the analyses that match filters, newest first.
+
+        Args:
+            filters (dict): Values to match, keyed by filter column.
+            offset (int): Number of matching analyses to skip.
+            limit (int): Maximum number of analyses to list.
+
+        Returns:
+            list: Configs of the analyses.
+        """
+        where, params = self._where(filters)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT config FROM analyses WHERE {where} "
+                # Analysis directories are named by time-ordered object ids
+                "ORDER BY path DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def values(self, column):
+        """
+        Distinct values of a filter column.
+
+        Args:
+            column (str): Filter column (e.g. app_name).
+
+        Returns:
+            list: Sorted distinct values.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT DISTINCT {column} FROM analyses ORDER BY {column}"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+class AnalysesModel(QtGui.QStandardItemModel):
+    """
+    List of local analyses, loaded from the index a page at a time as it is
+    scrolled.
+    """
+
+    page_size = 50
+
+    def __init__(self, analysis_index):
+        """
+        Initialize an empty model.
+
+        Args:
+            analysis_index (AnalysisIndex): Index to list analyses from.
+        """
+        super(AnalysesModel, self).__init__()
+        self.analysis_index = analysis_index
+        self.filters = {}
+        self.total = 0
+
+    def set_filters(self, filters):
+        """
+        List the analyses that match filters.
+
+        Args:
+            filters (dict): Values to match, keyed by filter column.
+        """
+        self.filters = filters
+        self.clear()
+        self.total = self.analysis_index.count(filters)
+        self.fetchMore(QModelIndex())
+
+    def canFetchMore(self, parent):
+        """
+        Check if more analyses match than are listed.
+
+        Args:
+            parent (QtCore.QModelIndex): Parent of the rows (only the root).
+
+        Returns:
+            bool: True if more analyses can be listed.
+        """
+        return not parent.isValid() and self.rowCount() < self.total
+
+    def fetchMore(self, parent):
+        """
+        List the next page of matching analyses.
+
+        Args:
+            parent (QtCore.QModelIndex): Parent of the rows (only the root).
+        """
+        if parent.isValid():
+            return
+        for config in self.analysis_index.page(
+            self.filters, self.rowCount(), self.page_size
+        ):
+            self.appendRow(self._item(config))
+
+    def matches(self, config):
+        """
+        Check if an analysis matches the filters of the list.
+
+        Args:
+            config (dict): Config of the analysis.
+
+        Returns:
+            bool: True if the analysis matches.
+        """
+        values = self.analysis_index.filter_values(config)
+        return all(
+            self.filters.get(column) in (None, value)
+            for column, value in values.items()
+        )
+
+    def add(self, config):
+        """
+        List a new (indexed) analysis first, clearing filters it does not match.
+
+        Args:
+            config (dict): Config of the new analysis.
+
+        Returns:
+            QtGui.QStandardItem: Item of the analysis.
+        """
+        if not self.matches(config):
+            # The new analysis is the first listed once unfiltered
+            self.set_filters({})
+            return self.item(0)
+        item = self._item(config)
+        self.insertRow(0, item)
+        self.total += 1
+        return item
+
+    def find(self, path):
+        """
+        Item of an analysis, if it is listed.
+
+        Args:
+            path (str): Directory of the analysis.
+
+        Returns:
+            QtGui.QStandardItem: Item of the analysis, or None if not listed.
+        """
+        for row in range(self.rowCount()):
+            item = self.item(row)
+            if item.data()["path"] == path:
+                return item
+        return None
+
+    def remove(self, item):
+        """
+        Remove the item of a deleted analysis.
+
+        Args:
+            item (QtGui.QStandardItem): Item of the analysis.
+        """
+        self.removeRow(item.row())
+        self.total -= 1
+
+    @staticmethod
+    def _item(config):
+        """
+        Create the item of an analysis.
+
+        Args:
+            config (dict): Config of the analysis.
+
+        Returns:
+            QtGui.QStandardItem: Item of the analysis.
+        """
+        item = QtGui.QStandardItem(config["analysis_name"])
+        item.setToolTip(config["analysis_name"])
+        item.setData(config)
+        return item
@@ -1,14 +1,18 @@
 import json
 import shutil
 from datetime import datetime
-from glob import glob
-from pathlib import Path
+from functools import partial
 
 import bson
-from PyQt5 import QtGui, QtWidgets
+from PyQt5 import QtWidgets
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QAbstractItemView
 
+from management.analysis_commit import AnalysisCommit, save_config
+from management.analysis_index import AnalysesModel, AnalysisIndex
+from management.download_management import PRIORITY_ANALYSIS
+from management.output_watch import OutputWatcher
+
 
 class AnalysisManagement:
     """
@@ -25,8 +29,20 @@ class AnalysisManagement:
         self.main_window = main_window
         self.ui = main_window.ui
 
+        # Set helper variables
+        self.analysis_base_dir = self.main_window.CacheDir / "Analyses"
+        self.analysis_base_dir.mkdir(exist_ok=True)
+        self.index = AnalysisIndex(
+            self.main_window.CacheDir / ".analyses.sqlite", self.analysis_base_dir
+        )
+        # Commits in progress, keyed by analysis path
+        self.commits = {}
+        # Watchers of the outputs of edited analyses, keyed by analysis path
+        self.watchers = {}
+
         # Analyses List:
-        self.ui.listAnalyses.setModel(QtGui.QStandardItemModel())
+        self.model = AnalysesModel(self.index)
+        self.ui.listAnalyses.setModel(self.model)
         self.ui.listAnalyses.clicked.connect(self.analysis_clicked)
         self.ui.listAnalyses.setEditTriggers(QAbstractItemView.NoEditTriggers)
 
@@ -43,10 +59,22 @@ class AnalysisManagement:
         self.ui.btn_commit.clicked.connect(self.commit_analysis_to_instance)
         self.ui.btn_commit.setEnabled(False)
 
-        # Set helper variables
-        self.analysis_base_dir = self.main_window.CacheDir / "Analyses"
-        self.analysis_base_dir.mkdir(exist_ok=True)
-        self.cache_files = self.main_window.tree_management.cache_files
+        menu = self.ui.menubar.addMenu("Analyses")
+        self.watch_action = menu.addAction("Upload Outputs While Editing")
+        self.watch_action.setCheckable(True)
+        self.watch_action.setChecked(main_window.settings["watch_analysis_outputs"])
+        self.watch_action.toggled.connect(self._watch_toggled)
+        menu.addSeparator()
+        for column, title in [
+            ("app_name", "Filter by App"),
+            ("container_id", "Filter by Container"),
+            ("committed", "Filter by Commit State"),
+        ]:
+            filter_menu = menu.addMenu(title)
+            filter_menu.aboutToShow.connect(
+                partial(self._fill_filter_menu, filter_menu, column)
+            )
+
         self.populate_analyses_list()
 
     def analysis_clicked(self):
@@ -73,7 +101,6 @@ class AnalysisManagement:
             ].index(True)
         ]
 
-        model = self.ui.listAnalyses.model()
         item = self.ui.listApps.currentItem()
         app_text = item.text()
         analysis_text = app_text + ": " + str(datetime.now())
@@ -89,18 +116,17 @@ class AnalysisManagement:
             "app_name": app_text,
             "os": self.main_window.app_management.platform,
             "method": method,
-            "input_files": self.cache_files,
+            "input_files": dict(self.main_window.tree_management.cache_files),
+            "input_refs": dict(self.main_window.tree_management.input_refs),
             "project_file": None,
             "committed": None,
         }
 
         with open(analysis_dir / "config.json", "w") as fp:
             json.dump(analysis_config, fp, indent=4)
+        self.index.put(analysis_config)
 
-        item = QtGui.QStandardItem(analysis_text)
-        item.setToolTip(analysis_text)
-        item.setData(analysis_config)
-        model.appendRow(item)
+        item = self.model.add(analysis_config)
         self.ui.listAnalyses.setCurrentIndex(item.index())
 
     def edit_analysis(self):
@@ -111,14 +137,66 @@ class AnalysisManagement:
         TODO: Use the tree to add to analysis. Drag and drop?
         """
         item = self.get_current_list_item()
-        data = self.set_controls_to_list(item)
-        self.main_window.tree_management.cache_selected_for_open()
-        for k, v in self.cache_files.items():
+        self.set_controls_to_list(item)
+        self.main_window.tree_management.cache_selected_for_open(
+            partial(self._edit_cached, item), PRIORITY_ANALYSIS
+        )
+
+    def _edit_cached(self, item, cache_files, input_refs):
+        """
+        Add the cached files to the analysis and launch it in its app and method.
+
+        Args:
+            item (QtGui.QStandardItem): Analysis item being edited.
+            cache_files (dict): Cache paths of the selected files, keyed by file id.
+            input_refs (dict): Flywheel references of the selected files, keyed by
+                file id.
+        """
+        data = item.data()
+        for k, v in cache_files.items():
             data["input_files"][k] = v
+        data.setdefault("input_refs", {}).update(input_refs)
         item.setData(data)
-        with open(data["path"] + "/config.json", "w") as fp:
-            json.dump(data, fp, indent=4)
-        self.main_window.app_management.launch_app(data)
+        save_config(data)
+        self.index.put(data)
+        if self.watch_action.isChecked() and data["path"] not in self.watchers:
+            self.watchers[data["path"]] = OutputWatcher(
+                data["output"], partial(self._outputs_settled, data["path"])
+            )
+        self.main_window.app_management.launch_app(
+            data, data["app_name"], data["method"]
+        )
+
+    def _watch_toggled(self, checked):
+        """
+        Stop uploading outputs of edited analyses as they are written.
+
+        Args:
+            checked (bool): True if outputs are uploaded while editing.
+        """
+        if not checked:
+            for watcher in self.watchers.values():
+                watcher.stop()
+            self.watchers.clear()
+
+    def _outputs_settled(self, path):
+        """
+        Sync the outputs of an edited analysis once the app stopped writing them.
+
+        At most one sync per analysis is queued behind the one in progress.
+
+        Args:
+            path (str): Directory of the analysis being edited.
+        """
+        data = self.index.get(path)
+        if data is None:
+            # The analysis has been deleted.
+            return
+        commit = self.commits.get(path)
+        if commit is not None:
+            commit.resync = True
+        else:
+            self._start_commit(data, quiet=True)
 
     def delete_analysis(self):
         """
@@ -127,69 +205,145 @@ class AnalysisManagement:
         # TODO: A popup dialogue asking if the user is certain.
         item = self.get_current_list_item()
         data = item.data()
-        self.ui.listAnalyses.model().removeRow(item.row())
+        watcher = self.watchers.pop(data["path"], None)
+        if watcher is not None:
+            watcher.stop()
+        self.index.delete(data["path"])
+        self.model.remove(item)
         shutil.rmtree(data["path"], ignore_errors=True)
-        if self.ui.listAnalyses.count() == 0:
+        if self.model.rowCount() == 0:
             self.ui.btn_edit_analysis.setEnabled(False)
             self.ui.btn_del_analysis.setEnabled(False)
 
     def commit_analysis_to_instance(self):
         """
         Commit to Flywheel instance by uploading files to instance analysis.
-        
-        Further commits for this analysis are disabled.
+
+        The commit runs in the background, uploading outputs in parallel. A commit
+        that failed part way resumes where it stopped. Once committed, further
+        commits sync the outputs, uploading only those that are new or changed.
         """
         item = self.get_current_list_item()
         data = item.data()
-        if not data["committed"]:
-            analysis_parent = self.main_window.fw_client.get(data["container_id"])
-            output_dir = data["output"]
-            input_files = []
-            for k, v in data["input_files"].items():
-                # resolve file reference
-                input_path = Path(v)
-                container = self.main_window.fw_client.get(
-                    str(input_path.parents[1]).split("/")[-1]
-                )
-                filename = input_path.name
-                file_ref = container.get_file(filename).ref()
-                # append to input_files object
-                input_files.append(file_ref)
-
-            anal = analysis_parent.add_analysis(
-                label=data["analysis_name"], inputs=input_files
+        if data["path"] in self.commits:
+            return
+        self._start_commit(data)
+
+    def _start_commit(self, data, quiet=False):
+        """
+        Commit (or sync) an analysis in the background.
+
+        Args:
+            data (dict): Config of the analysis.
+            quiet (bool, optional): Only report failures in the status bar, for
+                syncs started while editing. Defaults to False.
+        """
+        if self._is_current(data["path"]):
+            self.ui.btn_commit.setEnabled(False)
+        commit = AnalysisCommit(
+            self.main_window.fw_client,
+            data,
+            self.ui.statusbar.showMessage,
+            lambda config, failed: self._committed(config, failed, quiet),
+        )
+        self.commits[data["path"]] = commit
+        commit.start()
+
+    def _committed(self, config, failed, quiet=False):
+        """
+        Update the analysis once its commit is over.
+
+        Args:
+            config (dict): Updated config of the analysis.
+            failed (dict): Errors of the outputs that failed to upload.
+            quiet (bool, optional): Only report failures in the status bar.
+                Defaults to False.
+        """
+        commit = self.commits.pop(config["path"])
+        if self.index.get(config["path"]) is None:
+            # The analysis has been deleted.
+            return
+        self.index.put(config)
+        item = self.model.find(config["path"])
+        if item is not None:
+            item.setData(config)
+        if commit.resync:
+            self._start_commit(config, quiet=True)
+        elif failed and quiet:
+            self.ui.statusbar.showMessage(
+                f"{len(failed)} outputs of {config['analysis_name']} could not be "
+                "uploaded."
             )
+        elif failed:
+            self.ui.statusbar.showMessage("Commit incomplete.")
+            QtWidgets.QMessageBox.warning(
+                self.main_window,
+                "Commit Failed",
+                f"{len(failed)} files of {config['analysis_name']} could not be "
+                "committed. Commit again to retry them.",
+            )
+        else:
+            self.ui.statusbar.showMessage(f"Synced {config['analysis_name']}.")
+        if self._is_current(config["path"]):
+            self.set_controls_to_list(item)
 
-            outputs = []
-            for path in glob(output_dir + "/*"):
-                path = Path(path)
-                if path.is_file():
-                    outputs.append(str(path))
+    def populate_analyses_list(self):
+        """
+        Populate analyses list from the index of local analyses.
 
-            anal.upload_file(outputs)
+        Only the first page of analyses is listed; more are loaded from the index as
+        the list is scrolled.
+        """
+        self.model.set_filters(self.model.filters)
 
-            data["committed"] = str(datetime.now())
+    def _fill_filter_menu(self, menu, column):
+        """
+        List the values an analyses filter can take, checking the current one.
 
-            item.setData(data)
+        Args:
+            menu (QtWidgets.QMenu): Menu of the filter.
+            column (str): Filtered column of the index.
+        """
+        menu.clear()
+        if column == "committed":
+            options = [("Committed", 1), ("Not Committed", 0)]
+        else:
+            options = [(str(value), value) for value in self.index.values(column)]
+        group = QtWidgets.QActionGroup(menu)
+        for text, value in [("All", None)] + options:
+            action = menu.addAction(text)
+            action.setCheckable(True)
+            action.setChecked(self.model.filters.get(column) == value)
+            action.triggered.connect(partial(self._set_filter, column, value))
+            group.addAction(action)
+
+    def _set_filter(self, column, value):
+        """
+        List only the analyses with a value of a column.
 
-            with open(data["path"] + "/config.json", "w") as fp:
-                json.dump(data, fp, indent=4)
-            self.ui.btn_commit.setEnabled(False)
+        Args:
+            column (str): Filtered column of the index.
+            value (object): Value to match, or None to list all analyses.
+        """
+        filters = dict(self.model.filters)
+        filters[column] = value
+        self.model.set_filters(filters)
+        self.ui.btn_edit_analysis.setEnabled(False)
+        self.ui.btn_del_analysis.setEnabled(False)
+        self.ui.btn_commit.setEnabled(False)
 
-    def populate_analyses_list(self):
+    def _is_current(self, path):
         """
-        Populate analyses list with local analyses currently cached on disk.
+        Check if an analysis is the current item of the analyses list.
+
+        Args:
+            path (str): Directory of the analysis.
+
+        Returns:
+            bool: True if the analysis is current.
         """
-        model = self.ui.listAnalyses.model()
-        analyses = glob(str(self.analysis_base_dir / "*"))
-        for analysis_dir in [Path(an) for an in analyses]:
-            with open(str(analysis_dir / "config.json"), "r") as fp:
-                analysis_config = json.load(fp)
-                analysis_text = analysis_config["analysis_name"]
-                item = QtGui.QStandardItem(analysis_text)
-                item.setToolTip(analysis_text)
-                item.setData(analysis_config)
-                model.appendRow(item)
+        item = self.get_current_list_item()
+        return item is not None and item.data()["path"] == path
 
     def get_current_list_item(self):
         """
@@ -217,7 +371,11 @@ class AnalysisManagement:
 
         self.ui.btn_edit_analysis.setEnabled(True)
         self.ui.btn_del_analysis.setEnabled(True)
-        self.ui.btn_commit.setEnabled(data["committed"] is None)
+        self.ui.btn_commit.setEnabled(data["path"] not in self.commits)
+        if data["committed"] is None:
+            self.ui.btn_commit.setText("Commit to \nInstance")
+        else:
+            self.ui.btn_commit.setText("Sync to \nInstance")
 
         # set radio value
         methods = ["Native_OS", "Docker_X11", "Docker_novnc"]
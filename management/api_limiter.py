@@ -0,0 +1,331 @@
+import random
+import threading
+import time
+
+import requests
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QTimer
+from urllib3.exceptions import NewConnectionError
+
+# HTTP statuses of a throttled or failing instance, retried with backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryableStatus(Exception):
+    """
+    Raised for an HTTP response whose request should be retried (e.g. 429).
+    """
+
+    def __init__(self, response):
+        """
+        Initialize error from the response.
+
+        Args:
+            response (requests.Response): Response with a retryable status.
+        """
+        super(RetryableStatus, self).__init__(
+            f"HTTP {response.status_code} from {response.url}"
+        )
+        self.status = response.status_code
+        self.headers = response.headers
+
+
+def _status(error):
+    """
+    HTTP status of a failed request.
+
+    Args:
+        error (Exception): Exception raised by the request.
+
+    Returns:
+        int: Status of the response, or None if there was no response.
+    """
+    status = getattr(error, "status", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _causes(error):
+    """
+    Walk an exception and the exceptions it wraps (e.g. requests wrapping urllib3).
+
+    Args:
+        error (Exception): Exception raised by the request.
+
+    Yields:
+        BaseException: The exception, then each exception it wraps.
+    """
+    seen = set()
+    errors = [error]
+    while errors:
+        error = errors.pop()
+        if not isinstance(error, BaseException) or id(error) in seen:
+            continue
+        seen.add(id(error))
+        yield error
+        errors += [error.__cause__, error.__context__, getattr(error, "reason", None)]
+        errors += list(error.args)
+
+
+def is_retryable(error):
+    """
+    Check if a request failed because the instance is throttling or failing.
+
+    Args:
+        error (Exception): Exception raised by the request, by the SDK
+            (flywheel.ApiException) or by requests.
+
+    Returns:
+        bool: True if the request should be retried.
+    """
+    if isinstance(
+        error,
+        (
+            ConnectionError,
+            TimeoutError,
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+        ),
+    ):
+        return True
+    return _status(error) in RETRY_STATUSES
+
+
+def is_refused(error):
+    """
+    Check if a request was refused before the instance processed it.
+
+    Only then may a request modifying the instance be sent again: a request that
+    failed or timed out may have been applied already.
+
+    Args:
+        error (Exception): Exception raised by the request.
+
+    Returns:
+        bool: True if the instance throttled the request (429) or the connection
+            could not be established.
+    """
+    if _status(error) == 429:
+        return True
+    return any(
+        isinstance(cause, (ConnectionRefusedError, NewConnectionError))
+        for cause in _causes(error)
+    )
+
+
+class AdaptiveLimiter:
+    """
+    Limit of concurrent requests to the Flywheel instance, adapted by AIMD.
+
+    Every request answered within the latency target grows the limit by 1/limit,
+    which adds about one concurrent request per round of requests. A throttled,
+    failed or slow request halves the limit, unless it was sent before the last
+    decrease, so a burst of failures of the same round counts once. Failed requests
+    are retried after a jittered exponential backoff, or after the Retry-After of
+    the response. Requests modifying the instance are only retried if they were
+    refused.
+    """
+
+    # Attempts per request, and bounds in seconds of the delay before a retry
+    attempts = 5
+    base_delay = 0.5
+    max_delay = 30
+    # Weight of the latest request in the error rate
+    error_weight = 0.05
+
+    def __init__(self, initial=4, minimum=1, maximum=16, latency_target=5.0):
+        """
+        Initialize limiter with no request in progress.
+
+        Args:
+            initial (int, optional): Initial limit. Defaults to 4.
+            minimum (int, optional): Lowest limit. Defaults to 1.
+            maximum (int, optional): Highest limit. Defaults to 16.
+            latency_target (float, optional): Seconds beyond which a request is
+                considered slow. Defaults to 5.0.
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.in_use = 0
+        self.error_rate = 0.0
+        self.decreased_at = 0.0
+        self.condition = threading.Condition()
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Call fn within the limit, retrying it if the instance throttles or fails.
+
+        Blocks until a slot is free; intended to run on a worker thread.
+
+        Args:
+            fn (callable): Function sending a request that can safely be sent again
+                (e.g. a read).
+            *args: Positional arguments to fn.
+            **kwargs: Keyword arguments to fn.
+
+        Returns:
+            object: Result of fn.
+        """
+        return self._send(fn, args, kwargs, is_retryable, True)
+
+    def write(self, fn, *args, **kwargs):
+        """
+        Call fn, a request modifying the instance, within the limit.
+
+        The request is only sent again if it was refused, so a request applied by
+        the instance is never applied twice (e.g. a duplicate analysis).
+
+        Args:
+            fn (callable): Function sending the request.
+            *args: Positional arguments to fn.
+            **kwargs: Keyword arguments to fn.
+
+        Returns:
+            object: Result of fn.
+        """
+        return self._send(fn, args, kwargs, is_refused, True)
+
+    def upload(self, fn, *args, **kwargs):
+        """
+        Call fn, a request transferring a file to the instance (e.g. an upload).
+
+        The request waits for a slot to start, but the transfer holds none and its
+        duration is not taken as latency. It is retried as a write.
+
+        Args:
+            fn (callable): Function sending the request.
+            *args: Positional arguments to fn.
+            **kwargs: Keyword arguments to fn.
+
+        Returns:
+            object: Result of fn.
+        """
+        return self._send(fn, args, kwargs, is_refused, False)
+
+    def _send(self, fn, args, kwargs, retry, hold):
+        """
+        Send a request within the limit, retrying it after a delay.
+
+        Args:
+            fn (callable): Function sending the request.
+            args (tuple): Positional arguments to fn.
+            kwargs (dict): Keyword arguments to fn.
+            retry (callable): Check if the request may be sent again after an error.
+            hold (bool): True if the request holds its slot until it completes, and
+                its latency adapts the limit.
+
+        Returns:
+            object: Result of fn.
+        """
+        for attempt in range(self.attempts):
+            self._acquire()
+            start = time.monotonic()
+            if not hold:
+                self._release()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                failed = is_retryable(e)
+                if hold:
+                    self._release()
+                if hold or failed:
+                    self._adapt(start, failed)
+                if not retry(e) or attempt + 1 == self.attempts:
+                    raise
+                time.sleep(self._delay(e, attempt))
+            else:
+                if hold:
+                    self._release()
+                    self._adapt(start, False)
+                return result
+
+    def _acquire(self):
+        """
+        Wait for a request slot within the limit.
+        """
+        with self.condition:
+            while self.in_use >= int(self.limit):
+                self.condition.wait()
+            self.in_use += 1
+
+    def _release(self):
+        """
+        Free a request slot.
+        """
+        with self.condition:
+            self.in_use -= 1
+            self.condition.notify_all()
+
+    def _adapt(self, start, failed):
+        """
+        Adapt the limit to the outcome of a request.
+
+        Args:
+            start (float): Monotonic time the request was sent.
+            failed (bool): True if the instance throttled or failed the request.
+        """
+        now = time.monotonic()
+        with self.condition:
+            self.error_rate += self.error_weight * (failed - self.error_rate)
+            if failed or now - start > self.latency_target:
+                if start > self.decreased_at:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.decreased_at = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def _delay(self, error, attempt):
+        """
+        Seconds to wait before retrying a failed request.
+
+        Args:
+            error (Exception): Exception raised by the request.
+            attempt (int): Number of the failed attempt, from 0.
+
+        Returns:
+            float: Retry-After of the response, or a jittered exponential delay.
+        """
+        headers = getattr(error, "headers", None) or {}
+        try:
+            return min(self.max_delay, float(headers.get("Retry-After")))
+        except (TypeError, ValueError):
+            return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class ApiStatus:
+    """
+    Status bar indicator of the concurrency limit and error rate of API requests.
+    """
+
+    # Milliseconds between refreshes of the indicator
+    refresh_interval = 1000
+
+    def __init__(self, main_window):
+        """
+        Initialize the indicator in the status bar of the main window.
+
+        Args:
+            main_window (AppLauncher): Main window with the limiter of API requests.
+        """
+        self.limiter = main_window.limiter
+        self.label = QtWidgets.QLabel()
+        self.label.setToolTip("Concurrent Flywheel requests allowed and error rate")
+        main_window.ui.statusbar.addPermanentWidget(self.label)
+        self.timer = QTimer()
+        self.timer.setInterval(self.refresh_interval)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+        self.refresh()
+
+    def refresh(self):
+        """
+        Render the current limit and error rate.
+        """
+        self.label.setText(
+            f"API: {int(self.limiter.limit)} parallel, "
+            f"{self.limiter.error_rate:.0%} errors"
+        )
@@ -0,0 +1,204 @@
+import os
+import shutil
+import time
+from functools import partial
+from pathlib import Path
+
+from PyQt5.QtCore import QObject, QThreadPool, pyqtSignal
+
+from management.error_reporting import report_error
+from management.workers import Worker
+
+METHODS = ["Native_OS", "Docker_X11", "Docker_novnc"]
+DOCKER_METHODS = ["Docker_X11", "Docker_novnc"]
+
+
+def probe_native(app_def):
+    """
+    Check that the executable of a native launcher exists.
+
+    Args:
+        app_def (dict): Launch configuration of the app on this platform.
+
+    Returns:
+        tuple: True if the app can be launched, and a description of why not.
+    """
+    command = app_def.get("command")
+    if not command:
+        return False, "Not configured"
+    if not shutil.which(command[0]):
+        return False, f"{command[0]} not found"
+    for arg in command[1:]:
+        if os.path.isabs(arg) and not Path(arg).exists():
+            return False, f"{arg} not found"
+    return True, "Available"
+
+
+def probe_x11(platform_name):
+    """
+    Check that an X11 server is available to display docker containers.
+
+    Args:
+        platform_name (str): Name of the platform (e.g. Linux).
+
+    Returns:
+        tuple: True if an X11 server is available, and a description of why not.
+    """
+    if platform_name == "Linux":
+        if os.environ.get("DISPLAY") and Path("/tmp/.X11-unix").exists():
+            return True, "Available"
+        return False, "No X11 display"
+    if platform_name == "Darwin":
+        if Path("/Applications/Utilities/XQuartz.app").exists():
+            return True, "Available"
+        return False, "XQuartz not installed"
+    return False, "No X11 server"
+
+
+class AppAvailability(QObject):
+    """
+    Availability of each app by launch method on this platform.
+
+    Every app and method is probed concurrently on worker threads and the results
+    are cached for a short time-to-live, so the app list never blocks on a probe.
+    """
+
+    # Name of an app whose availability has been probed
+    probed = pyqtSignal(str)
+
+    # Seconds a probe result is trusted for
+    ttl = 60
+
+    def __init__(self, apps_config, platform_name, docker_images):
+        """
+        Initialize availability of the configured apps.
+
+        Args:
+            apps_config (dict): Launch configurations by app and method.
+            platform_name (str): Name of the platform (e.g. Linux).
+            docker_images (DockerImages): Index of local docker images.
+        """
+        super(AppAvailability, self).__init__()
+        self.apps_config = apps_config
+        self.platform = platform_name
+        self.docker_images = docker_images
+        # (available, reason, probed at) keyed by (app, method)
+        self.results = {}
+        self.probing = set()
+        self.probes = {}
+
+    def probe(self, methods=METHODS, force=False):
+        """
+        Probe the availability of every app on worker threads.
+
+        Args:
+            methods (list, optional): Launch methods to probe. Defaults to all.
+            force (bool, optional): Probe even if the cached result is fresh.
+                Defaults to False.
+        """
+        for app in self.apps_config:
+            for method in methods:
+                self._start_probe(app, method, force)
+
+    def status(self, app, method):
+        """
+        Cached availability of an app by a launch method.
+
+        An expired result is returned as is while it is probed again.
+
+        Args:
+            app (str): Name of the app.
+            method (str): Launch method (e.g. Native_OS).
+
+        Returns:
+            tuple: True if available and the reason, or None if not yet probed.
+        """
+        result = self.results.get((app, method))
+        self._start_probe(app, method)
+        if result is None:
+            return None
+        return result[:2]
+
+    def is_available(self, app, method=None):
+        """
+        Check if an app is known to be available.
+
+        Args:
+            app (str): Name of the app.
+            method (str, optional): Launch method. Defaults to any method.
+
+        Returns:
+            bool: True if the app was found available by the method.
+        """
+        methods = [method] if method else METHODS
+        return any((self.status(app, m) or (False,))[0] for m in methods)
+
+    def _start_probe(self, app, method, force=False):
+        """
+        Probe an app and method unless a fresh result or probe exists.
+
+        Args:
+            app (str): Name of the app.
+            method (str): Launch method (e.g. Native_OS).
+            force (bool, optional): Probe even if the cached result is fresh.
+                Defaults to False.
+        """
+        key = (app, method)
+        result = self.results.get(key)
+        fresh = result is not None and time.monotonic() - result[2] < self.ttl
+        if key in self.probing or (fresh and not force):
+            return
+        self.probing.add(key)
+        probe = Worker(self._probe, app, method)
+        probe.signals.batch.connect(partial(self._probed, key))
+        probe.signals.error.connect(report_error)
+        probe.signals.finished.connect(partial(self._probe_finished, key))
+        self.probes[key] = probe
+        QThreadPool.globalInstance().start(probe)
+
+    def _probe(self, app, method):
+        """
+        Check if an app can be launched by a method.
+
+        Runs on a worker thread.
+
+        Args:
+            app (str): Name of the app.
+            method (str): Launch method (e.g. Native_OS).
+
+        Returns:
+            tuple: True if available and the reason.
+        """
+        app_def = self.apps_config[app].get(method, {}).get(self.platform)
+        if not app_def:
+            return False, "Not configured"
+        if method == "Native_OS":
+            return probe_native(app_def)
+        image = app_def.get("docker-image")
+        if not image or not self.docker_images.has_image(image):
+            return False, f"Image {image} not pulled"
+        if method == "Docker_X11":
+            return probe_x11(self.platform)
+        return True, "Available"
+
+    def _probed(self, key, result):
+        """
+        Cache the result of a probe.
+
+        Args:
+            key (tuple): App and method probed.
+            result (tuple): True if available and the reason.
+        """
+        available, reason = result
+        self.results[key] = (available, reason, time.monotonic())
+        self.probed.emit(key[0])
+
+    def _probe_finished(self, key):
+        """
+        Allow the next probe of an app and method.
+
+        Args:
+            key (tuple): App and method probed.
+        """
+        self.probing.discard(key)
+        self.probes.pop(key, None)
@@ -2,15 +2,23 @@ import copy
 import json
 import os
 import platform
-import subprocess
-import tempfile
-import webbrowser
 from glob import glob
 from pathlib import Path
 
 import docker
 import ifcfg
 import pystache
+from PyQt5 import QtGui, QtWidgets
+from PyQt5.QtCore import Qt
+
+from management.app_availability import DOCKER_METHODS, METHODS, AppAvailability
+from management.docker_images import DockerImages
+from management.novnc_pool import NovncPool, container_path
+from management.session_management import (
+    NativeSession,
+    NovncSession,
+    describe_files,
+)
 
 # TODO: Put this in "resources" and (eventually) a copy in ~/.config/flywheel/
 
@@ -44,6 +52,12 @@ apps_config = {
                     "/Applications/Slicer.app",
                 ],
                 "docker-image": "stevepieper/slicer-chronicle:latest",
+                "control_script": "resources/slicer_control.py",
+                "control_env": {
+                    "SLICER_ARGUMENTS": (
+                        "--python-script /home/researcher/.launcher/slicer_control.py"
+                    )
+                },
                 "docker_kwargs": {
                     "volumes": {},
                     "environment": {},
@@ -124,6 +138,14 @@ class AppManagement:
         self.main_window = main_window
         self.ui = main_window.ui
         self.platform = platform.system()
+        self.docker_images = DockerImages()
+        self.availability = AppAvailability(
+            apps_config, self.platform, self.docker_images
+        )
+        self.availability.probed.connect(self._app_probed)
+        self.docker_images.changed.connect(
+            lambda: self.availability.probe(DOCKER_METHODS, force=True)
+        )
 
         # Initialize ui components
         if self.platform == "Darwin":
@@ -145,95 +167,150 @@ class AppManagement:
 
         # self.ui.rdNative.setChecked(False)
 
+        settings = main_window.settings
+        self.novnc_pool = NovncPool(
+            main_window.CacheDir,
+            main_window.source_dir,
+            settings["novnc_pool_size"],
+            settings["novnc_idle_timeout"],
+        )
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.novnc_pool.shutdown)
+        self.sessions = main_window.session_management
+        self.novnc_pool.adopt(
+            lambda container, session_info: self.sessions.add(
+                NovncSession(self.novnc_pool, container, session_info)
+            )
+        )
+
         self.fill_app_list()
-        self.tmpdir = tempfile.TemporaryDirectory()
 
     def fill_app_list(self):
         """
-        Fill app list view with apps that are locally available.
+        Fill app list view with the configured apps and probe their availability.
 
         Locally available entails:
             * There is an executable on the system
             * There is a docker image that supports x11 or novnc interaction
+
+        Apps are dimmed until they are found available by any method.
         """
         # TODO: Change applist to QListView to accept data objects
-        # TODO: List app only if it has a valid launcher.... Or "Dim"
         for k, v in apps_config.items():
-            self.ui.listApps.addItem(k)  # item)
-            # item = self.ui.listApps.item(self.ui.listApps.count() - 1)
-            # item.setData(0, {"Hi": "No"})
-            # item.setData(1, {"Hi": "No"})
-            # item.setData(2, {"Hi": "No"})
-            # item.setHidden(True)
-            # for i, method in enumerate(["Native_OS", "Docker_X11", "Docker_novnc"]):
-            #     if v.get(method):
-            #         item.setData(i, v[method])
-            #     else:
-            #         item.setData(i, None)
-            #     item.setHidden(False)
+            self.ui.listApps.addItem(k)
+            self._app_probed(k)
+        self.availability.probe()
+
+    def _app_probed(self, app_text):
+        """
+        Dim and annotate an app in the list with its availability by each method.
+
+        Args:
+            app_text (str): Name of the app.
+        """
+        items = self.ui.listApps.findItems(app_text, Qt.MatchExactly)
+        if not items:
+            return
+        tooltip = []
+        for method in METHODS:
+            status = self.availability.status(app_text, method)
+            tooltip.append(f"{method}: {status[1] if status else 'Checking...'}")
+        items[0].setToolTip("\n".join(tooltip))
+        if self.availability.is_available(app_text, "Docker_novnc"):
+            self.novnc_pool.register(
+                apps_config[app_text]["Docker_novnc"][self.platform]
+            )
+        if self.availability.is_available(app_text):
+            items[0].setData(Qt.ForegroundRole, None)
+        else:
+            items[0].setForeground(QtGui.QBrush(Qt.gray))
+        if items[0] is self.ui.listApps.currentItem():
+            self.app_list_change()
 
     def app_list_change(self):
         """
         On selecting a new app from list, adjust radio buttons to available methods.
         """
         item = self.ui.listApps.currentItem()
+        if not item:
+            return
         app_text = item.text()
-        methods = ["Native_OS", "Docker_X11", "Docker_novnc"]
         radio_buttons = [self.ui.rdNative, self.ui.rdX11, self.ui.rdNovnc]
-        for i, radio_button in enumerate(radio_buttons):
-            data = apps_config[app_text].get(methods[i])
-            enabled = True
-
-            if not data:
-                enabled = False
+        for method, radio_button in zip(METHODS, radio_buttons):
+            enabled = self.availability.is_available(app_text, method)
+            if not enabled:
                 radio_button.setChecked(False)
-            else:
-                if i == 0:
-                    enabled = Path(data[self.platform]["command"][-1]).exists()
-                elif i == 1:
-                    enabled = False
-                elif i == 2:
-                    enabled = data[self.platform]["docker-image"] in [
-                        img.tags[0]
-                        for img in docker.from_env().images.list()
-                        if img.tags
-                    ]
             radio_button.setEnabled(enabled)
         enabled_buttons = [rdo for rdo in radio_buttons if rdo.isEnabled()]
-        if enabled_buttons:
+        if enabled_buttons and not any(rdo.isChecked() for rdo in enabled_buttons):
             enabled_buttons[0].setChecked(True)
 
+    def selected_app(self):
+        """
+        App and launch method selected in the controls.
+
+        Returns:
+            tuple: Name of the app and launch method (e.g. Native_OS), or None if
+                no app or method is selected.
+        """
+        item = self.ui.listApps.currentItem()
+        radio_buttons = [self.ui.rdNative, self.ui.rdX11, self.ui.rdNovnc]
+        methods = [m for m, rdo in zip(METHODS, radio_buttons) if rdo.isChecked()]
+        if not item or not methods:
+            return None
+        return item.text(), methods[0]
+
     def view_in_app(self):
         """
         Launch app with what files are selected in the tree view.
+
+        The app and method are those selected as the files are requested, even if
+        the selection changes while they are cached.
         """
-        self.main_window.tree_management.cache_selected_for_open()
-        app_data = {"input_files": self.main_window.tree_management.cache_files}
-        self.launch_app(app_data)
+        selected = self.selected_app()
+        if selected is None:
+            return
+        self.main_window.tree_management.cache_selected_for_open(
+            lambda cache_files, input_refs: self._view_cached(cache_files, *selected)
+        )
 
-    def launch_app(self, app_data):
+    def _view_cached(self, cache_files, app_text, method):
+        """
+        Launch app once the files selected in the tree view are cached.
+
+        Args:
+            cache_files (dict): Cache paths of the selected files, keyed by file id.
+            app_text (str): Name of the app.
+            method (str): Launch method (e.g. Native_OS).
+        """
+        self.launch_app({"input_files": cache_files}, app_text, method)
+
+    def launch_app(self, app_data, app_text, method):
         """
         Launch app with indicated data from tree or local analysis.
 
         Args:
             app_data (dict): A dictionary referencing selected files from tree or
                 local analysis.
+            app_text (str): Name of the app.
+            method (str): Launch method (e.g. Native_OS).
         """
-        item = self.ui.listApps.currentItem()
-        if item:
-            app_text = item.text()
-            if self.ui.rdNative.isChecked():
-                self.launch_native(apps_config[app_text]["Native_OS"], app_data)
-            elif self.ui.rdX11.isChecked():
-                self.launch_x11(apps_config[app_text]["Docker_X11"], app_data)
-            elif self.ui.rdNovnc.isChecked():
-                self.launch_novnc(apps_config[app_text]["Docker_novnc"], app_data)
-
-    def launch_native(self, app_def_native, app_data):
+        app_def = apps_config[app_text][method]
+        if method == "Native_OS":
+            self.launch_native(app_text, app_def, app_data)
+        elif method == "Docker_X11":
+            self.launch_x11(app_def, app_data)
+        elif method == "Docker_novnc":
+            self.launch_novnc(app_text, app_def, app_data)
+
+    def launch_native(self, app_text, app_def_native, app_data):
         """
         Launch an application on a native operating system (osx, linux, windows).
 
+        The app runs as a supervised session, so the launcher stays responsive and
+        several apps can be open at once.
+
         Args:
+            app_text (str): Name of the app.
             app_def_native (dict): A dictionary containing app-specific launch
                 configuration.
             app_data (dict): A dictionary referencing selected files from tree or
@@ -292,9 +369,7 @@ class AppManagement:
                     command.append(app_def_platform.get("additional_files_flag"))
                 command.append(v)
 
-        self.ui.btnLaunchApp.setEnabled(False)
-        results = subprocess.run(command)
-        self.ui.btnLaunchApp.setEnabled(True)
+        self.sessions.add(NativeSession(app_text, describe_files(app_data), command))
 
     def launch_x11(self, app_def_x11, app_data):
         """
@@ -346,18 +421,22 @@ class AppManagement:
             "stevepieper/slicer-chronicle",  # **docker_kwargs
         )
 
-    def launch_novnc(self, app_def_novnc, app_data):
+    def launch_novnc(self, app_text, app_def_novnc, app_data):
         """
         Launch dockerized application in a novnc web interface.
 
+        The files are opened in a warm container of the app if one is available.
+        Each launch is a new session, running side by side with earlier ones.
+
         Args:
+            app_text (str): Name of the app.
             app_def_novnc (dict): A dictionary containing app-specific launch
                 configuration.
             app_data (dict): A dictionary referencing selected files from tree or
                 local analysis.
         """
-        os_platform = platform.system()
-        app_def_platform = copy.deepcopy(app_def_novnc[os_platform])
+        app_def_platform = copy.deepcopy(app_def_novnc[self.platform])
+        cache_dir = self.main_window.CacheDir
         if app_data.get("output"):
             extensions = [
                 glob(app_data["output"] + "/*." + ext)
@@ -367,54 +446,28 @@ class AppManagement:
             extensions = [[]]
         if any(extensions):
             files = [fl[0] for fl in extensions if fl]
-            env = {
-                "SLICER_ARGUMENTS": (
-                    "--python-code \"slicer.util.loadScene('"
-                    + files[0].replace("/Users/joshuajacobs/", "/home/researcher/")
-                    + "')\""
-                )
-            }
+            request = {"scene": container_path(cache_dir, files[0]), "files": []}
         else:
-            files = [
-                v.replace("/Users/joshuajacobs/", "/home/researcher/")
-                for k, v in app_data["input_files"].items()
-            ]
-            env = {
-                "SLICER_ARGUMENTS": " ".join(files),
+            request = {
+                "scene": None,
+                "files": [
+                    container_path(cache_dir, v)
+                    for k, v in app_data["input_files"].items()
+                ],
             }
-        self.tmpdir.cleanup()
-        self.tmpdir = tempfile.TemporaryDirectory()
-        if app_data.get("output"):
-            output_dir = app_data["output"]
-            mode = "rw"
-        else:
-            output_dir = self.tmpdir.name
-            mode = "ro"
-        mounts = {
-            str(self.main_window.CacheDir): {
-                "bind": "/home/researcher/flywheelIO/",
-                "mode": "ro",
-            },
-            # output_dir: {"bind": "/home/researcher/Documents", "mode": mode},
-        }
-
-        docker_kwargs = copy.deepcopy(app_def_platform["docker_kwargs"])
-        docker_kwargs["volumes"] = mounts
-        docker_kwargs["environment"] = env
+        session_info = {"app_name": app_text, "description": describe_files(app_data)}
+        self.novnc_pool.launch(
+            app_def_platform, request, session_info, self._novnc_launched
+        )
 
-        client = docker.from_env()
-        # TODO: If the container is running, send the app_data rather than relaunching.
-        #     : give the user an option to shut it down.
-        try:
-            container = client.containers.get(docker_kwargs["name"])
-            container.kill()
-            client.containers.prune()
-        except Exception as e:
-            print(e)
+    def _novnc_launched(self, container, session_info):
+        """
+        List a launched novnc session and open it in the web browser.
 
-        container = client.containers.run(
-            app_def_platform["docker-image"], **docker_kwargs
-        )
-        webbrowser.open(
-            "http://localhost:8080/x11/vnc.html?autoconnect=true&path=x11/websockify"
-        )
+        Args:
+            container (docker.models.containers.Container): Container of the app.
+            session_info (dict): Description of the session, with its URL.
+        """
+        session = NovncSession(self.novnc_pool, container, session_info)
+        self.sessions.add(session)
+        session.open()
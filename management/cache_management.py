@@ -0,0 +1,658 @@
+import json
+import os
+import shutil
+import threading
+import time
+from glob import glob
+from pathlib import Path
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QThreadPool, QTimer, pyqtSignal
+
+from management.error_reporting import report_error
+from management.workers import Worker
+
+# Sidecar recording the version of a cached file, next to it in its file id directory
+VERSION_FILE = ".version.json"
+# Depth of the shallowest cached file under the cache root (group/container_id/
+# file_id/file_name), as for files of a project
+CACHE_DEPTH = 4
+
+
+def get_cache_path(file_parent, file_obj):
+    """
+    Construct cache path of file (e.g. cache_root/group/.../file_id/file_name).
+
+    Args:
+        file_parent (flywheel.Container): Container hosting the file.
+        file_obj (flywheel.FileEntry): File to construct the cache path of.
+
+    Returns:
+        pathlib.Path: Cache Path to file indicated.
+    """
+    file_path = Path(os.path.expanduser("~") + "/flywheelIO/")
+
+    for par in ["group", "project", "subject", "session", "acquisition"]:
+        if file_parent.parents[par]:
+            file_path /= file_parent.parents[par]
+    file_path /= file_parent.id
+    file_path /= file_obj.id
+    file_path /= file_obj.name
+    return file_path
+
+
+def is_cache_path(cache_dir, path):
+    """
+    Check if a path is laid out as a cached file (group/.../container_id/file_id/
+    file_name under the cache root).
+
+    Files shallower than a container (e.g. settings.json at the cache root), local
+    analyses, hidden launcher files and partial downloads are not cached files.
+
+    Args:
+        cache_dir (pathlib.Path): Root directory of the cache.
+        path (pathlib.Path): Path to check.
+
+    Returns:
+        bool: True if the path is a cached file.
+    """
+    try:
+        parts = Path(path).relative_to(cache_dir).parts
+    except ValueError:
+        return False
+    return (
+        len(parts) >= CACHE_DEPTH
+        and parts[0] != "Analyses"
+        and not any(part.startswith(".") for part in parts)
+        and not parts[-1].endswith(".part")
+    )
+
+
+def scan_cache(directory, cache_dir):
+    """
+    Scan a directory of the cache for cached files.
+
+    Cached files are stored as .../container_id/file_id/file_name. Local analyses,
+    hidden launcher files, partial downloads and files outside of this layout are
+    skipped.
+
+    Args:
+        directory (str): Directory to scan.
+        cache_dir (pathlib.Path): Root directory of the cache.
+
+    Returns:
+        dict: Paths of cached files keyed by file id.
+    """
+    cached = {}
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d != "Analyses"]
+        for name in files:
+            path = Path(root) / name
+            if is_cache_path(cache_dir, path):
+                cached[os.path.basename(root)] = path
+    return cached
+
+
+def read_version(path):
+    """
+    Read the recorded version of a cached file.
+
+    Files cached before versions were recorded are described by their size alone.
+
+    Args:
+        path (pathlib.Path): Path to the cached file.
+
+    Returns:
+        dict: Recorded hash, version, modified time and size of the file.
+    """
+    try:
+        with open(path.parent / VERSION_FILE, "r") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        pass
+    try:
+        return {"size": path.stat().st_size}
+    except OSError:
+        return None
+
+
+def write_version(path, version):
+    """
+    Record the version of a cached file.
+
+    Args:
+        path (pathlib.Path): Path to the cached file.
+        version (dict): Hash, version, modified time and size of the file.
+    """
+    with open(path.parent / VERSION_FILE, "w") as fp:
+        json.dump(version, fp)
+
+
+def is_current(version, file_obj):
+    """
+    Check if a cached version of a file is the version listed on the instance.
+
+    The most precise attribute known on both sides is compared: the hash, then the
+    version number, the modified time and finally the size.
+
+    Args:
+        version (dict): Recorded version of the cached file.
+        file_obj (flywheel.FileEntry): Listed file.
+
+    Returns:
+        bool: False if the file has been replaced since it was cached.
+    """
+    if not version:
+        return True
+    for attr in ["hash", "version", "modified", "size"]:
+        recorded = version.get(attr)
+        listed = getattr(file_obj, attr, None)
+        if recorded is not None and listed is not None:
+            return str(recorded) == str(listed)
+    return True
+
+
+def index_cache(directory):
+    """
+    Scan a directory of the cache for cached files and their versions.
+
+    Args:
+        directory (str): Directory to scan.
+
+    Returns:
+        tuple: Paths and recorded versions of cached files keyed by file id.
+    """
+    files = scan_cache(directory, Path(directory))
+    versions = {file_id: read_version(path) for file_id, path in files.items()}
+    return files, versions
+
+
+class CacheIndex(QObject):
+    """
+    In-memory index of the files in the local cache and their versions, keyed by
+    file id.
+
+    The index is built once by scanning the cache on a worker thread, kept current
+    by the download engine and watches the container directories of the cache
+    (inotify on Linux) for changes made outside of the launcher. Until the scan
+    completes, lookups fall back to checking the filesystem.
+    """
+
+    # file id, True if the file is now cached
+    changed = pyqtSignal(str, bool)
+    # The initial scan of the cache is complete
+    scanned = pyqtSignal()
+
+    def __init__(self, cache_dir):
+        """
+        Initialize index and start scanning the cache.
+
+        Args:
+            cache_dir (pathlib.Path): Root directory of the cache.
+        """
+        super(CacheIndex, self).__init__()
+        self.cache_dir = cache_dir
+        self.files = {}
+        self.versions = {}
+        self.ready = False
+        self.lock = threading.Lock()
+        self.watcher = QFileSystemWatcher()
+        self.watched = set()
+        self.watch_failed = False
+        self.watcher.directoryChanged.connect(self._directory_changed)
+
+        self.scanner = Worker(index_cache, str(cache_dir))
+        self.scanner.signals.batch.connect(self._scanned)
+        self.scanner.signals.error.connect(report_error)
+        QThreadPool.globalInstance().start(self.scanner)
+
+    def is_cached(self, file_id, path=None):
+        """
+        Check if a file is cached.
+
+        Args:
+            file_id (str): Id of the file.
+            path (pathlib.Path, optional): Cache path of the file, checked on disk if
+                the index is not yet built. Defaults to None.
+
+        Returns:
+            bool: True if the file is cached.
+        """
+        with self.lock:
+            if self.ready or path is None:
+                return file_id in self.files
+        return path.exists()
+
+    def is_current(self, file_id, file_obj, path=None):
+        """
+        Check if the cached copy of a file is the version listed on the instance.
+
+        Args:
+            file_id (str): Id of the file.
+            file_obj (flywheel.FileEntry): Listed file (or a DownloadRequest).
+            path (pathlib.Path, optional): Cache path of the file, whose version is
+                read from disk if the index is not yet built. Defaults to None.
+
+        Returns:
+            bool: False if the cached copy is stale.
+        """
+        with self.lock:
+            if self.ready or path is None:
+                return is_current(self.versions.get(file_id), file_obj)
+        return is_current(read_version(path), file_obj)
+
+    def path(self, file_id):
+        """
+        Path to a cached file.
+
+        Args:
+            file_id (str): Id of the file.
+
+        Returns:
+            pathlib.Path: Path to the cached file, or None if not cached.
+        """
+        with self.lock:
+            return self.files.get(file_id)
+
+    def add(self, file_id, path, version=None):
+        """
+        Record a file that has been added to the cache.
+
+        Args:
+            file_id (str): Id of the file.
+            path (pathlib.Path): Path to the cached file.
+            version (dict, optional): Recorded version of the file. Read from its
+                sidecar if not given. Defaults to None.
+        """
+        if version is None:
+            version = read_version(Path(path))
+        with self.lock:
+            self.files[file_id] = Path(path)
+            self.versions[file_id] = version
+        self._watch([str(Path(path).parents[1])])
+        self.changed.emit(file_id, True)
+
+    def discard(self, file_id):
+        """
+        Record a file that has been removed from the cache.
+
+        Args:
+            file_id (str): Id of the file.
+        """
+        with self.lock:
+            path = self.files.pop(file_id, None)
+            self.versions.pop(file_id, None)
+        if path is not None:
+            self.changed.emit(file_id, False)
+
+    def _watch(self, directories):
+        """
+        Watch container directories of the cache for external changes.
+
+        Only container directories are watched, not the directory of each file, to
+        stay within the watch limit of the system (fs.inotify.max_user_watches on
+        Linux). Directories that cannot be watched are reported once.
+
+        Args:
+            directories (list): Paths of container directories.
+        """
+        directories = set(directories) - self.watched
+        if not directories:
+            return
+        failed = self.watcher.addPaths(sorted(directories))
+        self.watched.update(directories.difference(failed))
+        if failed and not self.watch_failed:
+            self.watch_failed = True
+            report_error(
+                f"{len(failed)} cache directories cannot be watched for external "
+                "changes (watch limit reached?)"
+            )
+
+    def _scanned(self, result):
+        """
+        Merge the results of the initial scan into the index.
+
+        Args:
+            result (tuple): Paths and versions of cached files keyed by file id.
+        """
+        files, versions = result
+        with self.lock:
+            for file_id, path in files.items():
+                if file_id not in self.files:
+                    self.files[file_id] = path
+                    self.versions[file_id] = versions[file_id]
+            self.ready = True
+        self._watch([str(path.parents[1]) for path in files.values()])
+        self.scanned.emit()
+
+    def _directory_changed(self, directory):
+        """
+        Rescan a watched directory that was changed outside of the launcher.
+
+        Args:
+            directory (str): Changed directory.
+        """
+        if os.path.isdir(directory):
+            found = scan_cache(directory, self.cache_dir)
+        else:
+            # The watcher drops removed directories; watch them again if recreated
+            self.watched.discard(directory)
+            found = {}
+        with self.lock:
+            indexed = {
+                file_id
+                for file_id, path in self.files.items()
+                if str(path).startswith(directory + os.sep)
+            }
+        for file_id in indexed - set(found):
+            self.discard(file_id)
+        for file_id, path in found.items():
+            if self.path(file_id) != path:
+                self.add(file_id, path)
+
+
+class CacheManagement:
+    """
+    Class that keeps the local cache within its quota.
+
+    Last access and access counts of cached files are recorded so the least recently
+    (LRU) or least frequently (LFU) used files can be evicted once the cache exceeds
+    its quota. Files referenced as inputs of local analyses, or selected for opening,
+    are pinned and never evicted.
+    """
+
+    # Fraction of the quota the cache is reduced to when evicting
+    low_watermark = 0.9
+
+    def __init__(self, main_window):
+        """
+        Initialize cache management and its menu.
+
+        Args:
+            main_window (AppLauncher): Main window with the cache index and settings.
+        """
+        self.main_window = main_window
+        self.ui = main_window.ui
+        self.cache_dir = main_window.CacheDir
+        self.cache_index = main_window.cache_index
+        self.quota = int(main_window.settings["cache_quota_gb"] * 2**30)
+        self.policy = main_window.settings["cache_eviction"]
+        self.evicting = False
+
+        self.access_file = self.cache_dir / ".cache_access.json"
+        self.access = {}
+        if self.access_file.exists():
+            with open(self.access_file, "r") as fp:
+                self.access = json.load(fp)
+
+        # Debounce eviction and saving of access records after downloads
+        self.eviction_timer = QTimer()
+        self.eviction_timer.setSingleShot(True)
+        self.eviction_timer.setInterval(2000)
+        self.eviction_timer.timeout.connect(self.evict)
+        self.cache_index.changed.connect(self._cache_changed)
+        self.cache_index.scanned.connect(self.evict)
+
+        menu = self.ui.menubar.addMenu("Cache")
+        action = menu.addAction("Cache Report...")
+        action.triggered.connect(self.report)
+        action = menu.addAction("Evict Now")
+        action.triggered.connect(self.evict)
+        action = menu.addAction("Deduplicate Cache")
+        action.triggered.connect(self.deduplicate)
+
+    def touch(self, file_ids):
+        """
+        Record an access of cached files.
+
+        Args:
+            file_ids (list): Ids of the accessed files.
+        """
+        now = time.time()
+        for file_id in file_ids:
+            _, count = self.access.get(file_id, [now, 0])
+            self.access[file_id] = [now, count + 1]
+        self._save_access()
+
+    def _cache_changed(self, file_id, cached):
+        """
+        Record the download of a file and schedule an eviction pass.
+
+        Args:
+            file_id (str): Id of the file.
+            cached (bool): True if the file is now cached.
+        """
+        if cached:
+            self.access.setdefault(file_id, [time.time(), 0])
+            self.eviction_timer.start()
+        else:
+            self.access.pop(file_id, None)
+
+    def _save_access(self):
+        """
+        Save access records of cached files.
+        """
+        with open(self.access_file, "w") as fp:
+            json.dump(self.access, fp)
+
+    def pinned_paths(self):
+        """
+        List the cached files that must not be evicted.
+
+        Returns:
+            set: Paths of input files of local analyses and files selected for
+                opening.
+        """
+        pinned = set(self.main_window.tree_management.cache_files.values())
+        for config_file in glob(str(self.cache_dir / "Analyses" / "*" / "config.json")):
+            try:
+                with open(config_file, "r") as fp:
+                    pinned.update(json.load(fp)["input_files"].values())
+            except (OSError, ValueError, KeyError) as e:
+                report_error(e)
+        return pinned
+
+    def evict(self):
+        """
+        Evict files on a worker thread until the cache is below its quota.
+        """
+        if self.evicting or not self.cache_index.ready:
+            return
+        self.evicting = True
+        self._save_access()
+        with self.cache_index.lock:
+            files = dict(self.cache_index.files)
+        evictor = Worker(
+            self._evict_files, files, dict(self.access), self.pinned_paths()
+        )
+        evictor.signals.batch.connect(self._evicted)
+        evictor.signals.error.connect(report_error)
+        evictor.signals.finished.connect(self._eviction_finished)
+        self.evictor = evictor
+        QThreadPool.globalInstance().start(evictor)
+
+    def _evict_files(self, files, access, pinned):
+        """
+        Remove least recently (or frequently) used files beyond the quota.
+
+        Runs on a worker thread.
+
+        Args:
+            files (dict): Paths of cached files keyed by file id.
+            access (dict): Last access time and access count keyed by file id.
+            pinned (set): Paths of files that must not be evicted.
+
+        Returns:
+            list: Ids of the evicted files.
+        """
+        # Cached files hardlinked to the same content only take up space once
+        inodes = {}
+        sizes = {}
+        links = {}
+        for file_id, path in files.items():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            inodes[file_id] = stat.st_ino
+            sizes[stat.st_ino] = stat.st_size
+            links[stat.st_ino] = links.get(stat.st_ino, 0) + 1
+        total = sum(sizes.values())
+        if total <= self.quota:
+            return []
+
+        if self.policy == "lfu":
+            key = lambda file_id: access.get(file_id, [0, 0])[::-1]
+        else:
+            key = lambda file_id: access.get(file_id, [0, 0])
+        candidates = sorted(
+            (
+                file_id
+                for file_id in inodes
+                if str(files[file_id]) not in pinned
+                and self._is_file_directory(file_id, files[file_id])
+            ),
+            key=key,
+        )
+        evicted = []
+        target = self.quota * self.low_watermark
+        for file_id in candidates:
+            if total <= target:
+                break
+            shutil.rmtree(files[file_id].parent, ignore_errors=True)
+            evicted.append(file_id)
+            inode = inodes[file_id]
+            links[inode] -= 1
+            if not links[inode]:
+                total -= sizes[inode]
+        # Drop stored contents that no cached file links to anymore
+        self.main_window.content_store.collect_garbage()
+        return evicted
+
+    def _is_file_directory(self, file_id, path):
+        """
+        Check if the directory of a cached file can be removed with the file.
+
+        Only a file id directory strictly inside a container directory of the cache
+        is removed, never a container directory or the cache root.
+
+        Args:
+            file_id (str): Id of the file.
+            path (pathlib.Path): Path to the cached file.
+
+        Returns:
+            bool: True if the directory of the file only hosts this cached file.
+        """
+        return path.parent.name == file_id and is_cache_path(self.cache_dir, path)
+
+    def _evicted(self, file_ids):
+        """
+        Remove evicted files from the cache index, updating the tree.
+
+        Args:
+            file_ids (list): Ids of the evicted files.
+        """
+        for file_id in file_ids:
+            self.cache_index.discard(file_id)
+        if file_ids:
+            self._save_access()
+            self.ui.statusbar.showMessage(f"Evicted {len(file_ids)} cached files.")
+
+    def _eviction_finished(self):
+        """
+        Allow the next eviction pass.
+        """
+        self.evicting = False
+
+    def deduplicate(self):
+        """
+        Replace duplicate cached files with links to a single copy in the background.
+        """
+        with self.cache_index.lock:
+            files = list(self.cache_index.files.values())
+        self.deduplicator = Worker(self.main_window.content_store.deduplicate, files)
+        self.deduplicator.signals.batch.connect(
+            lambda freed: self.ui.statusbar.showMessage(
+                f"Deduplication freed {freed / 1e6:.1f} MB."
+            )
+        )
+        self.deduplicator.signals.error.connect(report_error)
+        QThreadPool.globalInstance().start(self.deduplicator)
+
+    def report(self):
+        """
+        Show the size of the cache by group and project.
+
+        Sizes are gathered on a worker thread.
+        """
+        with self.cache_index.lock:
+            files = list(self.cache_index.files.values())
+        self.reporter = Worker(self._cache_sizes, files)
+        self.reporter.signals.batch.connect(self._show_report)
+        self.reporter.signals.error.connect(report_error)
+        QThreadPool.globalInstance().start(self.reporter)
+
+    def _cache_sizes(self, files):
+        """
+        Total the size of cached files by group and project.
+
+        Runs on a worker thread.
+
+        Args:
+            files (list): Paths of cached files.
+
+        Returns:
+            dict: Sizes in bytes keyed by group id and project id.
+        """
+        sizes = {}
+        for path in files:
+            if not is_cache_path(self.cache_dir, path):
+                continue
+            group, project = path.relative_to(self.cache_dir).parts[:2]
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            sizes.setdefault(group, {}).setdefault(project, 0)
+            sizes[group][project] += size
+        return sizes
+
+    def _show_report(self, sizes):
+        """
+        Show the size of the cache by group and project.
+
+        Args:
+            sizes (dict): Sizes in bytes keyed by group id and project id.
+        """
+        dialog = QtWidgets.QDialog(self.main_window)
+        dialog.setWindowTitle("Cache Report")
+        dialog.resize(400, 400)
+        tree = QtWidgets.QTreeWidget()
+        tree.setHeaderLabels(["Container", "Size (MB)"])
+        store = self.main_window.metadata_store
+        total = 0
+        for group, projects in sorted(sizes.items()):
+            group_size = sum(projects.values())
+            total += group_size
+            group_item = QtWidgets.QTreeWidgetItem(
+                tree, [group, f"{group_size / 1e6:.1f}"]
+            )
+            for project, size in sorted(projects.items()):
+                label = store.label(project) or project
+                QtWidgets.QTreeWidgetItem(group_item, [label, f"{size / 1e6:.1f}"])
+        tree.expandAll()
+        layout = QtWidgets.QVBoxLayout(dialog)
+        layout.addWidget(tree)
+        layout.addWidget(
+            QtWidgets.QLabel(
+                f"Total: {total / 1e9:.2f} GB of {self.quota / 1e9:.2f} GB quota"
+            )
+        )
+        stats = self.main_window.fw_client.stats()
+        layout.addWidget(
+            QtWidgets.QLabel(
+                f"Flywheel reads: {stats['hits']} cached, "
+                f"{stats['coalesced']} shared, {stats['misses']} requested"
+            )
+        )
+        dialog.exec_()
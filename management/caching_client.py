@@ -0,0 +1,235 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+
+class _Call:
+    """
+    Read in flight, awaited by identical reads issued meanwhile.
+    """
+
+    __slots__ = ("done", "result", "error", "generation")
+
+    def __init__(self, generation):
+        """
+        Initialize a pending read.
+
+        Args:
+            generation (tuple): Invalidation generations of the containers involved
+                in the read as it started.
+        """
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.generation = generation
+
+
+class CachingClient:
+    """
+    Facade over a flywheel client that coalesces and memoizes reads.
+
+    Calls of read methods (named get*) are keyed by method and arguments. Identical
+    calls in flight at the same time share a single request (single-flight), and
+    results are kept for a time-to-live in a bounded LRU cache. Calls of write
+    methods (e.g. add_*, upload_*) invalidate the results of reads involving the
+    container written to. Writes through containers returned by the SDK (e.g.
+    analysis.upload_file) bypass the facade, and are followed by invalidate. Any
+    other method (e.g. groups) is neither memoized nor invalidating. Requests of
+    every method are sent through the adaptive limiter of API requests, which only
+    retries writes if they were refused. Other attributes are passed through to the
+    client.
+
+    Results are shared between callers, who must not modify them.
+    """
+
+    # Prefixes of the client methods that modify the instance
+    write_prefixes = (
+        "add_",
+        "upload_",
+        "delete_",
+        "modify_",
+        "update_",
+        "replace_",
+        "remove_",
+        "set_",
+    )
+
+    def __init__(self, fw_client, limiter, ttl=60, max_entries=1000):
+        """
+        Initialize an empty cache over a client.
+
+        Args:
+            fw_client (flywheel.Client): Logged in flywheel client.
+            limiter (AdaptiveLimiter): Limiter of concurrent API requests.
+            ttl (float, optional): Seconds a result is reused for. Defaults to 60.
+            max_entries (int, optional): Maximum number of results kept. Defaults
+                to 1000.
+        """
+        self._client = fw_client
+        self.limiter = limiter
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # Expiry time and result of each read, least recently used first
+        self.cache = OrderedDict()
+        self.in_flight = {}
+        # Incremented on each invalidation of every result, and of the results
+        # involving a container (keyed by its id), so reads that started before are
+        # not cached
+        self.generation = 0
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __getattr__(self, name):
+        """
+        Attribute of the client, with reads memoized, writes invalidating and every
+        method limited.
+
+        Args:
+            name (str): Name of the attribute.
+
+        Returns:
+            object: Attribute of the client, or a wrapper of its method.
+        """
+        if name == "_client":
+            # Not yet set while initializing
+            raise AttributeError(name)
+        attr = getattr(self._client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        if name.startswith("get"):
+            return partial(self._read, name, attr)
+        if name.startswith(self.write_prefixes):
+            return partial(self._write, attr)
+        return partial(self.limiter.call, attr)
+
+    def _read(self, name, method, *args, **kwargs):
+        """
+        Call a read method, reusing a cached or in-flight identical call.
+
+        Args:
+            name (str): Name of the method.
+            method (callable): Method of the client.
+            *args: Positional arguments of the call.
+            **kwargs: Keyword arguments of the call.
+
+        Returns:
+            object: Result of the call.
+        """
+        key = (name, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return self.limiter.call(method, *args, **kwargs)
+
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            call = self.in_flight.get(key)
+            if call is None:
+                call = self.in_flight[key] = _Call(self._generation(key))
+                self.misses += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self.limiter.call(method, *args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                if self.in_flight.get(key) is call:
+                    del self.in_flight[key]
+                if call.error is None and call.generation == self._generation(key):
+                    self.cache[key] = (time.monotonic() + self.ttl, call.result)
+                    self.cache.move_to_end(key)
+                    while len(self.cache) > self.max_entries:
+                        self.cache.popitem(last=False)
+            call.done.set()
+        return call.result
+
+    def _generation(self, key):
+        """
+        Invalidation generations of the containers involved in a read.
+
+        Called with the lock held.
+
+        Args:
+            key (tuple): Key of the read.
+
+        Returns:
+            tuple: Generation of every result, then of each container id argument.
+        """
+        return (self.generation,) + tuple(
+            self.generations.get(arg, 0) for arg in key[1] if isinstance(arg, str)
+        )
+
+    def _write(self, method, *args, **kwargs):
+        """
+        Call a write method and invalidate the container it writes to.
+
+        Args:
+            method (callable): Method of the client.
+            *args: Positional arguments of the call, starting with the id of the
+                container written to.
+            **kwargs: Keyword arguments of the call.
+
+        Returns:
+            object: Result of the call.
+        """
+        try:
+            return self.limiter.write(method, *args, **kwargs)
+        finally:
+            container_id = args[0] if args and isinstance(args[0], str) else None
+            self.invalidate(container_id)
+
+    def invalidate(self, container_id=None):
+        """
+        Drop cached results of reads involving a container.
+
+        Args:
+            container_id (str, optional): Id of the container written to. Defaults
+                to None, to drop every result.
+        """
+        with self.lock:
+            if container_id is None:
+                self.generation += 1
+                self.cache.clear()
+                self.in_flight.clear()
+                return
+            self.generations[container_id] = self.generations.get(container_id, 0) + 1
+            for table in [self.cache, self.in_flight]:
+                for key in [key for key in table if container_id in key[1]]:
+                    del table[key]
+
+    def stats(self):
+        """
+        Counters of the reads served by the facade.
+
+        Returns:
+            dict: Reads served from the cache (hits), sent to the instance
+                (misses) and sharing a read in flight (coalesced), and the number
+                of cached results.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "size": len(self.cache),
+            }
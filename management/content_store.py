@@ -0,0 +1,245 @@
+import hashlib
+import multiprocessing
+import os
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# ioctl request to clone (reflink) a file on Linux filesystems that support it
+FICLONE = 0x40049409
+
+
+def hash_file(path):
+    """
+    Compute the sha384 digest of a file, the hash algorithm used by Flywheel.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        str: Hex digest of the file.
+    """
+    digest = hashlib.sha384()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(2**20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hex_digest(fw_hash):
+    """
+    Extract the hex digest of a Flywheel file hash (e.g. v0-sha384-<digest>).
+
+    Args:
+        fw_hash (str): Hash of a file as reported by Flywheel.
+
+    Returns:
+        str: Hex digest of the file, or None if there is no hash.
+    """
+    if not fw_hash:
+        return None
+    return fw_hash.rsplit("-", 1)[-1]
+
+
+def new_digest(fw_hash):
+    """
+    Create an empty digest of the algorithm of a Flywheel file hash.
+
+    Args:
+        fw_hash (str): Hash of a file as reported by Flywheel.
+
+    Returns:
+        hashlib.Hash: Digest to verify the file with, or None if there is no hash.
+    """
+    if not fw_hash:
+        return None
+    parts = fw_hash.split("-")
+    algorithm = parts[1] if len(parts) == 3 else "sha384"
+    try:
+        return hashlib.new(algorithm)
+    except ValueError:
+        return None
+
+
+def clone_file(src, dest):
+    """
+    Copy src to dest as an independent, writable file.
+
+    The file is reflinked if the filesystem supports it, so its content is only
+    copied once written to, and copied otherwise.
+
+    Args:
+        src (pathlib.Path): Existing file.
+        dest (pathlib.Path): Path to copy the file to. Must not exist.
+    """
+    try:
+        import fcntl
+
+        with open(src, "rb") as src_fp, open(dest, "wb") as dest_fp:
+            fcntl.ioctl(dest_fp.fileno(), FICLONE, src_fp.fileno())
+    except (ImportError, OSError):
+        shutil.copyfile(src, dest)
+
+
+def link_file(src, dest):
+    """
+    Materialize src at dest without copying its content where possible.
+
+    The file is hardlinked. Where hardlinks are not supported it is reflinked if the
+    filesystem supports it, and copied otherwise.
+
+    Args:
+        src (pathlib.Path): Existing file.
+        dest (pathlib.Path): Path to materialize the file at. Must not exist.
+    """
+    try:
+        os.link(src, dest)
+    except OSError:
+        clone_file(src, dest)
+
+
+class ContentStore:
+    """
+    Content-addressed store of cached files, keyed by their Flywheel hash.
+
+    Each distinct file content is kept once under objects/<digest[:2]>/<digest> and
+    every cache path with that content is a hardlink (or reflink) to it, so files
+    that were re-uploaded, copied across projects or attached at several levels are
+    stored, and downloaded, once. A hardlinked file written to in place would
+    modify every copy of it, so files are unshared before they are opened in an app.
+    """
+
+    def __init__(self, objects_dir):
+        """
+        Initialize content store.
+
+        Args:
+            objects_dir (pathlib.Path): Directory of the stored objects.
+        """
+        self.objects_dir = objects_dir
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+
+    def object_path(self, digest):
+        """
+        Path of the object with a given digest.
+
+        Args:
+            digest (str): Hex digest of the content.
+
+        Returns:
+            pathlib.Path: Path of the object.
+        """
+        return self.objects_dir / digest[:2] / digest
+
+    def materialize(self, fw_hash, dest):
+        """
+        Materialize a stored content at a cache path.
+
+        Args:
+            fw_hash (str): Flywheel hash of the file.
+            dest (pathlib.Path): Cache path of the file.
+
+        Returns:
+            bool: True if the content was in the store and is now at dest.
+        """
+        digest = hex_digest(fw_hash)
+        if not digest or not self.object_path(digest).exists():
+            return False
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dest.with_name(dest.name + ".part")
+        if tmp_path.exists():
+            tmp_path.unlink()
+        link_file(self.object_path(digest), tmp_path)
+        os.replace(tmp_path, dest)
+        return True
+
+    def add(self, path, fw_hash):
+        """
+        Add a cached file to the store.
+
+        Args:
+            path (pathlib.Path): Cached file.
+            fw_hash (str): Flywheel hash of the file.
+        """
+        digest = hex_digest(fw_hash)
+        if not digest:
+            return
+        object_path = self.object_path(digest)
+        if object_path.exists():
+            return
+        object_path.parent.mkdir(exist_ok=True)
+        try:
+            link_file(path, object_path)
+        except FileExistsError:
+            pass
+
+    def unshare(self, paths):
+        """
+        Give cached files a content of their own, so they can be written to.
+
+        Files linked to a stored object are replaced by a reflink, or a copy, of it.
+        Writes to them then no longer reach the object nor the other cache paths
+        linked to it.
+
+        Args:
+            paths (list): Paths of cached files.
+        """
+        for path in map(Path, paths):
+            try:
+                if path.stat().st_nlink == 1:
+                    continue
+            except OSError:
+                continue
+            tmp_path = path.with_name(f".{uuid.uuid4().hex}.part")
+            clone_file(path, tmp_path)
+            os.replace(tmp_path, path)
+
+    def deduplicate(self, paths, max_workers=None):
+        """
+        Replace duplicate cached files by links to a single stored object.
+
+        Files are hashed across a pool of processes. Files already linked into the
+        store are skipped.
+
+        Args:
+            paths (list): Paths of cached files.
+            max_workers (int, optional): Number of hashing processes. Defaults to
+                the number of processors.
+
+        Returns:
+            int: Number of bytes freed.
+        """
+        paths = [path for path in paths if path.exists() and path.stat().st_nlink == 1]
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers, mp_context=context) as executor:
+            digests = executor.map(hash_file, [str(path) for path in paths])
+            freed = 0
+            for path, digest in zip(paths, digests):
+                object_path = self.object_path(digest)
+                if not object_path.exists():
+                    self.add(path, digest)
+                    continue
+                if object_path.stat().st_ino == path.stat().st_ino:
+                    continue
+                size = path.stat().st_size
+                tmp_path = path.with_name(f".{uuid.uuid4().hex}.part")
+                link_file(object_path, tmp_path)
+                os.replace(tmp_path, path)
+                freed += size
+        return freed
+
+    def collect_garbage(self):
+        """
+        Remove objects no longer linked from any cache path.
+
+        Returns:
+            int: Number of bytes freed.
+        """
+        freed = 0
+        for object_path in self.objects_dir.glob("*/*"):
+            stat = object_path.stat()
+            if stat.st_nlink == 1:
+                object_path.unlink()
+                freed += stat.st_size
+        return freed
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import docker
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from management.error_reporting import report_error
+
+# Image events that may change the tags present locally
+IMAGE_ACTIONS = ["pull", "tag", "untag", "delete", "load", "import"]
+
+
+def full_tag(tag):
+    """
+    Qualify an image tag with the implicit "latest" version.
+
+    Args:
+        tag (str): Image tag (e.g. stevepieper/slicer-chronicle).
+
+    Returns:
+        str: Qualified tag (e.g. stevepieper/slicer-chronicle:latest).
+    """
+    if ":" not in tag.rsplit("/", 1)[-1]:
+        tag += ":latest"
+    return tag
+
+
+class DockerImages(QObject):
+    """
+    Index of the docker images available locally, kept current from docker events.
+
+    Images are listed once and then updated incrementally as images are pulled,
+    tagged or deleted, so checking the availability of an image is a set lookup.
+    Listing and watching happen on a daemon thread, reconnecting if the docker
+    daemon is restarted.
+    """
+
+    # The set of available image tags has changed
+    changed = pyqtSignal()
+
+    # Seconds to wait before reconnecting to an unavailable docker daemon
+    retry_interval = 30
+
+    def __init__(self):
+        """
+        Initialize the index and start watching the docker daemon.
+        """
+        super(DockerImages, self).__init__()
+        self.client = None
+        self.images = {}
+        self.tags = set()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+        self.thread.start()
+
+    def has_image(self, tag):
+        """
+        Check if an image is available locally.
+
+        Args:
+            tag (str): Image tag.
+
+        Returns:
+            bool: True if an image with that tag is available.
+        """
+        with self.lock:
+            return full_tag(tag) in self.tags
+
+    def _watch(self):
+        """
+        List images and follow image events until the daemon is unavailable.
+
+        Runs on the watcher thread.
+        """
+        while True:
+            try:
+                if self.client is None:
+                    self.client = docker.from_env()
+                since = int(time.time())
+                images = {
+                    image.id: set(image.tags) for image in self.client.images.list()
+                }
+                self._set_images(images)
+                events = self.client.events(
+                    since=since, filters={"type": "image"}, decode=True
+                )
+                for event in events:
+                    if event.get("Action") in IMAGE_ACTIONS:
+                        self._update_image(event["id"])
+            except Exception as e:
+                report_error(e)
+            self.client = None
+            self._set_images({})
+            time.sleep(self.retry_interval)
+
+    def _update_image(self, image_ref):
+        """
+        Refresh the tags of an image named in an event.
+
+        Args:
+            image_ref (str): Id or tag of the image.
+        """
+        images = dict(self.images)
+        try:
+            image = self.client.images.get(image_ref)
+        except docker.errors.NotFound:
+            images.pop(image_ref, None)
+        else:
+            images[image.id] = set(image.tags)
+        self._set_images(images)
+
+    def _set_images(self, images):
+        """
+        Replace the indexed images, signalling if the available tags changed.
+
+        Args:
+            images (dict): Tags of each image keyed by image id.
+        """
+        tags = set().union(*images.values())
+        with self.lock:
+            self.images = images
+            changed = tags != self.tags
+            self.tags = tags
+        if changed:
+            self.changed.emit()
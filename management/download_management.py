@@ -0,0 +1,687 @@
+import os
+import time
+from functools import partial
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from management.cache_management import write_version
+from management.content_store import hex_digest, new_digest
+from management.error_reporting import report_error
+from management.fw_http import FlywheelHttp, TokenBucket
+
+# Priority classes of downloads, the most urgent first
+PRIORITY_OPEN = 3
+PRIORITY_ANALYSIS = 2
+PRIORITY_CACHE = 1
+PRIORITY_PREFETCH = 0
+PRIORITY_NAMES = {
+    PRIORITY_OPEN: "Open",
+    PRIORITY_ANALYSIS: "Analysis",
+    PRIORITY_CACHE: "Cache",
+    PRIORITY_PREFETCH: "Prefetch",
+}
+
+
+class DownloadCancelled(Exception):
+    """
+    Raised to stop a download that was cancelled or preempted.
+    """
+
+
+class DownloadRequest:
+    """
+    A single file to be downloaded into the local cache.
+    """
+
+    # Bytes read into memory at once while streaming a file
+    chunk_size = 2**20
+
+    def __init__(
+        self,
+        key,
+        file_parent,
+        file_name,
+        path,
+        size=None,
+        hash=None,
+        version=None,
+        modified=None,
+    ):
+        """
+        Initialize a request for a file of a flywheel container.
+
+        Args:
+            key (str): Unique key of the request (e.g. the flywheel file id).
+            file_parent (flywheel.Container): Container hosting the file.
+            file_name (str): Name of the file on its container.
+            path (pathlib.Path): Destination of the file in the cache.
+            size (int, optional): Size of the file in bytes. Defaults to None.
+            hash (str, optional): Flywheel hash of the file. Defaults to None.
+            version (int, optional): Version of the file. Defaults to None.
+            modified (str, optional): Modified time of the file. Defaults to None.
+        """
+        self.key = key
+        self.file_parent = file_parent
+        self.file_name = file_name
+        self.path = path
+        self.size = size or 0
+        self.hash = hash
+        self.version = version
+        self.modified = str(modified) if modified is not None else None
+
+    def version_record(self):
+        """
+        Describe the version of the requested file, to record next to its copy.
+
+        Returns:
+            dict: Hash, version, modified time and size of the file.
+        """
+        return {
+            "hash": self.hash,
+            "version": self.version,
+            "modified": self.modified,
+            "size": self.size,
+        }
+
+    def fetch(self, http, progress):
+        """
+        Download the file to its cache path. Blocks until complete.
+
+        The file is streamed next to its cache path in chunks of bounded size and
+        only renamed into place once its size and hash have been verified, so an
+        interrupted or corrupt download is never mistaken as cached. A partial file
+        left by an interrupted download is resumed with an HTTP Range request.
+
+        Args:
+            http (FlywheelHttp): Session to stream the file with.
+            progress (callable): Called with the number of bytes downloaded so far.
+
+        Raises:
+            ValueError: If the downloaded file does not match its size or hash.
+        """
+        if not self.path.parents[0].exists():
+            os.makedirs(self.path.parents[0], exist_ok=True)
+        part_path = self.path.with_name(self.path.name + ".part")
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        if self.size and offset > self.size:
+            offset = 0
+        progress(offset)
+
+        digest = new_digest(self.hash)
+        with open(part_path, "r+b" if offset else "wb") as fp:
+            if digest and offset:
+                self._hash_part(fp, offset, digest)
+            if not self.size or offset < self.size:
+                url = http.file_url(self.file_parent, self.file_name)
+                with http.get(url, offset) as response:
+                    response.raise_for_status()
+                    if offset and response.status_code != 206:
+                        # The server ignored the range, the download starts over
+                        offset = 0
+                        digest = new_digest(self.hash)
+                    fp.seek(offset)
+                    fp.truncate()
+                    for chunk in response.iter_content(self.chunk_size):
+                        http.throttle(response.url, len(chunk))
+                        fp.write(chunk)
+                        if digest:
+                            digest.update(chunk)
+                        offset += len(chunk)
+                        progress(offset)
+
+        if self.size and offset != self.size:
+            if offset > self.size:
+                part_path.unlink()
+            raise ValueError(
+                f"{self.file_name}: received {offset} of {self.size} bytes"
+            )
+        if digest and digest.hexdigest() != hex_digest(self.hash):
+            part_path.unlink()
+            raise ValueError(f"{self.file_name}: hash does not match")
+        os.replace(part_path, self.path)
+
+    def _hash_part(self, fp, offset, digest):
+        """
+        Feed the bytes of a partial download to a digest.
+
+        Args:
+            fp (file): Partial download opened for reading.
+            offset (int): Number of bytes to read.
+            digest (hashlib.Hash): Digest to update.
+        """
+        fp.seek(0)
+        while fp.tell() < offset:
+            chunk = fp.read(min(self.chunk_size, offset - fp.tell()))
+            if not chunk:
+                break
+            digest.update(chunk)
+
+
+class DownloadSignals(QObject):
+    """
+    Signals emitted by a DownloadJob.
+    """
+
+    progress = pyqtSignal(object, int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object, object)
+
+
+class DownloadJob(QRunnable):
+    """
+    Download a single requested file on a worker thread.
+
+    A job stops at the next chunk once it is cancelled or preempted, keeping its
+    partial file so it can be resumed. Jobs are not deleted by the thread pool, so
+    the download engine can check on them until they are done.
+    """
+
+    def __init__(self, request, content_store, http, priority, bucket=None):
+        """
+        Initialize job with the request to download.
+
+        Args:
+            request (DownloadRequest): File to download.
+            content_store (ContentStore): Store of cached file contents.
+            http (FlywheelHttp): Session to stream the file with.
+            priority (int): Priority class of the download (e.g. PRIORITY_OPEN).
+            bucket (TokenBucket, optional): Bandwidth limit of the download on top
+                of the limits of the session. Defaults to None.
+        """
+        super(DownloadJob, self).__init__()
+        self.request = request
+        self.content_store = content_store
+        self.http = http
+        self.priority = priority
+        self.bucket = bucket
+        self.received = None
+        # Set by the worker thread as it picks the job up, and once it is over
+        self.running = False
+        self.done = False
+        self.cancelled = False
+        self.preempted = False
+        self.signals = DownloadSignals()
+        self.setAutoDelete(False)
+
+    def run(self):
+        """
+        Download the file, reporting progress, completion or failure.
+
+        Files whose content is already in the content store are linked from it
+        instead of being downloaded. The version of the file is recorded next to it.
+        """
+        request = self.request
+        self.running = True
+        try:
+            if self.cancelled or self.preempted:
+                raise DownloadCancelled(request.file_name)
+            if not self.content_store.materialize(request.hash, request.path):
+                request.fetch(self.http, self._progress)
+                self.content_store.add(request.path, request.hash)
+            write_version(request.path, request.version_record())
+        except Exception as e:
+            self.done = True
+            self.signals.failed.emit(self.request, e)
+        else:
+            self.done = True
+            self.signals.finished.emit(self.request)
+
+    def _progress(self, nbytes):
+        """
+        Report the bytes of the file downloaded so far.
+
+        Args:
+            nbytes (int): Bytes of the file downloaded so far.
+
+        Raises:
+            DownloadCancelled: If the job was cancelled or preempted.
+        """
+        if self.cancelled or self.preempted:
+            raise DownloadCancelled(self.request.file_name)
+        if self.bucket is not None and self.received is not None:
+            self.bucket.consume(nbytes - self.received)
+        self.received = nbytes
+        self.signals.progress.emit(self.request, nbytes)
+
+
+class DownloadBatch:
+    """
+    A set of downloads that are reported on as a whole.
+    """
+
+    def __init__(
+        self,
+        requests,
+        on_file_finished=None,
+        on_finished=None,
+        priority=PRIORITY_OPEN,
+        rate=None,
+    ):
+        """
+        Initialize a batch of download requests.
+
+        Args:
+            requests (list): DownloadRequests of the batch.
+            on_file_finished (callable, optional): Called with each request as its
+                file is downloaded. Defaults to None.
+            on_finished (callable, optional): Called with the batch once every
+                request has completed or failed. Defaults to None.
+            priority (int, optional): Priority class of the downloads. Defaults to
+                PRIORITY_OPEN.
+            rate (float, optional): Bytes per second allowed for the batch.
+                Defaults to None, for no limit beyond the global ones.
+        """
+        self.priority = priority
+        self.bucket = TokenBucket(rate) if rate else None
+        self.requests = {request.key: request for request in requests}
+        self.pending = set(self.requests.keys())
+        self.received = {key: 0 for key in self.requests}
+        self.failed = {}
+        self.on_file_finished = on_file_finished
+        self.on_finished = on_finished
+
+    @property
+    def succeeded(self):
+        """
+        True if every file of the batch is present in the cache.
+        """
+        return not self.pending and not self.failed
+
+
+class DownloadManagement:
+    """
+    Class that coordinates concurrent downloads of files into the local cache.
+
+    Downloads are queued by priority class, so files being opened are downloaded
+    before inputs of analyses, which come before cached subtrees and prefetched
+    files. A download waiting for a worker preempts the least urgent download in
+    progress, which is queued again and resumes from its partial file. Every
+    download shares one HTTP session, with as many connections as workers, and
+    the global and per-host bandwidth limits.
+    """
+
+    # Maximum number of files downloaded at once
+    max_workers = 4
+
+    def __init__(self, main_window):
+        """
+        Initialize the download worker pool and progress components.
+
+        Args:
+            main_window (AppLauncher): Main window hosting the status bar.
+        """
+        self.main_window = main_window
+        self.ui = main_window.ui
+        self.cache_index = main_window.cache_index
+        self.content_store = main_window.content_store
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(self.max_workers)
+        settings = main_window.settings
+        self.http = FlywheelHttp(
+            main_window.fw_client,
+            self.max_workers,
+            settings["download_bandwidth_mb"] * 1e6,
+            settings["download_host_bandwidth_mb"] * 1e6,
+            main_window.limiter,
+        )
+        self.batches = []
+        # Batches of the jobs queued or in progress, keyed by job
+        self.jobs = {}
+        self.queue_dialog = None
+        self.start_time = None
+        # Aggregate counters of all active batches
+        self.n_files = 0
+        self.n_done = 0
+        self.total_bytes = 0
+        self.received_bytes = 0
+        # Requests that have started receiving data
+        self.active = {}
+
+        self.progress_label = QtWidgets.QLabel()
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setMaximumWidth(200)
+        self.ui.statusbar.addPermanentWidget(self.progress_label)
+        self.ui.statusbar.addPermanentWidget(self.progress_bar)
+        self._update_progress()
+
+        menu = self.ui.menubar.addMenu("Downloads")
+        action = menu.addAction("Download Queue...")
+        action.triggered.connect(self.show_queue)
+
+    def download(
+        self,
+        requests,
+        on_file_finished=None,
+        on_finished=None,
+        priority=PRIORITY_OPEN,
+        rate=None,
+    ):
+        """
+        Queue requested files for download in parallel.
+
+        Files already present in the cache index are only downloaded again if the
+        cached copy is stale.
+
+        Args:
+            requests (list): DownloadRequests to fetch.
+            on_file_finished (callable, optional): Called with each request as its
+                file is downloaded. Defaults to None.
+            on_finished (callable, optional): Called with the batch once every
+                request has completed or failed. Defaults to None.
+            priority (int, optional): Priority class of the downloads. Defaults to
+                PRIORITY_OPEN.
+            rate (float, optional): Bytes per second allowed for the batch.
+                Defaults to None, for no limit beyond the global ones.
+
+        Returns:
+            DownloadBatch: The batch tracking the requested downloads.
+        """
+        requests = [
+            request
+            for request in requests
+            if not self.cache_index.is_cached(request.key, request.path)
+            or not self.cache_index.is_current(request.key, request, request.path)
+        ]
+        batch = DownloadBatch(requests, on_file_finished, on_finished, priority, rate)
+        if not requests:
+            self._finish_batch(batch)
+            return batch
+
+        if not self.batches:
+            self.start_time = time.monotonic()
+        self.batches.append(batch)
+        self.n_files += len(requests)
+        self.total_bytes += sum(request.size for request in requests)
+        for request in requests:
+            self._queue(batch, request)
+        self._preempt()
+        self._update_progress()
+        return batch
+
+    def _queue(self, batch, request):
+        """
+        Queue the download of a file by the priority of its batch.
+
+        Args:
+            batch (DownloadBatch): Batch the file belongs to.
+            request (DownloadRequest): Request to download.
+        """
+        job = DownloadJob(
+            request, self.content_store, self.http, batch.priority, batch.bucket
+        )
+        job.signals.progress.connect(partial(self._file_progress, batch))
+        job.signals.finished.connect(partial(self._file_finished, batch, job))
+        job.signals.failed.connect(partial(self._file_failed, batch, job))
+        self.jobs[job] = batch
+        self.thread_pool.start(job, batch.priority)
+
+    def _preempt(self):
+        """
+        Free workers for queued downloads more urgent than running ones.
+
+        The least urgent running downloads are preempted, one for each queued
+        download that would otherwise wait behind them.
+        """
+        running = []
+        queued = []
+        for job in self.jobs:
+            if not job.running:
+                queued.append(job.priority)
+            elif not job.done and not job.preempted:
+                running.append(job)
+        free = self.max_workers - len(running)
+        # Queued downloads beyond the free workers, most urgent first
+        waiting = sorted(queued, reverse=True)[max(free, 0) :]
+        running.sort(key=lambda job: job.priority)
+        for priority, job in zip(waiting, running):
+            if job.priority >= priority:
+                break
+            job.preempted = True
+
+    def busy(self, priority):
+        """
+        Check if downloads more urgent than a priority class are pending.
+
+        Args:
+            priority (int): Priority class to compare with.
+
+        Returns:
+            bool: True if a batch of a higher priority class is not finished.
+        """
+        return any(batch.priority > priority for batch in self.batches)
+
+    def cancel(self, job):
+        """
+        Cancel a queued or running download.
+
+        Args:
+            job (DownloadJob): Job of the download.
+        """
+        if job not in self.jobs or job.done:
+            return
+        job.cancelled = True
+        # A running job stops at its next chunk; only a queued one is taken back
+        if not job.running and self.thread_pool.tryTake(job):
+            self._file_failed(
+                self.jobs[job],
+                job,
+                job.request,
+                DownloadCancelled(job.request.file_name),
+            )
+
+    def show_queue(self):
+        """
+        Show the queue of downloads, where they can be cancelled.
+        """
+        if self.queue_dialog is None:
+            self.queue_dialog = DownloadQueueDialog(self)
+        self.queue_dialog.show()
+        self.queue_dialog.raise_()
+
+    def _file_progress(self, batch, request, nbytes):
+        """
+        Record the bytes received for a file.
+
+        Args:
+            batch (DownloadBatch): Batch the file belongs to.
+            request (DownloadRequest): Request being downloaded.
+            nbytes (int): Bytes of the file downloaded so far.
+        """
+        self.received_bytes += nbytes - batch.received[request.key]
+        batch.received[request.key] = nbytes
+        self.active[request.key] = (batch, request)
+        self._update_progress()
+
+    def _file_finished(self, batch, job, request):
+        """
+        Record a completed file and finish the batch if it was the last.
+
+        Args:
+            batch (DownloadBatch): Batch the file belongs to.
+            job (DownloadJob): Job that downloaded the file.
+            request (DownloadRequest): Request that completed.
+        """
+        self.jobs.pop(job, None)
+        batch.pending.discard(request.key)
+        self.active.pop(request.key, None)
+        self.n_done += 1
+        self.received_bytes += request.size - batch.received[request.key]
+        batch.received[request.key] = request.size
+        self.cache_index.add(request.key, request.path, request.version_record())
+        if batch.on_file_finished:
+            batch.on_file_finished(request)
+        self._check_batch(batch)
+
+    def _file_failed(self, batch, job, request, error):
+        """
+        Record a failed file and finish the batch if it was the last.
+
+        Preempted downloads are queued again instead.
+
+        Args:
+            batch (DownloadBatch): Batch the file belongs to.
+            job (DownloadJob): Job that failed.
+            request (DownloadRequest): Request that failed.
+            error (Exception): Exception raised by the download.
+        """
+        if self.jobs.pop(job, None) is None:
+            return
+        self.active.pop(request.key, None)
+        if job.preempted and not job.cancelled:
+            self._queue(batch, request)
+            return
+        report_error(error)
+        batch.pending.discard(request.key)
+        batch.failed[request.key] = error
+        self.n_done += 1
+        self._check_batch(batch)
+
+    def _check_batch(self, batch):
+        """
+        Finish the batch once none of its requests are pending.
+
+        Args:
+            batch (DownloadBatch): Batch to check.
+        """
+        if not batch.pending:
+            self.batches.remove(batch)
+            self._finish_batch(batch)
+        self._update_progress()
+
+    def _finish_batch(self, batch):
+        """
+        Report the completion of a batch.
+
+        Args:
+            batch (DownloadBatch): Batch with no pending requests.
+        """
+        if batch.on_finished:
+            batch.on_finished(batch)
+
+    def _update_progress(self):
+        """
+        Render aggregate progress and throughput of all active batches.
+        """
+        if not self.batches:
+            self.progress_label.hide()
+            self.progress_bar.hide()
+            self.start_time = None
+            self.n_files = self.n_done = 0
+            self.total_bytes = self.received_bytes = 0
+            return
+
+        elapsed = max(time.monotonic() - self.start_time, 1e-3)
+        rate = self.received_bytes / elapsed / 1e6
+        self.progress_label.setText(
+            f"Downloading {self.n_done}/{self.n_files} files ({rate:.1f} MB/s)"
+        )
+        if self.total_bytes:
+            self.progress_bar.setValue(
+                int(1000 * self.received_bytes / self.total_bytes)
+            )
+
+        # Per-file progress of files currently being received
+        in_progress = []
+        for key, (batch, request) in self.active.items():
+            if request.size:
+                percent = batch.received[key] * 100 // request.size
+                in_progress.append(f"{request.file_name}: {percent}%")
+            else:
+                in_progress.append(request.file_name)
+        self.progress_bar.setToolTip("\n".join(in_progress))
+        self.progress_label.show()
+        self.progress_bar.show()
+
+
+class DownloadQueueDialog(QtWidgets.QDialog):
+    """
+    Dialog listing the queued and running downloads, to cancel any of them.
+    """
+
+    # Milliseconds between refreshes of the list
+    refresh_interval = 1000
+
+    def __init__(self, download_management):
+        """
+        Initialize dialog with the downloads of the download engine.
+
+        Args:
+            download_management (DownloadManagement): Engine running the downloads.
+        """
+        super(DownloadQueueDialog, self).__init__(download_management.main_window)
+        self.setWindowTitle("Download Queue")
+        self.resize(600, 400)
+        self.download_management = download_management
+        # Items of the listed jobs, keyed by job
+        self.items = {}
+        self.tree = QtWidgets.QTreeWidget()
+        self.tree.setHeaderLabels(["File", "Priority", "Status"])
+        self.tree.setRootIsDecorated(False)
+        self.tree.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        cancel_button = QtWidgets.QPushButton("Cancel Selected")
+        cancel_button.clicked.connect(self.cancel_selected)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(self.tree)
+        layout.addWidget(cancel_button)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.refresh_interval)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+        self.refresh()
+
+    def refresh(self):
+        """
+        Update the list with the current downloads, keeping the selection.
+        """
+        jobs = self.download_management.jobs
+        for job in list(self.items):
+            if job not in jobs:
+                item = self.items.pop(job)
+                self.tree.takeTopLevelItem(self.tree.indexOfTopLevelItem(item))
+        for job, batch in jobs.items():
+            item = self.items.get(job)
+            if item is None:
+                item = QtWidgets.QTreeWidgetItem(
+                    [job.request.file_name, PRIORITY_NAMES[job.priority], ""]
+                )
+                # The most urgent downloads are listed first
+                row = sum(other.priority >= job.priority for other in self.items)
+                self.items[job] = item
+                self.tree.insertTopLevelItem(row, item)
+            item.setText(2, self._status(job, batch))
+
+    @staticmethod
+    def _status(job, batch):
+        """
+        Describe the state of a download.
+
+        Args:
+            job (DownloadJob): Job of the download.
+            batch (DownloadBatch): Batch the download belongs to.
+
+        Returns:
+            str: Status of the download.
+        """
+        if job.cancelled:
+            return "Cancelling"
+        if not job.running:
+            return "Queued"
+        if job.preempted:
+            return "Pausing"
+        size = job.request.size
+        if size:
+            return f"Downloading {batch.received[job.request.key] * 100 // size}%"
+        return "Downloading"
+
+    def cancel_selected(self):
+        """
+        Cancel the selected downloads.
+        """
+        for job, item in list(self.items.items()):
+            if item.isSelected():
+                self.download_management.cancel(job)
+        self.refresh()
@@ -0,0 +1,63 @@
+from collections import deque
+from datetime import datetime
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class ErrorSignals(QObject):
+    """
+    Signals of the errors reported by background work.
+
+    Errors may be reported from any thread; they are queued to the GUI thread.
+    """
+
+    reported = pyqtSignal(str)
+
+
+error_signals = ErrorSignals()
+
+
+def report_error(error):
+    """
+    Report an error of background work (e.g. a failed worker) to the user.
+
+    Can be connected to the error signal of a Worker.
+
+    Args:
+        error (Exception): Exception raised by the work.
+    """
+    error_signals.reported.emit(str(error) or type(error).__name__)
+
+
+class ErrorStatus:
+    """
+    Status bar report of the errors of background work, with the recent ones kept
+    in its tooltip.
+    """
+
+    # Milliseconds an error is shown in the status bar
+    timeout = 10000
+    # Number of recent errors kept
+    max_errors = 20
+
+    def __init__(self, main_window):
+        """
+        Initialize the report in the status bar of the main window.
+
+        Args:
+            main_window (AppLauncher): Main window with the status bar.
+        """
+        self.statusbar = main_window.ui.statusbar
+        self.errors = deque(maxlen=self.max_errors)
+        error_signals.reported.connect(self.show)
+
+    def show(self, message):
+        """
+        Show a reported error.
+
+        Args:
+            message (str): Description of the error.
+        """
+        self.errors.append(f"{datetime.now():%H:%M:%S} {message}")
+        self.statusbar.setToolTip("\n".join(self.errors))
+        self.statusbar.showMessage(f"Error: {message}", self.timeout)
@@ -1,34 +1,483 @@
 import os
+import time
+from functools import partial
 from pathlib import Path
 
 from PyQt5 import QtGui, QtWidgets, uic
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThreadPool
 from PyQt5.QtWidgets import QAbstractItemView
 
+from management.cache_management import get_cache_path
+from management.download_management import DownloadRequest
+from management.error_reporting import report_error
+from management.tree_model import TreeModel, TreeNode
+from management.workers import Worker
 
-class FolderItem(QtGui.QStandardItem):
+# Directory of the launcher sources, holding the icons
+SOURCE_DIR = Path(os.path.realpath(__file__)).parents[1]
+# Icons shared by every item of the tree, keyed by path
+ICONS = {}
+
+
+def get_icon(icon_path):
+    """
+    Icon shared by every tree item displaying it.
+
+    Args:
+        icon_path (str): Path of the icon relative to the launcher sources.
+
+    Returns:
+        QtGui.QIcon: The icon, loaded on first use.
+    """
+    icon = ICONS.get(icon_path)
+    if icon is None:
+        icon = ICONS[icon_path] = QtGui.QIcon(str(SOURCE_DIR / icon_path))
+    return icon
+
+
+class LoadingItem(TreeNode):
+    """
+    Placeholder shown under a Folder Item while its children are being fetched.
+    """
+
+    __slots__ = ()
+
+    def __init__(self):
+        """
+        Initialize an unselectable "Loading..." placeholder.
+        """
+        super(LoadingItem, self).__init__("Loading\u2026")
+        self.setEnabled(False)
+        self.setSelectable(False)
+
+
+class ContainerModel(TreeModel):
+    """
+    Tree model of Flywheel containers, giving its items access to the metadata store
+    and the cache index.
+    """
+
+    def __init__(self, metadata_store, cache_index):
+        """
+        Initialize an empty model.
+
+        Args:
+            metadata_store (MetadataStore): Store to list child containers from.
+            cache_index (CacheIndex): Index of cached files.
+        """
+        super(ContainerModel, self).__init__()
+        self.metadata_store = metadata_store
+        self.cache_index = cache_index
+        # File items in the tree, keyed by file id
+        self.file_items = {}
+        # Fetch the whole hierarchy of projects as they are first expanded
+        self.snapshot_projects = False
+        cache_index.changed.connect(self._cache_changed)
+
+    def _cache_changed(self, file_id, cached):
+        """
+        Update the file item of a file added to or removed from the cache.
+
+        Args:
+            file_id (str): Id of the file.
+            cached (bool): True if the file is now cached.
+        """
+        item = self.file_items.get(file_id)
+        if item is None:
+            return
+        if item.model() is None:
+            # The item has been removed from the tree.
+            del self.file_items[file_id]
+            return
+        item._set_cached(cached)
+
+
+def patch_children(parent_item, child_class, containers, through=None):
+    """
+    Patch the container items under a tree node to match a fresh listing.
+
+    Items of containers no longer listed are removed, new containers are added and
+    items of containers that have changed are updated in place.
+
+    Args:
+        parent_item (TreeNode): Tree node hosting the container items.
+        child_class (type): ContainerItem subclass to instantiate for new containers.
+        containers (list): Freshly listed containers.
+        through (tuple, optional): Label and id of the last container listed, if the
+            node only lists part of its children. New containers past it are left
+            to the pages still to be listed. Defaults to None.
+    """
+    fresh = {container.id: container for container in containers}
+    existing = {}
+    for row in reversed(range(parent_item.rowCount())):
+        item = parent_item.child(row)
+        if not isinstance(item, ContainerItem):
+            continue
+        if item.container.id in fresh:
+            existing[item.container.id] = item
+        else:
+            parent_item.removeRow(row)
+    new_items = []
+    for container in containers:
+        item = existing.get(container.id)
+        if item is None:
+            if through is None or (container.label, container.id) <= through:
+                new_items.append(child_class(parent_item, container))
+        elif (item.container.label, item.container.modified) != (
+            container.label,
+            container.modified,
+        ):
+            item._update_container(container)
+    parent_item.appendRows(new_items)
+
+
+class FolderItem(TreeNode):
     """
     Folder Items are for the convenience of collapsing long lists into a tree node.
+
+    A folder of child containers lists them a page at a time: the first page as the
+    folder is expanded, the next ones as its last child is scrolled into view. Pages
+    come from the metadata store if it has a recorded listing, revalidated in the
+    background once stale, or from the instance otherwise.
     """
 
-    def __init__(self, parent_item, folder_name):
+    __slots__ = (
+        "parent_item",
+        "parent_container",
+        "child_class",
+        "_loader",
+        "_revalidator",
+        "_placeholder",
+        "_source",
+        "_after",
+        "_exhausted",
+        "_started",
+        "_paused",
+    )
+
+    # Number of children added to the tree per batch while loading
+    batch_size = 100
+    # Number of child containers listed per page
+    page_size = 100
+
+    def __init__(self, parent_item, folder_name, child_class=None):
         """
         Initialize Folder Items unpopulated.
 
         Args:
             parent_item (ContainerItem): Container Item parent for Folder Item.
             folder_name (str): A name for the folder item (e.g. SESSIONS).
+            child_class (type, optional): ContainerItem subclass of the child
+                containers listed in the folder. Defaults to None.
         """
-        super(FolderItem, self).__init__()
-        self.source_dir = parent_item.source_dir
-        icon_path = "resources/folder.png"
-        icon = QtGui.QIcon(str(self.source_dir / icon_path))
+        super(FolderItem, self).__init__(folder_name)
         self.parent_item = parent_item
         self.parent_container = parent_item.container
-        self.folderItem = QtGui.QStandardItem()
-        self.setText(folder_name)
-        self.setIcon(icon)
-        parent_item.appendRow(self)
+        self.child_class = child_class
+        self._loader = None
+        self._revalidator = None
+        self._placeholder = None
+        # Where pages come from ("store" or "server"), the label and id of the last
+        # child listed, and the time the listing of the instance started
+        self._source = None
+        self._after = None
+        self._exhausted = False
+        self._started = None
+        # Set once a page is listed, until the next page is requested
+        self._paused = False
+        self.setIcon(get_icon("resources/folder.png"))
+
+    def hasChildren(self):
+        """
+        Check if the folder has, or may list, children.
+
+        Returns:
+            bool: True if the folder should be expandable.
+        """
+        return bool(self.rowCount()) or (
+            self.child_class is not None and not self._exhausted
+        )
+
+    def can_fetch_more(self):
+        """
+        Check if another page of child containers should be listed.
+
+        Returns:
+            bool: True if another page is left and requested.
+        """
+        return (
+            self.child_class is not None
+            and not self._exhausted
+            and not self._paused
+            and self._loader is None
+        )
+
+    def request_more(self):
+        """
+        Allow the next page of child containers to be listed.
+        """
+        self._paused = False
+
+    def fetch_more(self):
+        """
+        List the next page of child containers.
+        """
+        store = self.model().metadata_store
+        parent_id = self.parent_container.id
+        container_type = self.child_class.container_type
+        if self._source is None:
+            self._source = "server"
+            if store.has_listing(parent_id, container_type):
+                self._source = "store"
+                if store.is_stale(parent_id, container_type):
+                    self._revalidate(store, parent_id, container_type)
+
+        if self._source == "store":
+            containers = store.children(
+                parent_id, container_type, self.page_size, self._after
+            )
+            self.appendRows([self.child_class(self, c) for c in containers])
+            self._exhausted = len(containers) < self.page_size
+            self._paused = True
+            if containers:
+                self._after = (containers[-1].label, containers[-1].id)
+            return
+
+        if self._started is None:
+            self._started = time.time()
+        self._show_placeholder()
+        loader = Worker(
+            store.fetch_page,
+            parent_id,
+            container_type,
+            self.page_size,
+            self._after[1] if self._after else None,
+            self._started,
+        )
+        loader.signals.batch.connect(partial(self._add_page, loader))
+        loader.signals.error.connect(partial(self._load_failed, loader))
+        loader.signals.finished.connect(partial(self._load_finished, loader))
+        self._loader = loader
+        QThreadPool.globalInstance().start(loader)
+
+    def _add_page(self, loader, result):
+        """
+        Add a page of child containers fetched from the instance.
+
+        Args:
+            loader (Worker): The worker that fetched the page.
+            result (tuple): Fetched containers, and True if it is the last page.
+        """
+        if loader is not self._loader:
+            return
+        containers, complete = result
+        self._remove_placeholder()
+        self.appendRows([self.child_class(self, c) for c in containers])
+        self._exhausted = complete
+        self._paused = True
+        if containers:
+            self._after = (containers[-1].label, containers[-1].id)
+
+    def _load_snapshot(self):
+        """
+        Fetch the snapshot of the project of the folder on a worker thread.
+
+        Subjects already recorded are listed from the store and patched once the
+        snapshot arrives. Otherwise, subjects are listed from the store as soon as
+        the snapshot is recorded, with a "Loading..." placeholder until then. If the
+        snapshot fails or is cancelled, subjects are listed from the instance.
+        """
+        store = self.model().metadata_store
+        parent_id = self.parent_container.id
+        snapshot = Worker(store.fetch_project_snapshot, parent_id)
+        if store.has_listing(parent_id, self.child_class.container_type):
+            # The snapshot revalidates the listing of subjects in the store
+            self._source = "store"
+            snapshot.signals.batch.connect(partial(self._patch_children, snapshot))
+            snapshot.signals.error.connect(report_error)
+            self._revalidator = snapshot
+        else:
+            self._show_placeholder()
+            snapshot.signals.batch.connect(partial(self._snapshot_loaded, snapshot))
+            snapshot.signals.error.connect(partial(self._load_failed, snapshot))
+            self._loader = snapshot
+        QThreadPool.globalInstance().start(snapshot)
+
+    def _snapshot_loaded(self, loader, containers):
+        """
+        List the first page of subjects once the snapshot is recorded.
+
+        Args:
+            loader (Worker): The worker that fetched the snapshot.
+            containers (list): Subjects of the project.
+        """
+        if loader is not self._loader:
+            return
+        self._loader = None
+        self._remove_placeholder()
+        self.fetch_more()
+
+    def _revalidate(self, store, parent_id, container_type):
+        """
+        Fetch the child containers again on a worker thread and patch the folder.
+
+        Args:
+            store (MetadataStore): Store recording the listing.
+            parent_id (str): Id of the container whose children are listed.
+            container_type (str): Type of the child containers.
+        """
+        revalidator = Worker(store.fetch_children, parent_id, container_type)
+        revalidator.signals.batch.connect(partial(self._patch_children, revalidator))
+        revalidator.signals.error.connect(report_error)
+        self._revalidator = revalidator
+        QThreadPool.globalInstance().start(revalidator)
+
+    def _patch_children(self, revalidator, containers):
+        """
+        Patch the listed children with revalidated ones.
+
+        Args:
+            revalidator (Worker): The worker that fetched the children.
+            containers (list): Freshly listed children.
+        """
+        if revalidator is not self._revalidator:
+            return
+        self._revalidator = None
+        if self._after is None and not self._exhausted:
+            # No page is listed yet; pages are listed from the updated store
+            return
+        through = None if self._exhausted else self._after
+        patch_children(self, self.child_class, containers, through)
+
+    def _load_children(self, fetch_children, child_class):
+        """
+        Populate the folder with the results of fetch_children on a worker thread.
+
+        A "Loading..." placeholder is shown until the fetch completes. Results are
+        added to the tree in batches as they arrive.
+
+        Args:
+            fetch_children (callable): Blocking call returning flywheel containers.
+            child_class (type): ContainerItem subclass to instantiate for each result.
+        """
+        if self.hasChildren():
+            return
+        self._show_placeholder()
+        loader = Worker(fetch_children, batch_size=self.batch_size)
+        loader.signals.batch.connect(partial(self._add_children, loader, child_class))
+        loader.signals.error.connect(partial(self._load_failed, loader))
+        loader.signals.finished.connect(partial(self._load_finished, loader))
+        self._loader = loader
+        QThreadPool.globalInstance().start(loader)
+
+    def _add_children(self, loader, child_class, batch):
+        """
+        Add a batch of fetched containers to the folder.
+
+        Args:
+            loader (Worker): The worker that fetched the batch.
+            child_class (type): ContainerItem subclass to instantiate for each result.
+            batch (list): Flywheel containers fetched by the worker.
+        """
+        if loader is not self._loader:
+            return
+        self._remove_placeholder()
+        self.appendRows([child_class(self, child) for child in batch])
+
+    def _show_placeholder(self):
+        """
+        Show the "Loading..." placeholder after the listed children.
+        """
+        self._placeholder = LoadingItem()
+        self.appendRow(self._placeholder)
+
+    def _remove_placeholder(self):
+        """
+        Remove the "Loading..." placeholder, if shown.
+        """
+        if self._placeholder is not None:
+            self.removeRow(self._placeholder.row())
+            self._placeholder = None
+
+    def _load_failed(self, loader, error):
+        """
+        Stop loading if the fetch failed so it is retried on the next expand.
+
+        Args:
+            loader (Worker): The worker that failed.
+            error (Exception): The exception raised by the worker.
+        """
+        if loader is not self._loader:
+            return
+        report_error(error)
+        self._cancel_loading()
+
+    def _load_finished(self, loader):
+        """
+        Remove the "Loading..." placeholder once the fetch is complete.
+
+        Args:
+            loader (Worker): The worker that finished.
+        """
+        if loader is not self._loader:
+            return
+        self._loader = None
+        self._remove_placeholder()
+
+    def _cancel_loading(self):
+        """
+        Cancel a fetch in progress.
+
+        Children already listed are kept; listing resumes from the last of them.
+        """
+        if self._loader is None:
+            return
+        self._loader.cancel()
+        self._loader = None
+        self._remove_placeholder()
+
+
+class FilesFolderItem(FolderItem):
+    """
+    Folder Item listing the files of its container once it is first shown.
+    """
+
+    __slots__ = ("_listed",)
+
+    def __init__(self, parent_item):
+        """
+        Initialize FilesFolderItem unpopulated.
+
+        Args:
+            parent_item (ContainerItem): Container hosting the files.
+        """
+        super(FilesFolderItem, self).__init__(parent_item, "FILES")
+        self._listed = False
+
+    def can_fetch_more(self):
+        """
+        Check if the files are still to be listed.
+
+        Returns:
+            bool: True until the files are listed.
+        """
+        return not self._listed
+
+    def fetch_more(self):
+        """
+        List all file items of the container in a single batch.
+        """
+        self._listed = True
+        files = self.parent_item.container.files or []
+        self.appendRows([FileItem(self, fl) for fl in files])
+
+    def _relist(self):
+        """
+        List the files again, if they have been listed.
+        """
+        if self._listed:
+            self.removeRows(0, self.rowCount())
+            self.fetch_more()
 
 
 class AnalysisFolderItem(FolderItem):
@@ -36,6 +485,8 @@ class AnalysisFolderItem(FolderItem):
     Folder Item specifically for analyses.
     """
 
+    __slots__ = ()
+
     def __init__(self, parent_item):
         """
         Initialize AnalysisFolderItem unpopulated.
@@ -47,95 +498,157 @@ class AnalysisFolderItem(FolderItem):
         folder_name = "ANALYSES"
         super(AnalysisFolderItem, self).__init__(parent_item, folder_name)
         # TODO: put folder w/ download icon
-        icon_path = "resources/dwnld-folder.png"
-        icon = QtGui.QIcon(str(self.source_dir / icon_path))
-        self.setIcon(icon)
+        self.setIcon(get_icon("resources/dwnld-folder.png"))
         # TODO: ensure that these work.
         self.setToolTip("Double-Click to list Analyses.")
 
     def _dblclicked(self):
         if hasattr(self.parent_container, "analyses"):
-            self.parent_container = self.parent_container.reload()
-            icon_path = "resources/folder.png"
-            icon = QtGui.QIcon(str(self.source_dir / icon_path))
-            self.setIcon(icon)
-            if not self.hasChildren() and self.parent_container.analyses:
+            self.setIcon(get_icon("resources/folder.png"))
+            self._load_children(self._list_analyses, AnalysisItem)
 
-                for analysis in self.parent_container.analyses:
-                    AnalysisItem(self, analysis)
+    def _list_analyses(self):
+        """
+        Fetch the analyses of the parent container as compact records.
 
+        Runs on a worker thread.
 
-class ContainerItem(QtGui.QStandardItem):
+        Returns:
+            list: Analyses of the parent container.
+        """
+        return self.model().metadata_store.analyses(self.parent_container.id)
+
+
+class ContainerItem(TreeNode):
     """
     TreeView node to host all common functionality for Flywheel containers.
+
+    The FILES, ANALYSES and child container folders of a container are only created
+    once the container is first expanded. Items hold the compact record of their
+    container from the metadata store, which fetches the full container on demand.
     """
 
+    __slots__ = (
+        "has_analyses",
+        "parent_item",
+        "container",
+        "icon_path",
+        "child_container_name",
+        "child_class",
+        "filesItem",
+        "analysesItem",
+        "folderItem",
+        "_has_folders",
+    )
+
     def __init__(self, parent_item, container):
         """
         Initialize new container item with its parent and flywheel container object.
 
+        The item is added to the tree by its parent, in a batch with its siblings.
+
         Args:
-            parent_item (QtGui.QStandardItem): Parent of this item to instantiate.
+            parent_item (TreeNode): Parent of this item to instantiate.
             container (flywheel.Container): Flywheel container (e.g. group, project,...)
         """
         super(ContainerItem, self).__init__()
         self.has_analyses = False
         self.parent_item = parent_item
         self.container = container
-        self.source_dir = Path(os.path.realpath(__file__)).parents[1]
+        self._has_folders = False
         title = container.label
         self.setData(container.id)
         self.setText(title)
         self._set_icon()
-        self.parent_item.appendRow(self)
-        self._files_folder()
-        self._analyses_folder()
-        self._child_container_folder()
 
     def _set_icon(self):
         """
         Set the icon for the container item.
         """
-        icon = QtGui.QIcon(str(self.source_dir / self.icon_path))
-        self.setIcon(icon)
+        self.setIcon(get_icon(self.icon_path))
 
-    def _files_folder(self):
+    def can_fetch_more(self):
         """
-        Create a "FILES" folder if self.container has one.
+        Check if the folders of the container are still to be created.
+
+        Returns:
+            bool: True if the container has folders that are not yet created.
         """
-        if hasattr(self.container, "files"):
-            self.filesItem = FolderItem(self, "FILES")
+        return not self._has_folders and (
+            hasattr(self.container, "files")
+            or hasattr(self.container, "analyses")
+            or hasattr(self, "child_container_name")
+        )
 
-    def _list_files(self):
+    def fetch_more(self):
         """
-        List all file items of a container object under the "FILES" folder.
-        TODO: Make this a part of a filesFolderItem???
+        Create the folders of the container.
+        """
+        self._has_folders = True
+        folders = [
+            self._files_folder(),
+            self._analyses_folder(),
+            self._child_container_folder(),
+        ]
+        self.appendRows([folder for folder in folders if folder is not None])
+
+    def _files_folder(self):
+        """
+        Create a "FILES" folder if self.container has one.
+
+        Returns:
+            FilesFolderItem: The folder, or None.
         """
         if hasattr(self.container, "files"):
-            if not self.filesItem.hasChildren() and self.container.files:
-                for fl in self.container.files:
-                    FileItem(self.filesItem, fl)
+            self.filesItem = FilesFolderItem(self)
+            return self.filesItem
+        return None
 
     def _analyses_folder(self):
         """
         Create "ANALYSES" folder, if container has analyses object.
+
+        Returns:
+            AnalysisFolderItem: The folder, or None.
         """
         if hasattr(self.container, "analyses"):
             self.analysesItem = AnalysisFolderItem(self)
+            return self.analysesItem
+        return None
 
     def _child_container_folder(self):
         """
         Create a folder with the name of the child containers (e.g. SESSIONS)
+
+        Returns:
+            FolderItem: The folder, or None.
         """
         if hasattr(self, "child_container_name"):
-            self.folderItem = FolderItem(self, self.child_container_name)
+            self.folderItem = FolderItem(
+                self, self.child_container_name, self.child_class
+            )
+            return self.folderItem
+        return None
 
-    def _on_expand(self):
+    def _update_container(self, container):
         """
-        On expansion of container tree node, list all files.
+        Update the item with a changed version of its container.
+
+        Args:
+            container (flywheel.Container): Changed container.
         """
-        # super(ContainerItem, self)._on_expand()
-        self._list_files()
+        self.container = container
+        setattr(self, self.container_type, container)
+        self.setText(container.label)
+        if hasattr(self, "filesItem"):
+            self.filesItem._relist()
+
+    def _on_collapse(self):
+        """
+        On collapse of container tree node, cancel listing of child containers.
+        """
+        if hasattr(self, "folderItem"):
+            self.folderItem._cancel_loading()
 
 
 class GroupItem(ContainerItem):
@@ -143,40 +656,34 @@ class GroupItem(ContainerItem):
     TreeView Node for the functionality of group containers.
     """
 
+    __slots__ = ("group",)
+
+    container_type = "group"
+
     def __init__(self, parent_item, group):
         """
         Initialize Group Item with parent and group container.
 
         Args:
-            parent_item (QtGui.QStandardItemModel): Top-level tree item or model.
+            parent_item (TreeNode): Root of the tree.
             group (flywheel.Group): Flywheel group container to attach as tree node.
         """
         self.icon_path = "resources/group.png"
         self.child_container_name = "PROJECTS"
+        self.child_class = ProjectItem
         self.group = group
         super(GroupItem, self).__init__(parent_item, group)
 
-    def _list_projects(self):
-        """
-        Populate with flywheel projects.
-        """
-        if not self.folderItem.hasChildren():
-            for project in self.group.projects():
-                ProjectItem(self.folderItem, project)
-
-    def _on_expand(self):
-        """
-        On expansion of group tree node, list all projects.
-        """
-        super(GroupItem, self)._on_expand()
-        self._list_projects()
-
 
 class ProjectItem(ContainerItem):
     """
     TreeView Node for the functionality of Project containers.
     """
 
+    __slots__ = ("project",)
+
+    container_type = "project"
+
     def __init__(self, parent_item, project):
         """
         Initialize Project Item with parent and project container.
@@ -188,24 +695,24 @@ class ProjectItem(ContainerItem):
         """
         self.icon_path = "resources/project.png"
         self.child_container_name = "SUBJECTS"
+        self.child_class = SubjectItem
         super(ProjectItem, self).__init__(parent_item, project)
         self.has_analyses = True
         self.project = self.container
 
-    def _list_subjects(self):
-        """
-        Populate with flywheel subjects.
+    def fetch_more(self):
         """
-        if not self.folderItem.hasChildren():
-            for subject in self.project.subjects():
-                SubjectItem(self.folderItem, subject)
+        Create the folders of the project, fetching its snapshot if enabled.
 
-    def _on_expand(self):
-        """
-        On expansion of project tree node, list all subjects.
+        Once the snapshot is recorded, every container of the project is listed
+        from the metadata store.
         """
-        super(ProjectItem, self)._on_expand()
-        self._list_subjects()
+        super(ProjectItem, self).fetch_more()
+        model = self.model()
+        if model.snapshot_projects and model.metadata_store.is_stale(
+            self.container.id, "snapshot"
+        ):
+            self.folderItem._load_snapshot()
 
 
 class SubjectItem(ContainerItem):
@@ -213,6 +720,10 @@ class SubjectItem(ContainerItem):
     TreeView Node for the functionality of Subject containers.
     """
 
+    __slots__ = ("subject",)
+
+    container_type = "subject"
+
     def __init__(self, parent_item, subject):
         """
         Initialize Subject Item with parent and project container.
@@ -224,31 +735,21 @@ class SubjectItem(ContainerItem):
         """
         self.icon_path = "resources/subject.png"
         self.child_container_name = "SESSIONS"
+        self.child_class = SessionItem
         super(SubjectItem, self).__init__(parent_item, subject)
         self.has_analyses = True
         self.subject = self.container
 
-    def _list_sessions(self):
-        """
-        Populate with flywheel sessions.
-        """
-        if not self.folderItem.hasChildren():
-            for session in self.subject.sessions():
-                SessionItem(self.folderItem, session)
-
-    def _on_expand(self):
-        """
-        On expansion of subject tree node, list all sessions.
-        """
-        super(SubjectItem, self)._on_expand()
-        self._list_sessions()
-
 
 class SessionItem(ContainerItem):
     """
     TreeView Node for the functionality of Session containers.
     """
 
+    __slots__ = ("session",)
+
+    container_type = "session"
+
     def __init__(self, parent_item, session):
         """
         Initialize Session Item with parent and subject container.
@@ -260,31 +761,21 @@ class SessionItem(ContainerItem):
         """
         self.icon_path = "resources/session.png"
         self.child_container_name = "ACQUISITIONS"
+        self.child_class = AcquisitionItem
         super(SessionItem, self).__init__(parent_item, session)
         self.has_analyses = True
         self.session = self.container
 
-    def _list_acquisitions(self):
-        """
-        Populate with flywheel acquisitions.
-        """
-        if not self.folderItem.hasChildren():
-            for acquisition in self.session.acquisitions():
-                AcquisitionItem(self.folderItem, acquisition)
-
-    def _on_expand(self):
-        """
-        On expansion of session tree node, list all acquisitions.
-        """
-        super(SessionItem, self)._on_expand()
-        self._list_acquisitions()
-
 
 class AcquisitionItem(ContainerItem):
     """
     TreeView Node for the functionality of Acquisition containers.
     """
 
+    __slots__ = ("acquisition",)
+
+    container_type = "acquisition"
+
     def __init__(self, parent_item, acquisition):
         """
         Initialize Acquisition Item with parent and Acquisition container.
@@ -305,6 +796,10 @@ class AnalysisItem(ContainerItem):
     TreeView Node for the functionality of Analysis objects.
     """
 
+    __slots__ = ("analysis",)
+
+    container_type = "analysis"
+
     def __init__(self, parent_item, analysis):
         """
         Initialize Subject Item with parent and analysis object.
@@ -323,6 +818,10 @@ class FileItem(ContainerItem):
     TreeView Node for the functionality of File objects.
     """
 
+    __slots__ = ("file",)
+
+    container_type = "file"
+
     def __init__(self, parent_item, file_obj):
         """
         Initialize File Item with parent and file object.
@@ -335,15 +834,10 @@ class FileItem(ContainerItem):
         self.parent_item = parent_item
         self.container = file_obj
         self.file = file_obj
-        if self._is_cached():
-            self.icon_path = "resources/file_cached.png"
-        else:
-            self.icon_path = "resources/file.png"
+        self.icon_path = "resources/file.png"
         super(FileItem, self).__init__(parent_item, file_obj)
-        if self._is_cached():
-            self.setToolTip("File is cached.")
-        else:
-            self.setToolTip("File is not cached")
+        self._set_cached(self._is_cached())
+        parent_item.model().file_items[file_obj.id] = self
 
     def _get_cache_path(self):
         """
@@ -353,15 +847,7 @@ class FileItem(ContainerItem):
             pathlib.Path: Cache Path to file indicated.
         """
         file_parent = self.parent_item.parent().container
-        file_path = Path(os.path.expanduser("~") + "/flywheelIO/")
-
-        for par in ["group", "project", "subject", "session", "acquisition"]:
-            if file_parent.parents[par]:
-                file_path /= file_parent.parents[par]
-        file_path /= file_parent.id
-        file_path /= self.container.id
-        file_path /= self.container.name
-        return file_path
+        return get_cache_path(file_parent, self.container)
 
     def _is_cached(self):
         """
@@ -370,22 +856,87 @@ class FileItem(ContainerItem):
         Returns:
             bool: If file is cached locally on disk.
         """
-        return self._get_cache_path().exists()
+        cache_index = self.parent_item.model().cache_index
+        if cache_index.ready:
+            return cache_index.is_cached(self.container.id)
+        return cache_index.is_cached(self.container.id, self._get_cache_path())
 
-    def _add_to_cache(self):
+    def _is_stale(self):
         """
-        Add file to cache directory under path.
+        Check if the cached copy of the file is older than the listed file.
 
         Returns:
-            pathlib.Path: Path to file in cache.
+            bool: True if the file has been replaced since it was cached.
+        """
+        cache_index = self.parent_item.model().cache_index
+        return not cache_index.is_current(
+            self.container.id, self.container, self._get_cache_path()
+        )
+
+    def _file_ref(self):
+        """
+        Reference to the file, as used for the inputs of a flywheel analysis.
+
+        Returns:
+            dict: Type and id of the container hosting the file, and its name.
         """
-        file_path = self._get_cache_path()
         file_parent = self.parent_item.parent().container
-        if not file_path.exists():
-            if not file_path.parents[0].exists():
-                os.makedirs(file_path.parents[0])
-            file_parent.download_file(self.file.name, str(file_path))
+        return {
+            "type": file_parent.container_type,
+            "id": file_parent.id,
+            "name": self.file.name,
+        }
+
+    def _download_request(self):
+        """
+        Create a request to download the file into its cache path.
+
+        Returns:
+            DownloadRequest: Request for the download of the file.
+        """
+        file_parent = self.parent_item.parent().container
+        return DownloadRequest(
+            self.container.id,
+            file_parent,
+            self.file.name,
+            self._get_cache_path(),
+            size=self.file.size,
+            hash=self.file.hash,
+            version=getattr(self.file, "version", None),
+            modified=self.file.modified,
+        )
+
+    def _set_cached(self, cached):
+        """
+        Mark the file as cached, stale or not cached.
+
+        Args:
+            cached (bool): True if the file is cached.
+        """
+        if cached and self._is_stale():
+            self.icon_path = "resources/file_cached.png"
+            self.setForeground(QtGui.QBrush(QtGui.QColor("darkorange")))
+            self.setToolTip(
+                "Cached copy is out of date. "
+                "It will be downloaded again when opened."
+            )
+        elif cached:
             self.icon_path = "resources/file_cached.png"
+            self.setData(None, Qt.ForegroundRole)
             self.setToolTip("File is cached.")
-            self._set_icon()
-        return file_path
+        else:
+            self.icon_path = "resources/file.png"
+            self.setData(None, Qt.ForegroundRole)
+            self.setToolTip("File is not cached")
+        self._set_icon()
+
+    def _update_container(self, container):
+        """
+        Update the item with a changed version of its file.
+
+        Args:
+            container (flywheel.FileEntry): Changed file.
+        """
+        container.label = container.name
+        super(FileItem, self)._update_container(container)
+        self._set_cached(self._is_cached())
@@ -0,0 +1,178 @@
+import threading
+import time
+from urllib.parse import quote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from management.api_limiter import RETRY_STATUSES, RetryableStatus
+
+# API endpoint of the containers of each type
+CONTAINER_ENDPOINTS = {
+    "group": "groups",
+    "project": "projects",
+    "subject": "subjects",
+    "session": "sessions",
+    "acquisition": "acquisitions",
+    "analysis": "analyses",
+    "collection": "collections",
+}
+
+
+class TokenBucket:
+    """
+    Bandwidth limit shared by the threads transferring through it.
+    """
+
+    def __init__(self, rate):
+        """
+        Initialize a full bucket.
+
+        Args:
+            rate (float): Bytes per second allowed on average, with bursts of up to
+                a second's worth.
+        """
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, nbytes):
+        """
+        Take bytes out of the bucket, blocking until they are allowed.
+
+        Args:
+            nbytes (int): Bytes transferred.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class FlywheelHttp:
+    """
+    Direct HTTP access to the Flywheel API for streaming file transfers.
+
+    The SDK downloads files in a single blocking call. Streaming over HTTP allows
+    progress reporting, bounded memory and resuming with Range requests.
+    """
+
+    # Seconds to wait for a connection and between received bytes
+    timeout = (10, 60)
+
+    def __init__(
+        self, fw_client, pool_size=10, rate=None, host_rate=None, limiter=None
+    ):
+        """
+        Initialize an authenticated session from the credentials of a client.
+
+        Args:
+            fw_client (flywheel.Client): Logged in flywheel client.
+            pool_size (int, optional): Number of connections kept open to the
+                instance. Defaults to 10.
+            rate (float, optional): Bytes per second allowed across all transfers.
+                Defaults to None, for no limit.
+            host_rate (float, optional): Bytes per second allowed per host (e.g.
+                the instance or the storage it redirects to). Defaults to None,
+                for no limit.
+            limiter (AdaptiveLimiter, optional): Limiter of concurrent API
+                requests, which starting transfers go through. Defaults to None.
+        """
+        self.limiter = limiter
+        self.bucket = TokenBucket(rate) if rate else None
+        self.host_rate = host_rate
+        self.host_buckets = {}
+        api_client = getattr(fw_client, "api_client", None)
+        if api_client is None:
+            api_client = fw_client._fw.api_client
+        config = api_client.configuration
+        self.base_url = config.host.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = config.get_api_key_with_prefix(
+            "Authorization"
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def file_url(self, container, file_name):
+        """
+        URL of a file attached to a container.
+
+        Args:
+            container (flywheel.Container): Container hosting the file.
+            file_name (str): Name of the file.
+
+        Returns:
+            str: URL to download the file from.
+        """
+        return "{}/{}/{}/files/{}".format(
+            self.base_url,
+            CONTAINER_ENDPOINTS[container.container_type],
+            container.id,
+            quote(file_name),
+        )
+
+    def get(self, url, offset=0):
+        """
+        Start streaming a download.
+
+        Starting the request goes through the limiter, if any, and is retried if
+        the instance throttles or fails it. The transfer itself holds no slot.
+
+        Args:
+            url (str): URL to download.
+            offset (int, optional): Byte offset to resume the download from.
+                Defaults to 0.
+
+        Returns:
+            requests.Response: Streamed response.
+        """
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        if self.limiter is None:
+            return self._get(url, headers)
+        return self.limiter.call(self._get, url, headers)
+
+    def _get(self, url, headers):
+        """
+        Send a streamed GET request.
+
+        Args:
+            url (str): URL to download.
+            headers (dict): Headers of the request.
+
+        Returns:
+            requests.Response: Streamed response.
+
+        Raises:
+            RetryableStatus: If the instance throttled or failed the request.
+        """
+        response = self.session.get(
+            url, headers=headers, stream=True, timeout=self.timeout
+        )
+        if response.status_code in RETRY_STATUSES:
+            response.close()
+            raise RetryableStatus(response)
+        return response
+
+    def throttle(self, url, nbytes):
+        """
+        Hold a transfer back to the global and per-host bandwidth limits.
+
+        Args:
+            url (str): URL the bytes were transferred from.
+            nbytes (int): Bytes transferred.
+        """
+        if self.bucket is not None:
+            self.bucket.consume(nbytes)
+        if self.host_rate:
+            host = urlparse(url).netloc
+            bucket = self.host_buckets.get(host)
+            if bucket is None:
+                bucket = self.host_buckets.setdefault(host, TokenBucket(self.host_rate))
+            bucket.consume(nbytes)
@@ -0,0 +1,587 @@
+import json
+import sqlite3
+import threading
+import time
+
+PARENT_TYPES = ["group", "project", "subject", "session", "acquisition"]
+
+# Client method listing each type of child container by the id of its parent
+CHILD_LISTINGS = {
+    "project": "get_group_projects",
+    "subject": "get_project_subjects",
+    "session": "get_subject_sessions",
+    "acquisition": "get_session_acquisitions",
+}
+
+# Type of the parent and client method listing the containers of each type across
+# projects, as fetched for project snapshots
+SNAPSHOT_LISTINGS = {
+    "subject": ("project", "get_all_subjects"),
+    "session": ("subject", "get_all_sessions"),
+    "acquisition": ("session", "get_all_acquisitions"),
+}
+
+# Container types hosting files and analyses
+FILE_HOSTS = ["project", "subject", "session", "acquisition"]
+
+
+class StoredFile:
+    """
+    File entry of a container as recorded in the metadata store.
+    """
+
+    __slots__ = (
+        "id",
+        "name",
+        "label",
+        "type",
+        "modality",
+        "size",
+        "hash",
+        "version",
+        "modified",
+    )
+
+    def __init__(self, record):
+        """
+        Initialize file entry from its record.
+
+        Args:
+            record (dict): Recorded attributes of the file.
+        """
+        self.id = record["id"]
+        self.name = record["name"]
+        self.label = record["name"]
+        self.type = record.get("type")
+        self.modality = record.get("modality")
+        self.size = record.get("size")
+        self.hash = record.get("hash")
+        self.version = record.get("version")
+        self.modified = record.get("modified")
+
+    @staticmethod
+    def record(file_obj):
+        """
+        Record the attributes of a flywheel file entry.
+
+        Args:
+            file_obj (flywheel.FileEntry): File entry to record.
+
+        Returns:
+            dict: Recorded attributes of the file.
+        """
+        return {
+            "id": file_obj.id,
+            "name": file_obj.name,
+            "type": file_obj.type,
+            "modality": file_obj.modality,
+            "size": file_obj.size,
+            "hash": file_obj.hash,
+            "version": getattr(file_obj, "version", None),
+            "modified": str(file_obj.modified),
+        }
+
+
+class StoredContainer:
+    """
+    Flywheel container as recorded in the metadata store.
+
+    Only labels, parents and file listings are recorded, in a compact record. The
+    files of a container read from the store are only read back when listed.
+    Accessing anything else (e.g. download_file or reload) fetches the full
+    container from the instance.
+    """
+
+    __slots__ = (
+        "id",
+        "label",
+        "container_type",
+        "parents",
+        "modified",
+        "analyses",
+        "_has_files",
+        "_file_records",
+        "_store",
+        "_fw_client",
+        "_container",
+    )
+
+    def __init__(self, record, fw_client, store=None):
+        """
+        Initialize container from its record.
+
+        Args:
+            record (dict): Recorded attributes of the container.
+            fw_client (flywheel.Client): Client to fetch the full container with.
+            store (MetadataStore, optional): Store the container is recorded in, to
+                read its files from. Defaults to None.
+        """
+        self.id = record["id"]
+        self.label = record["label"]
+        self.container_type = record["container_type"]
+        self.parents = record["parents"]
+        self.modified = record["modified"]
+        self._has_files = record["files"] is not None
+        self._file_records = None if store else record["files"]
+        self._store = store
+        if self.container_type in FILE_HOSTS:
+            # Analyses are always reloaded from the instance.
+            self.analyses = None
+        self._fw_client = fw_client
+        self._container = None
+
+    @property
+    def files(self):
+        """
+        File entries of the container.
+
+        Returns:
+            list: StoredFiles of the container.
+        """
+        if not self._has_files:
+            raise AttributeError("files")
+        records = self._file_records
+        if self._store is not None:
+            records = self._store.file_records(self.id)
+        return [StoredFile(fl) for fl in records]
+
+    def __getattr__(self, name):
+        """
+        Fetch the full flywheel container for any attribute that is not recorded.
+
+        Args:
+            name (str): Name of the attribute.
+
+        Returns:
+            object: Attribute of the full flywheel container.
+        """
+        if name.startswith("_") or name in ["files", "analyses"]:
+            raise AttributeError(name)
+        if self._container is None:
+            self._container = self._fw_client.get(self.id)
+        return getattr(self._container, name)
+
+    @staticmethod
+    def record(container, container_type):
+        """
+        Record the attributes of a flywheel container.
+
+        Args:
+            container (flywheel.Container): Container to record.
+            container_type (str): Type of the container (e.g. session).
+
+        Returns:
+            dict: Recorded attributes of the container.
+        """
+        if container_type == "group":
+            parents = {par: None for par in PARENT_TYPES}
+        else:
+            parents = {par: container.parents[par] for par in PARENT_TYPES}
+        files = None
+        if container_type in FILE_HOSTS + ["analysis"]:
+            files = [StoredFile.record(fl) for fl in container.files or []]
+        return {
+            "id": container.id,
+            "label": container.label,
+            "container_type": container_type,
+            "parents": parents,
+            "modified": str(getattr(container, "modified", None)),
+            "files": files,
+        }
+
+
+class MetadataStore:
+    """
+    On-disk store of the flywheel container hierarchy.
+
+    Listings of child containers are recorded with the time they were fetched, so
+    the tree can be rendered from the store and revalidated once a listing is older
+    than the time-to-live of its level. Listings are fetched and read in pages, so
+    containers with many children are shown as soon as their first page arrives.
+    """
+
+    # Number of child containers fetched per request when revalidating a listing
+    page_size = 1000
+
+    def __init__(self, db_path, fw_client, ttls):
+        """
+        Open (or create) the metadata store.
+
+        Args:
+            db_path (pathlib.Path): Path to the SQLite database.
+            fw_client (flywheel.Client): Client to fetch containers with.
+            ttls (dict): Seconds listings are fresh for, by child container type.
+        """
+        self.db_path = db_path
+        self.fw_client = fw_client
+        self.ttls = ttls
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS containers ("
+                "id TEXT PRIMARY KEY, parent_id TEXT, container_type TEXT, "
+                "label TEXT, modified TEXT, fetched_at REAL, record TEXT)"
+            )
+            # Listings are read in pages ordered by label
+            self.conn.execute("DROP INDEX IF EXISTS containers_parent")
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS containers_listing "
+                "ON containers (parent_id, container_type, label, id)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS listings ("
+                "parent_id TEXT, container_type TEXT, fetched_at REAL, "
+                "PRIMARY KEY (parent_id, container_type))"
+            )
+
+    def children(self, parent_id, container_type, limit=None, after=None):
+        """
+        List the recorded child containers of a container, ordered by label.
+
+        Args:
+            parent_id (str): Id of the parent container (None for groups).
+            container_type (str): Type of the child containers.
+            limit (int, optional): Maximum number of children to list. Defaults to
+                None.
+            after (tuple, optional): Label and id of the last child of the previous
+                page. Defaults to None.
+
+        Returns:
+            list: StoredContainers, or None if the listing was never recorded.
+        """
+        query = (
+            "SELECT record FROM containers WHERE parent_id IS ? AND container_type = ?"
+        )
+        params = [parent_id, container_type]
+        if after is not None:
+            query += " AND (label > ? OR (label = ? AND id > ?))"
+            params += [after[0], after[0], after[1]]
+        query += " ORDER BY label, id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self.lock:
+            if self._fetched_at(parent_id, container_type) is None:
+                return None
+            rows = self.conn.execute(query, params).fetchall()
+        return [
+            StoredContainer(json.loads(row[0]), self.fw_client, self) for row in rows
+        ]
+
+    def label(self, container_id):
+        """
+        Recorded label of a container.
+
+        Args:
+            container_id (str): Id of the container.
+
+        Returns:
+            str: Label of the container, or None if it is not recorded.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT label FROM containers WHERE id = ?", (container_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def file_records(self, container_id):
+        """
+        Recorded files of a container.
+
+        Args:
+            container_id (str): Id of the container.
+
+        Returns:
+            list: Recorded attributes of each file.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT record FROM containers WHERE id = ?", (container_id,)
+            ).fetchone()
+        return (json.loads(row[0])["files"] or []) if row else []
+
+    def has_listing(self, parent_id, container_type):
+        """
+        Check if a listing of child containers has been recorded.
+
+        Args:
+            parent_id (str): Id of the parent container (None for groups).
+            container_type (str): Type of the child containers.
+
+        Returns:
+            bool: True if all children of the container have been recorded once.
+        """
+        with self.lock:
+            return self._fetched_at(parent_id, container_type) is not None
+
+    def is_stale(self, parent_id, container_type):
+        """
+        Check if a listing of child containers needs to be revalidated.
+
+        Args:
+            parent_id (str): Id of the parent container (None for groups).
+            container_type (str): Type of the child containers.
+
+        Returns:
+            bool: True if the listing is missing or older than its time-to-live.
+        """
+        with self.lock:
+            fetched_at = self._fetched_at(parent_id, container_type)
+        if fetched_at is None:
+            return True
+        return time.time() - fetched_at > self.ttls.get(container_type, 0)
+
+    def _fetched_at(self, parent_id, container_type):
+        """
+        Time a listing of child containers was fetched.
+
+        Args:
+            parent_id (str): Id of the parent container (None for groups).
+            container_type (str): Type of the child containers.
+
+        Returns:
+            float: Time of the fetch, or None if the listing was never recorded.
+        """
+        # Listings of groups are keyed by "" as NULLs are never equal in keys
+        row = self.conn.execute(
+            "SELECT fetched_at FROM listings WHERE parent_id = ? AND container_type = ?",
+            (parent_id or "", container_type),
+        ).fetchone()
+        return row[0] if row else None
+
+    def fetch_children(self, parent_id, container_type):
+        """
+        Fetch all child containers from the instance and record them in the store.
+
+        Blocks on the flywheel instance; intended to run on a worker thread.
+
+        Args:
+            parent_id (str): Id of the parent container (None for groups).
+            container_type (str): Type of the child containers.
+
+        Returns:
+            list: StoredContainers of the fetched children.
+        """
+        started = time.time()
+        containers = []
+        after_id = None
+        while True:
+            page, complete = self.fetch_page(
+                parent_id, container_type, self.page_size, after_id, started
+            )
+            containers += page
+            if complete:
+                return containers
+            after_id = page[-1].id
+
+    def fetch_page(self, parent_id, container_type, limit, after_id=None, started=None):
+        """
+        Fetch a page of child containers from the instance and record it.
+
+        Pages follow each other by the id of the last child of the previous page.
+        Once the last page is recorded, children that were not listed since the
+        listing started are removed and the listing is recorded as fetched.
+
+        Blocks on the flywheel instance; intended to run on a worker thread.
+
+        Args:
+            parent_id (str): Id of the parent container (None for groups).
+            container_type (str): Type of the child containers.
+            limit (int): Maximum number of children to fetch. Groups are fetched in
+                a single page.
+            after_id (str, optional): Id of the last child of the previous page.
+                Defaults to None.
+            started (float, optional): Time the first page was requested. Defaults
+                to the time of this request.
+
+        Returns:
+            tuple: StoredContainers of the page, and True if it is the last page.
+        """
+        started = started or time.time()
+        if container_type == "group":
+            containers = self.fw_client.groups()
+            complete = True
+        else:
+            method = getattr(self.fw_client, CHILD_LISTINGS[container_type])
+            kwargs = {"limit": limit}
+            if after_id is not None:
+                kwargs["after_id"] = after_id
+            containers = method(parent_id, **kwargs)
+            complete = len(containers) < limit
+        records = [StoredContainer.record(c, container_type) for c in containers]
+        self.put_page(parent_id, container_type, records, started, complete)
+        containers = [
+            StoredContainer(record, self.fw_client, self) for record in records
+        ]
+        return containers, complete
+
+    def fetch_project_snapshot(self, project_id):
+        """
+        Fetch the whole hierarchy of a project and record every listing in it.
+
+        Subjects, sessions and acquisitions are each listed across the project in
+        pages of page_size, rather than with a request per parent container. List
+        endpoints leave out the info of containers, so only the skeleton of the
+        project (labels, parents and files) is fetched. Once a level is listed, the
+        listings of all of its parents are recorded, so that expanding any
+        container of the project is served from the store.
+
+        Blocks on the flywheel instance; intended to run on a worker thread.
+
+        Args:
+            project_id (str): Id of the project.
+
+        Returns:
+            list: StoredContainers of the subjects of the project.
+        """
+        started = time.time()
+        parent_ids = [project_id]
+        for container_type, (parent_type, listing) in SNAPSHOT_LISTINGS.items():
+            method = getattr(self.fw_client, listing)
+            kwargs = {
+                "filter": f"parents.project={project_id}",
+                "limit": self.page_size,
+            }
+            container_ids = []
+            while True:
+                containers = method(**kwargs)
+                pages = {}
+                for container in containers:
+                    record = StoredContainer.record(container, container_type)
+                    pages.setdefault(record["parents"][parent_type], []).append(record)
+                    container_ids.append(record["id"])
+                with self.lock, self.conn:
+                    for parent_id, records in pages.items():
+                        self._put_page(
+                            parent_id, container_type, records, started, False
+                        )
+                if len(containers) < self.page_size:
+                    break
+                kwargs["after_id"] = containers[-1].id
+            # Parents without any listed child have an empty listing
+            with self.lock, self.conn:
+                for parent_id in parent_ids:
+                    self._put_page(parent_id, container_type, [], started, True)
+            parent_ids = container_ids
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO listings VALUES (?, ?, ?)",
+                (project_id, "snapshot", time.time()),
+            )
+        return self.children(project_id, "subject")
+
+    def analyses(self, container_id):
+        """
+        Fetch the analyses of a container from the instance.
+
+        Analyses are not stored, as they are always listed from the instance.
+        Blocks on the flywheel instance; intended to run on a worker thread.
+
+        Args:
+            container_id (str): Id of the container hosting the analyses.
+
+        Returns:
+            list: StoredContainers of the analyses.
+        """
+        analyses = self.fw_client.get(container_id).analyses or []
+        return [
+            StoredContainer(
+                StoredContainer.record(analysis, "analysis"), self.fw_client
+            )
+            for analysis in analyses
+        ]
+
+    def put_page(self, parent_id, container_type, records, started, complete):
+        """
+        Record a page of the listing of child containers of a container.
+
+        Args:
+            parent_id (str): Id of the parent container (None for groups).
+            container_type (str): Type of the child containers.
+            records (list): Recorded attributes of each child container.
+            started (float): Time the first page of the listing was requested.
+            complete (bool): True if this is the last page of the listing.
+        """
+        with self.lock, self.conn:
+            self._put_page(parent_id, container_type, records, started, complete)
+
+    def _put_page(self, parent_id, container_type, records, started, complete):
+        """
+        Write a page of a listing into the open transaction.
+
+        Args:
+            parent_id (str): Id of the parent container (None for groups).
+            container_type (str): Type of the child containers.
+            records (list): Recorded attributes of each child container.
+            started (float): Time the first page of the listing was requested.
+            complete (bool): True if this is the last page of the listing.
+        """
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO containers VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    record["id"],
+                    parent_id,
+                    container_type,
+                    record["label"],
+                    record["modified"],
+                    now,
+                    json.dumps(record),
+                )
+                for record in records
+            ],
+        )
+        if not complete:
+            return
+        self.conn.execute(
+            "DELETE FROM containers WHERE parent_id IS ? AND container_type = ? "
+            "AND fetched_at < ?",
+            (parent_id, container_type, started),
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO listings VALUES (?, ?, ?)",
+            (parent_id or "", container_type, now),
+        )
+
+    def export_snapshot(self, snapshot_path):
+        """
+        Export the store to a standalone snapshot for other workstations.
+
+        Args:
+            snapshot_path (str): Path of the snapshot database to write.
+        """
+        snapshot = sqlite3.connect(str(snapshot_path))
+        with self.lock:
+            self.conn.backup(snapshot)
+        snapshot.close()
+
+    def import_snapshot(self, snapshot_path):
+        """
+        Merge a snapshot into the store, keeping whichever record is newer.
+
+        Args:
+            snapshot_path (str): Path of the snapshot database to import.
+        """
+        with self.lock:
+            self.conn.execute("ATTACH DATABASE ? AS snapshot", (str(snapshot_path),))
+            try:
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT INTO containers SELECT * FROM snapshot.containers "
+                        "WHERE true ON CONFLICT (id) DO UPDATE SET "
+                        "parent_id = excluded.parent_id, "
+                        "container_type = excluded.container_type, "
+                        "label = excluded.label, modified = excluded.modified, "
+                        "fetched_at = excluded.fetched_at, record = excluded.record "
+                        "WHERE excluded.fetched_at > containers.fetched_at"
+                    )
+                    self.conn.execute(
+                        "INSERT INTO listings SELECT * FROM snapshot.listings "
+                        "WHERE true ON CONFLICT (parent_id, container_type) "
+                        "DO UPDATE SET fetched_at = excluded.fetched_at "
+                        "WHERE excluded.fetched_at > listings.fetched_at"
+                    )
+            finally:
+                self.conn.execute("DETACH DATABASE snapshot")
@@ -0,0 +1,395 @@
+import copy
+import json
+import os
+import shutil
+import time
+import uuid
+from functools import partial
+from pathlib import Path
+
+import docker
+from PyQt5.QtCore import QThreadPool, QTimer
+
+from management.error_reporting import report_error
+from management.workers import Worker
+
+# Home directory of the user in the novnc containers
+CONTAINER_HOME = "/home/researcher"
+# Label of the containers started by the pool, valued by the launcher run
+POOL_LABEL = "fw-app-launcher.pool"
+# Description of the session of a container handed to the user, in its control
+# directory. Its presence marks the container as claimed.
+SESSION_FILE = "session.json"
+
+
+def container_path(cache_dir, path):
+    """
+    Translate a path in the cache to its path in a novnc container.
+
+    Args:
+        cache_dir (pathlib.Path): Root directory of the cache.
+        path (str): Path to a file in the cache.
+
+    Returns:
+        str: Path to the file in the container.
+    """
+    relative = Path(path).relative_to(cache_dir).as_posix()
+    return f"{CONTAINER_HOME}/flywheelIO/{relative}"
+
+
+class NovncPool:
+    """
+    Pool of pre-started novnc containers, ready to open files without a cold start.
+
+    Apps whose novnc configuration has a control script are kept warm: the script
+    runs inside the app and loads the files the launcher writes to a control
+    directory mounted in the container. A launch claims a warm container, hands it
+    the files and refills the pool in the background. Warm containers are removed
+    once no launch of their image has happened for the idle timeout.
+
+    Every container gets a unique name and docker-assigned host ports, so any number
+    of claimed containers can run side by side until their session is stopped.
+    """
+
+    # Milliseconds between checks for idle warm containers
+    reap_interval = 60 * 1000
+
+    def __init__(self, cache_dir, source_dir, size, idle_timeout):
+        """
+        Initialize pool and remove warm containers left by previous runs.
+
+        Args:
+            cache_dir (pathlib.Path): Root directory of the cache.
+            source_dir (pathlib.Path): Directory of the launcher sources.
+            size (int): Number of warm containers to keep per image.
+            idle_timeout (int): Seconds after the last launch of an image that its
+                warm containers are kept.
+        """
+        self.cache_dir = cache_dir
+        self.control_root = cache_dir / ".novnc"
+        self.source_dir = source_dir
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.run_id = uuid.uuid4().hex
+        self.client = None
+        self.app_defs = {}
+        self.warm = {}
+        self.starting = {}
+        self.last_used = {}
+        self.workers = set()
+
+        self.reap_timer = QTimer()
+        self.reap_timer.setInterval(self.reap_interval)
+        self.reap_timer.timeout.connect(self.reap)
+        self.reap_timer.start()
+        self._run(self._remove_stale)
+
+    def _client(self):
+        """
+        Docker client shared by the pool, connected on first use.
+
+        Returns:
+            docker.DockerClient: Docker client.
+        """
+        if self.client is None:
+            self.client = docker.from_env()
+        return self.client
+
+    def _run(self, fn, *args, on_result=None, on_finished=None):
+        """
+        Run a blocking docker operation on a worker thread.
+
+        Args:
+            fn (callable): Function to run.
+            *args: Arguments to fn.
+            on_result (callable, optional): Called with the result of fn.
+                Defaults to None.
+            on_finished (callable, optional): Called once fn has returned or
+                failed. Defaults to None.
+        """
+        worker = Worker(fn, *args)
+        if on_result:
+            worker.signals.batch.connect(on_result)
+        worker.signals.error.connect(report_error)
+        if on_finished:
+            worker.signals.finished.connect(on_finished)
+        worker.signals.finished.connect(partial(self.workers.discard, worker))
+        self.workers.add(worker)
+        QThreadPool.globalInstance().start(worker)
+
+    def register(self, app_def):
+        """
+        Keep warm containers of an app's image.
+
+        Args:
+            app_def (dict): Novnc launch configuration of the app on this platform.
+        """
+        if not app_def.get("control_script"):
+            return
+        image = app_def["docker-image"]
+        self.app_defs[image] = app_def
+        self.last_used.setdefault(image, time.monotonic())
+        self.refill(image)
+
+    def refill(self, image):
+        """
+        Start warm containers of an image until the pool is full.
+
+        Args:
+            image (str): Docker image of the app.
+        """
+        if time.monotonic() - self.last_used[image] > self.idle_timeout:
+            return
+        warm = self.warm.setdefault(image, [])
+        missing = self.size - len(warm) - self.starting.get(image, 0)
+        for _ in range(missing):
+            self.starting[image] = self.starting.get(image, 0) + 1
+            self._run(
+                self._start_container,
+                self.app_defs[image],
+                on_result=warm.append,
+                on_finished=partial(self._started, image),
+            )
+
+    def _started(self, image):
+        """
+        Record that a warm container has started (or failed to).
+
+        Args:
+            image (str): Docker image of the app.
+        """
+        self.starting[image] -= 1
+
+    def launch(self, app_def, request, session_info, on_launched):
+        """
+        Open files in a warm container of an app, starting one if none is warm.
+
+        Args:
+            app_def (dict): Novnc launch configuration of the app on this platform.
+            request (dict): Scene and files to load, as paths in the container.
+            session_info (dict): Description of the session (e.g. app_name).
+            on_launched (callable): Called with the claimed container and the
+                description of its session, including the URL of its novnc page.
+        """
+        image = app_def["docker-image"]
+        self.app_defs[image] = app_def
+        self.last_used[image] = time.monotonic()
+        warm = self.warm.get(image)
+        container = warm.pop(0) if warm else None
+        self._run(
+            self._claim,
+            app_def,
+            container,
+            request,
+            session_info,
+            on_result=lambda result: on_launched(*result),
+        )
+        self.refill(image)
+
+    def adopt(self, on_session):
+        """
+        Report the claimed containers still running from previous launcher runs.
+
+        Args:
+            on_session (callable): Called with each container and the description
+                of its session.
+        """
+        self._run(
+            self._claimed_sessions,
+            on_result=lambda sessions: [on_session(*s) for s in sessions],
+        )
+
+    def stop(self, container, on_stopped=None):
+        """
+        Remove a claimed container in the background.
+
+        Args:
+            container (docker.models.containers.Container): Container to remove.
+            on_stopped (callable, optional): Called once removed. Defaults to None.
+        """
+        self._run(self._remove, [container], on_finished=on_stopped)
+
+    def status(self, container):
+        """
+        Current status of a container. Blocks on the docker daemon.
+
+        Args:
+            container (docker.models.containers.Container): Container to check.
+
+        Returns:
+            str: Status of the container (e.g. running, exited or removed).
+        """
+        try:
+            container.reload()
+        except docker.errors.NotFound:
+            return "removed"
+        return container.status
+
+    def reap(self):
+        """
+        Remove the warm containers of images that have not been launched recently.
+        """
+        now = time.monotonic()
+        for image, warm in self.warm.items():
+            if warm and now - self.last_used[image] > self.idle_timeout:
+                self._run(self._remove, list(warm))
+                warm.clear()
+
+    def shutdown(self):
+        """
+        Remove all warm containers. Claimed containers are left to the user.
+        """
+        containers = [c for warm in self.warm.values() for c in warm]
+        self.warm.clear()
+        try:
+            self._remove(containers)
+        except Exception as e:
+            report_error(e)
+
+    def _start_container(self, app_def, claimed=False):
+        """
+        Start a container of an app with its control directory.
+
+        Runs on a worker thread.
+
+        Args:
+            app_def (dict): Novnc launch configuration of the app on this platform.
+            claimed (bool, optional): True if the container is started for a
+                launch rather than to be kept warm. Defaults to False.
+
+        Returns:
+            docker.models.containers.Container: Started container.
+        """
+        docker_kwargs = copy.deepcopy(app_def["docker_kwargs"])
+        name = f"{docker_kwargs['name']}-{uuid.uuid4().hex[:8]}"
+        control_dir = self.control_root / name
+        control_dir.mkdir(parents=True)
+        script = self.source_dir / app_def["control_script"]
+        shutil.copy(script, control_dir / script.name)
+        if claimed:
+            # Claimed until the session is described by _claim
+            with open(control_dir / SESSION_FILE, "w") as fp:
+                json.dump({}, fp)
+
+        docker_kwargs.update(
+            {
+                "name": name,
+                "detach": True,
+                # Let docker assign free host ports
+                "ports": {port: None for port in docker_kwargs.get("ports", {})},
+                "volumes": {
+                    str(self.cache_dir): {
+                        "bind": f"{CONTAINER_HOME}/flywheelIO/",
+                        "mode": "ro",
+                    },
+                    str(control_dir): {
+                        "bind": f"{CONTAINER_HOME}/.launcher",
+                        "mode": "rw",
+                    },
+                },
+                "environment": app_def.get("control_env", {}),
+                "labels": {POOL_LABEL: self.run_id},
+            }
+        )
+        container = self._client().containers.run(
+            app_def["docker-image"], **docker_kwargs
+        )
+        container.reload()
+        return container
+
+    def _claim(self, app_def, container, request, session_info):
+        """
+        Hand files to a warm container, or to a new one if it is gone.
+
+        Runs on a worker thread.
+
+        Args:
+            app_def (dict): Novnc launch configuration of the app on this platform.
+            container (docker.models.containers.Container): Warm container, or None
+                to start one.
+            request (dict): Scene and files to load, as paths in the container.
+            session_info (dict): Description of the session (e.g. app_name).
+
+        Returns:
+            tuple: Claimed container and the description of its session.
+        """
+        if container is not None and self.status(container) != "running":
+            self._remove([container])
+            container = None
+        if container is None:
+            container = self._start_container(app_def, claimed=True)
+
+        port = next(iter(app_def["docker_kwargs"]["ports"]))
+        if "/" not in port:
+            port += "/tcp"
+        host_port = container.ports[port][0]["HostPort"]
+        session_info = dict(
+            session_info,
+            url=(
+                f"http://localhost:{host_port}/x11/vnc.html"
+                "?autoconnect=true&path=x11/websockify"
+            ),
+        )
+
+        control_dir = self.control_root / container.name
+        with open(control_dir / SESSION_FILE, "w") as fp:
+            json.dump(session_info, fp)
+        tmp_path = control_dir / "load.json.part"
+        with open(tmp_path, "w") as fp:
+            json.dump(request, fp)
+        os.replace(tmp_path, control_dir / "load.json")
+        return container, session_info
+
+    def _remove(self, containers):
+        """
+        Remove containers and their control directories.
+
+        Args:
+            containers (list): Containers to remove.
+        """
+        for container in containers:
+            try:
+                container.remove(force=True)
+            except docker.errors.APIError as e:
+                report_error(e)
+            shutil.rmtree(self.control_root / container.name, ignore_errors=True)
+
+    def _remove_stale(self):
+        """
+        Remove warm containers left by previous runs of the launcher.
+
+        Runs on a worker thread.
+        """
+        containers = self._client().containers.list(
+            all=True, filters={"label": POOL_LABEL}
+        )
+        self._remove(
+            [
+                container
+                for container in containers
+                if container.labels.get(POOL_LABEL) != self.run_id
+                and not (self.control_root / container.name / SESSION_FILE).exists()
+            ]
+        )
+
+    def _claimed_sessions(self):
+        """
+        List the running claimed containers and the descriptions of their sessions.
+
+        Runs on a worker thread.
+
+        Returns:
+            list: Tuples of each container and the description of its session.
+        """
+        sessions = []
+        containers = self._client().containers.list(filters={"label": POOL_LABEL})
+        for container in containers:
+            session_file = self.control_root / container.name / SESSION_FILE
+            try:
+                with open(session_file, "r") as fp:
+                    session_info = json.load(fp)
+            except (OSError, ValueError):
+                continue
+            if session_info.get("url"):
+                sessions.append((container, session_info))
+        return sessions
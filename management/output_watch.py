@@ -0,0 +1,68 @@
+from pathlib import Path
+
+from PyQt5.QtCore import QFileSystemWatcher, QTimer
+
+
+class OutputWatcher:
+    """
+    Watch the output directory of an analysis (inotify on Linux) for settled writes.
+
+    Every change to the directory or to one of its files restarts a debounce timer,
+    so the outputs are only reported as settled once the app has stopped writing to
+    them for the debounce interval.
+    """
+
+    # Milliseconds without changes before the outputs are considered settled
+    debounce = 5000
+
+    def __init__(self, output_dir, on_settled):
+        """
+        Start watching an output directory.
+
+        Args:
+            output_dir (str): Output directory of the analysis.
+            on_settled (callable): Called once the outputs have settled after a
+                change.
+        """
+        self.output_dir = output_dir
+        self.on_settled = on_settled
+        self.watcher = QFileSystemWatcher([output_dir])
+        self.watcher.directoryChanged.connect(self._changed)
+        self.watcher.fileChanged.connect(self._changed)
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.debounce)
+        self.timer.timeout.connect(self.on_settled)
+        self._watch_files()
+
+    def stop(self):
+        """
+        Stop watching the output directory.
+        """
+        self.timer.stop()
+        paths = self.watcher.directories() + self.watcher.files()
+        if paths:
+            self.watcher.removePaths(paths)
+
+    def _changed(self, path):
+        """
+        Restart the debounce timer on any change to the outputs.
+
+        Args:
+            path (str): Changed directory or file.
+        """
+        self._watch_files()
+        self.timer.start()
+
+    def _watch_files(self):
+        """
+        Watch every file of the output directory, including newly created ones.
+        """
+        watched = set(self.watcher.files())
+        files = [
+            str(path)
+            for path in Path(self.output_dir).glob("*")
+            if path.is_file() and str(path) not in watched
+        ]
+        if files:
+            self.watcher.addPaths(files)
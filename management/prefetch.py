@@ -0,0 +1,273 @@
+from collections import deque
+from fnmatch import fnmatch
+
+from PyQt5.QtCore import QThreadPool, QTimer
+
+from management.cache_management import get_cache_path
+from management.download_management import PRIORITY_PREFETCH, DownloadRequest
+from management.error_reporting import report_error
+from management.subtree_caching import CacheFilters
+from management.workers import Worker
+
+
+class Prefetcher:
+    """
+    Warm the metadata store, and optionally the cache, with what is likely to be
+    opened next in the tree.
+
+    As a container is expanded, the listings of its children and of its siblings'
+    children are fetched. As a folder is expanded, the listings of the children of
+    the containers it lists are fetched, including the containers it lists once it
+    has loaded. Files of listed containers that match the
+    "usually opened" patterns are then cached, throttled to a bandwidth and within
+    a budget per launcher session.
+
+    Prefetching runs one request at a time: listings on a dedicated thread, files
+    through the download engine at the lowest priority, so any other download
+    preempts them. It waits while other downloads are pending. Predictions left
+    over are dropped as soon as another node is expanded.
+    """
+
+    # Maximum number of listings prefetched per expanded node
+    max_listings = 20
+    # Milliseconds between checks for other downloads to be over
+    retry_interval = 1000
+
+    def __init__(self, main_window):
+        """
+        Initialize an idle prefetcher from the launcher settings.
+
+        Args:
+            main_window (AppLauncher): Main window with the metadata store, cache
+                index and download engine.
+        """
+        settings = main_window.settings
+        self.metadata_store = main_window.metadata_store
+        self.cache_index = main_window.cache_index
+        self.download_management = main_window.download_management
+        self.enabled = settings["prefetch_metadata"]
+        self.patterns = settings["prefetch_files"]
+        self.rate = settings["prefetch_bandwidth_mb"] * 1e6
+        self.budget = int(settings["prefetch_budget_gb"] * 2**30)
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(1)
+        # Listings as (parent id, child container type) and files as DownloadRequests
+        self.listings = deque()
+        self.files = deque()
+        # Folder whose loaded children are predicted, and listings predicted for it
+        self.expanded = None
+        self.predicted = 0
+        self.current = None
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._next)
+
+    def busy(self):
+        """
+        Check if downloads other than prefetched files are pending.
+
+        Returns:
+            bool: True if prefetching should yield.
+        """
+        return self.download_management.busy(PRIORITY_PREFETCH)
+
+    def node_expanded(self, item):
+        """
+        Predict what is opened next from an expanded node of the tree.
+
+        Args:
+            item (TreeNode): Expanded node.
+        """
+        if not self.enabled:
+            return
+        self.listings.clear()
+        self.files.clear()
+        self.expanded = None
+        self.predicted = 0
+        if hasattr(item, "container"):
+            # Expanding a container opens its own listing, then its siblings'
+            siblings = item.parent_item
+            rows = sorted(
+                range(siblings.rowCount()), key=lambda row: abs(row - item.row())
+            )
+            containers = [siblings.child(row) for row in rows]
+            self._queue_files([item.container])
+        else:
+            # Children still loading are predicted as they are added
+            self.expanded = item
+            containers = [item.child(row) for row in range(item.rowCount())]
+            self._queue_files(
+                [c.container for c in containers if hasattr(c, "container")]
+            )
+        self._queue_listings(containers)
+        self._next()
+
+    def children_added(self, parent, first, last):
+        """
+        Predict what is opened next from children added to the expanded folder,
+        as its listing loads.
+
+        Args:
+            parent (TreeNode): Node the children were added to, or None for the
+                root of the tree.
+            first (int): Row of the first added child.
+            last (int): Row of the last added child.
+        """
+        if parent is None or parent is not self.expanded:
+            return
+        containers = [parent.child(row) for row in range(first, last + 1)]
+        self._queue_files([c.container for c in containers if hasattr(c, "container")])
+        self._queue_listings(containers)
+        self._next()
+
+    def _queue_listings(self, container_items):
+        """
+        Queue the listings of the children of container nodes, up to the maximum
+        per expanded node.
+
+        Args:
+            container_items (list): Nodes whose children are listed.
+        """
+        for container_item in container_items:
+            if self.predicted >= self.max_listings:
+                break
+            child_class = getattr(container_item, "child_class", None)
+            if hasattr(container_item, "container") and child_class is not None:
+                self.listings.append(
+                    (container_item.container.id, child_class.container_type)
+                )
+                self.predicted += 1
+
+    def _list(self, parent_id, container_type):
+        """
+        List child containers, fetching them if their listing is stale.
+
+        Runs on the prefetch thread.
+
+        Args:
+            parent_id (str): Id of the parent container.
+            container_type (str): Type of the child containers.
+
+        Returns:
+            list: StoredContainers of the children.
+        """
+        if self.metadata_store.is_stale(parent_id, container_type):
+            return self.metadata_store.fetch_children(parent_id, container_type)
+        return self.metadata_store.children(parent_id, container_type)
+
+    def _queue_files(self, containers):
+        """
+        Queue the files of containers that match the "usually opened" patterns.
+
+        Args:
+            containers (list): Containers whose files are matched.
+        """
+        for pattern in self.patterns:
+            filters = CacheFilters(
+                pattern.get("types"), pattern.get("names"), pattern.get("modalities")
+            )
+            for container in containers:
+                if not self._matches(pattern, container):
+                    continue
+                for file_obj in getattr(container, "files", None) or []:
+                    if filters.match(file_obj) and not self.cache_index.is_cached(
+                        file_obj.id
+                    ):
+                        self.files.append(
+                            DownloadRequest(
+                                file_obj.id,
+                                container,
+                                file_obj.name,
+                                get_cache_path(container, file_obj),
+                                size=file_obj.size,
+                                hash=file_obj.hash,
+                                version=getattr(file_obj, "version", None),
+                                modified=file_obj.modified,
+                            )
+                        )
+
+    @staticmethod
+    def _matches(pattern, container):
+        """
+        Check if a container hosts the files of a "usually opened" pattern.
+
+        Args:
+            pattern (dict): Pattern with the type and a glob of the label of the
+                containers hosting the files, both optional.
+            container (flywheel.Container): Container to check.
+
+        Returns:
+            bool: True if the files of the container are matched by the pattern.
+        """
+        actual_type = getattr(container, "container_type", None)
+        if actual_type is None:
+            # Files and other nodes that host no files
+            return False
+        container_type = pattern.get("container", actual_type)
+        return container_type == actual_type and fnmatch(
+            container.label, pattern.get("label", "*")
+        )
+
+    def _next(self):
+        """
+        Start the next prediction, unless one is running or the user is
+        downloading.
+        """
+        if self.current is not None:
+            return
+        if self.busy():
+            self.timer.start(self.retry_interval)
+            return
+        if self.listings:
+            task = Worker(self._list, *self.listings.popleft())
+            task.signals.batch.connect(self._queue_files)
+            task.signals.error.connect(report_error)
+            task.signals.finished.connect(self._task_finished)
+        else:
+            request = self._next_file()
+            if request is None:
+                return
+            self.budget -= request.size
+            self.current = request
+            self.download_management.download(
+                [request],
+                on_finished=self._file_finished,
+                priority=PRIORITY_PREFETCH,
+                rate=self.rate,
+            )
+            return
+        self.current = task
+        self.thread_pool.start(task)
+
+    def _next_file(self):
+        """
+        Next queued file that is not cached and fits in the budget.
+
+        Returns:
+            DownloadRequest: Request of the file, or None if there is none.
+        """
+        while self.files:
+            request = self.files.popleft()
+            if request.size <= self.budget and not self.cache_index.is_cached(
+                request.key
+            ):
+                return request
+        return None
+
+    def _file_finished(self, batch):
+        """
+        Move on once a prefetched file is cached, or failed.
+
+        Args:
+            batch (DownloadBatch): Batch of the prefetched file.
+        """
+        if not batch.succeeded:
+            self.budget += sum(batch.requests[key].size for key in batch.failed)
+        self._task_finished()
+
+    def _task_finished(self):
+        """
+        Move on to the next prediction.
+        """
+        self.current = None
+        self._next()
@@ -0,0 +1,423 @@
+import webbrowser
+from abc import ABC, abstractmethod
+from collections import deque
+from functools import partial
+from pathlib import Path
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QProcess, QThreadPool, Qt, QTimer
+
+from management.error_reporting import report_error
+from management.workers import Worker
+
+
+def describe_files(app_data):
+    """
+    Describe the analysis or the files an app session was launched with.
+
+    Args:
+        app_data (dict): A dictionary referencing selected files from tree or
+            local analysis.
+
+    Returns:
+        str: Name of the analysis, or names of the input files.
+    """
+    if app_data.get("analysis_name"):
+        return app_data["analysis_name"]
+    return ", ".join(Path(v).name for v in app_data["input_files"].values())
+
+
+class Session(ABC):
+    """
+    An app launched by the launcher, listed in the sessions panel.
+    """
+
+    method = None
+
+    def __init__(self, app_name, description):
+        """
+        Initialize session.
+
+        Args:
+            app_name (str): Name of the app.
+            description (str): Analysis or files the app was launched with.
+        """
+        self.app_name = app_name
+        self.description = description
+        self.status = "Running"
+        self.item = None
+        self.manager = None
+
+    def open(self):
+        """
+        Bring the session to the user.
+        """
+
+    @abstractmethod
+    def stop(self, on_stopped):
+        """
+        Stop the session.
+
+        Args:
+            on_stopped (callable): Called once the session has stopped.
+        """
+
+    def poll(self):
+        """
+        Check the status of the session. Blocks; runs on a worker thread.
+
+        Returns:
+            str: Status of the session, or None if it cannot be polled.
+        """
+        return None
+
+    def output(self):
+        """
+        Output captured from the session.
+
+        Returns:
+            str: Captured output.
+        """
+        return ""
+
+    def _set_status(self, status):
+        """
+        Update the status of the session, in the panel once it is listed.
+
+        Args:
+            status (str): Status of the session.
+        """
+        if self.manager is not None:
+            self.manager.set_status(self, status)
+        else:
+            self.status = status
+
+
+class NativeSession(Session):
+    """
+    An app running as a native process, supervised without blocking the GUI.
+    """
+
+    method = "Native_OS"
+
+    # Lines of stdout and stderr kept per session
+    max_output_lines = 5000
+    # Milliseconds to wait for the app to terminate before killing it
+    kill_timeout = 5000
+
+    def __init__(self, app_name, description, command):
+        """
+        Start the app.
+
+        Args:
+            app_name (str): Name of the app.
+            description (str): Analysis or files the app was launched with.
+            command (list): Command to launch the app with.
+        """
+        super(NativeSession, self).__init__(app_name, description)
+        self.lines = deque(maxlen=self.max_output_lines)
+        self.on_stopped = None
+        self.process = QProcess()
+        self.process.readyReadStandardOutput.connect(
+            lambda: self._read(self.process.readAllStandardOutput())
+        )
+        self.process.readyReadStandardError.connect(
+            lambda: self._read(self.process.readAllStandardError())
+        )
+        self.process.finished.connect(self._finished)
+        self.process.errorOccurred.connect(self._error)
+        self.process.start(command[0], command[1:])
+
+    def open(self):
+        """
+        Show the output of the app.
+        """
+        self.manager.show_output(self)
+
+    def stop(self, on_stopped):
+        """
+        Terminate the app, killing it if it does not exit in time.
+
+        Args:
+            on_stopped (callable): Called once the app has exited.
+        """
+        if self.process.state() == QProcess.NotRunning:
+            on_stopped()
+            return
+        self.on_stopped = on_stopped
+        self.process.terminate()
+        QTimer.singleShot(self.kill_timeout, self.process.kill)
+
+    def output(self):
+        """
+        Output captured from the app.
+
+        Returns:
+            str: Last lines of stdout and stderr.
+        """
+        return "".join(self.lines)
+
+    def _read(self, data):
+        """
+        Capture output of the app.
+
+        Args:
+            data (QByteArray): Output read from the app.
+        """
+        text = bytes(data).decode(errors="replace")
+        self.lines.extend(text.splitlines(keepends=True))
+
+    def _finished(self, exit_code, exit_status):
+        """
+        Report the exit of the app.
+
+        Args:
+            exit_code (int): Exit code of the app.
+            exit_status (QProcess.ExitStatus): Whether the app exited normally.
+        """
+        if exit_status == QProcess.CrashExit:
+            self._set_status("Crashed")
+        else:
+            self._set_status(f"Exited ({exit_code})")
+        if self.on_stopped:
+            self.on_stopped()
+
+    def _error(self, error):
+        """
+        Report an app that could not be started.
+
+        Args:
+            error (QProcess.ProcessError): Error of the process.
+        """
+        if error == QProcess.FailedToStart:
+            self.lines.append(self.process.errorString() + "\n")
+            self._set_status("Failed to start")
+
+
+class NovncSession(Session):
+    """
+    An app running in a novnc container, viewed in the web browser.
+    """
+
+    method = "Docker_novnc"
+
+    def __init__(self, novnc_pool, container, session_info):
+        """
+        Initialize session of a claimed container.
+
+        Args:
+            novnc_pool (NovncPool): Pool the container was claimed from.
+            container (docker.models.containers.Container): Container of the app.
+            session_info (dict): Description of the session, with its URL.
+        """
+        super(NovncSession, self).__init__(
+            session_info.get("app_name", container.name),
+            session_info.get("description", ""),
+        )
+        self.novnc_pool = novnc_pool
+        self.container = container
+        self.url = session_info["url"]
+
+    def open(self):
+        """
+        Open the novnc page of the session.
+        """
+        webbrowser.open(self.url)
+
+    def stop(self, on_stopped):
+        """
+        Remove the container of the session.
+
+        Args:
+            on_stopped (callable): Called once the container is removed.
+        """
+        self.novnc_pool.stop(self.container, on_stopped)
+
+    def poll(self):
+        """
+        Check the status of the container.
+
+        Returns:
+            str: Status of the container (e.g. running or exited).
+        """
+        return self.novnc_pool.status(self.container).capitalize()
+
+
+class SessionManagement:
+    """
+    Class that tracks the app sessions launched side by side in a sessions panel.
+    """
+
+    # Milliseconds between checks of the status of running sessions
+    poll_interval = 10 * 1000
+
+    def __init__(self, main_window):
+        """
+        Initialize the sessions panel.
+
+        Args:
+            main_window (AppLauncher): Main window to dock the panel in.
+        """
+        self.main_window = main_window
+        self.ui = main_window.ui
+        self.sessions = []
+        self.poller = None
+
+        self.tree = QtWidgets.QTreeWidget()
+        self.tree.setHeaderLabels(["App", "Method", "Files", "Status"])
+        self.tree.setRootIsDecorated(False)
+        self.tree.itemDoubleClicked.connect(lambda item, _: self._session(item).open())
+        open_button = QtWidgets.QPushButton("Open")
+        open_button.clicked.connect(self.open_selected)
+        output_button = QtWidgets.QPushButton("Output...")
+        output_button.clicked.connect(self.show_selected_output)
+        stop_button = QtWidgets.QPushButton("Stop")
+        stop_button.clicked.connect(self.stop_selected)
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addStretch()
+        buttons.addWidget(open_button)
+        buttons.addWidget(output_button)
+        buttons.addWidget(stop_button)
+
+        widget = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout(widget)
+        layout.addWidget(self.tree)
+        layout.addLayout(buttons)
+        self.dock = QtWidgets.QDockWidget("Sessions", main_window)
+        self.dock.setWidget(widget)
+        main_window.addDockWidget(Qt.BottomDockWidgetArea, self.dock)
+        menu = self.ui.menubar.addMenu("Sessions")
+        menu.addAction(self.dock.toggleViewAction())
+
+        self.poll_timer = QTimer()
+        self.poll_timer.setInterval(self.poll_interval)
+        self.poll_timer.timeout.connect(self.poll)
+        self.poll_timer.start()
+
+    def add(self, session):
+        """
+        List a launched session in the panel.
+
+        Args:
+            session (Session): Launched session.
+        """
+        session.item = QtWidgets.QTreeWidgetItem(
+            self.tree,
+            [session.app_name, session.method, session.description, session.status],
+        )
+        session.item.setToolTip(2, session.description)
+        session.manager = self
+        self.sessions.append(session)
+        self.dock.show()
+
+    def set_status(self, session, status):
+        """
+        Update the status of a session.
+
+        Args:
+            session (Session): Listed session.
+            status (str): Status of the session.
+        """
+        session.status = status
+        if session in self.sessions:
+            session.item.setText(3, status)
+
+    def remove(self, session):
+        """
+        Remove a session from the panel.
+
+        Args:
+            session (Session): Listed session.
+        """
+        if session in self.sessions:
+            self.sessions.remove(session)
+            self.tree.takeTopLevelItem(self.tree.indexOfTopLevelItem(session.item))
+
+    def _session(self, item):
+        """
+        Session listed by an item of the panel.
+
+        Args:
+            item (QtWidgets.QTreeWidgetItem): Item of the panel.
+
+        Returns:
+            Session: Session of the item.
+        """
+        return next(session for session in self.sessions if session.item is item)
+
+    def _selected_sessions(self):
+        """
+        Sessions selected in the panel.
+
+        Returns:
+            list: Selected sessions.
+        """
+        return [self._session(item) for item in self.tree.selectedItems()]
+
+    def open_selected(self):
+        """
+        Bring the selected sessions to the user.
+        """
+        for session in self._selected_sessions():
+            session.open()
+
+    def show_selected_output(self):
+        """
+        Show the output of the selected sessions.
+        """
+        for session in self._selected_sessions():
+            self.show_output(session)
+
+    def show_output(self, session):
+        """
+        Show the output captured from a session.
+
+        Args:
+            session (Session): Listed session.
+        """
+        dialog = QtWidgets.QDialog(self.main_window)
+        dialog.setWindowTitle(f"{session.app_name}: {session.description}")
+        dialog.resize(600, 400)
+        text = QtWidgets.QPlainTextEdit(session.output())
+        text.setReadOnly(True)
+        layout = QtWidgets.QVBoxLayout(dialog)
+        layout.addWidget(text)
+        dialog.exec_()
+
+    def stop_selected(self):
+        """
+        Stop the selected sessions and remove them from the panel once stopped.
+        """
+        for session in self._selected_sessions():
+            self.set_status(session, "Stopping")
+            session.stop(partial(self.remove, session))
+
+    def poll(self):
+        """
+        Check the status of running sessions on a worker thread.
+        """
+        if self.poller is not None:
+            return
+        sessions = [s for s in self.sessions if s.status != "Stopping"]
+        self.poller = Worker(lambda: [(s, s.poll()) for s in sessions])
+        self.poller.signals.batch.connect(self._polled)
+        self.poller.signals.error.connect(report_error)
+        self.poller.signals.finished.connect(self._poll_finished)
+        QThreadPool.globalInstance().start(self.poller)
+
+    def _polled(self, statuses):
+        """
+        Update the statuses of polled sessions.
+
+        Args:
+            statuses (list): Tuples of each session and its status.
+        """
+        for session, status in statuses:
+            if status is not None and session.status != "Stopping":
+                self.set_status(session, status)
+
+    def _poll_finished(self):
+        """
+        Allow the next poll.
+        """
+        self.poller = None
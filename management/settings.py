@@ -0,0 +1,74 @@
+import copy
+import json
+
+# Defaults of all launcher settings. Any of these may be overridden in
+# ~/flywheelIO/settings.json.
+DEFAULT_SETTINGS = {
+    # Seconds a listing of child containers is served from the metadata store
+    # before it is revalidated, by type of child container.
+    "metadata_ttls": {
+        "group": 24 * 3600,
+        "project": 3600,
+        "subject": 600,
+        "session": 600,
+        "acquisition": 600,
+        # Bulk snapshots of the whole hierarchy of a project
+        "snapshot": 600,
+    },
+    # Fetch the whole hierarchy of a project in bulk as it is first expanded
+    "bulk_project_snapshot": False,
+    # Bandwidth (MB/s) of all downloads and of downloads from each host (0 for no
+    # limit)
+    "download_bandwidth_mb": 0,
+    "download_host_bandwidth_mb": 0,
+    # Prefetch listings of the containers around the node expanded in the tree
+    "prefetch_metadata": True,
+    # Files usually opened, cached in the background as their containers are
+    # shown, e.g. [{"container": "acquisition", "label": "*T1*",
+    # "names": ["*.nii.gz"]}]. "types" and "modalities" may be matched too.
+    "prefetch_files": [],
+    # Bandwidth (MB/s) and total size per launcher session of prefetched files
+    "prefetch_bandwidth_mb": 5,
+    "prefetch_budget_gb": 2,
+    # Initial and highest number of concurrent requests to the flywheel instance,
+    # adapted to its responses, and seconds after which a request is slow
+    "api_concurrency": 4,
+    "api_max_concurrency": 16,
+    "api_latency_target": 5.0,
+    # Seconds reads of the flywheel client are reused for, and how many are kept
+    "client_cache_ttl": 60,
+    "client_cache_entries": 1000,
+    # Size of the local file cache before files are evicted
+    "cache_quota_gb": 100,
+    # Eviction policy of the local file cache: "lru" or "lfu"
+    "cache_eviction": "lru",
+    # Number of pre-started novnc containers kept per app image
+    "novnc_pool_size": 1,
+    # Seconds after the last novnc launch of an app that its warm containers are kept
+    "novnc_idle_timeout": 30 * 60,
+    # Upload outputs of an analysis as they are written while it is being edited
+    "watch_analysis_outputs": False,
+}
+
+
+def load_settings(cache_dir):
+    """
+    Load launcher settings, falling back to defaults for anything not configured.
+
+    Args:
+        cache_dir (pathlib.Path): Cache directory that may host settings.json.
+
+    Returns:
+        dict: Launcher settings.
+    """
+    settings = copy.deepcopy(DEFAULT_SETTINGS)
+    settings_file = cache_dir / "settings.json"
+    if settings_file.exists():
+        with open(settings_file, "r") as fp:
+            user_settings = json.load(fp)
+        for key, value in user_settings.items():
+            if isinstance(value, dict) and isinstance(settings.get(key), dict):
+                settings[key].update(value)
+            else:
+                settings[key] = value
+    return settings
@@ -0,0 +1,334 @@
+import json
+from fnmatch import fnmatch
+from pathlib import Path
+
+import bson
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QThreadPool
+
+from management.cache_management import get_cache_path
+from management.download_management import PRIORITY_CACHE, DownloadRequest
+from management.error_reporting import report_error
+from management.workers import Worker
+
+# Child containers listed when walking down from each container type
+CHILD_CONTAINERS = {
+    "group": "projects",
+    "project": "subjects",
+    "subject": "sessions",
+    "session": "acquisitions",
+}
+
+
+def walk_files(container, limiter):
+    """
+    Walk the container hierarchy below container, yielding each file on the way.
+
+    Args:
+        container (flywheel.Container): Container to walk down from.
+        limiter (AdaptiveLimiter): Limiter the listings of child containers are
+            sent through.
+
+    Yields:
+        tuple: The parent container and the flywheel.FileEntry of each file.
+    """
+    containers = [container]
+    while containers:
+        container = containers.pop()
+        for file_obj in getattr(container, "files", None) or []:
+            yield container, file_obj
+        child_containers = CHILD_CONTAINERS.get(container.container_type)
+        if child_containers:
+            containers.extend(limiter.call(getattr(container, child_containers)))
+
+
+class CacheFilters:
+    """
+    Filters selecting which files of a subtree are cached.
+    """
+
+    def __init__(self, types=None, names=None, modalities=None):
+        """
+        Initialize filters. An empty filter matches every file.
+
+        Args:
+            types (list, optional): File types to match (e.g. nifti, dicom).
+            names (list, optional): Glob patterns of file names (e.g. *.nii.gz).
+            modalities (list, optional): File modalities to match (e.g. MR).
+        """
+        self.types = [t.lower() for t in types or []]
+        self.names = list(names or [])
+        self.modalities = [m.lower() for m in modalities or []]
+
+    def match(self, file_obj):
+        """
+        Check if a file passes all filters.
+
+        Args:
+            file_obj (flywheel.FileEntry): File to check.
+
+        Returns:
+            bool: True if the file matches.
+        """
+        if self.types and (file_obj.type or "").lower() not in self.types:
+            return False
+        if self.names and not any(fnmatch(file_obj.name, n) for n in self.names):
+            return False
+        if self.modalities and (file_obj.modality or "").lower() not in self.modalities:
+            return False
+        return True
+
+    def to_dict(self):
+        """
+        Serialize filters for the record of a job.
+
+        Returns:
+            dict: Filters as a dictionary.
+        """
+        return {"types": self.types, "names": self.names, "modalities": self.modalities}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Deserialize filters from the record of a job.
+
+        Args:
+            data (dict): Filters as a dictionary.
+
+        Returns:
+            CacheFilters: Deserialized filters.
+        """
+        return cls(data["types"], data["names"], data["modalities"])
+
+
+class CacheFiltersDialog(QtWidgets.QDialog):
+    """
+    Dialog to choose the filters of a subtree cache job.
+    """
+
+    def __init__(self, parent, label):
+        """
+        Initialize dialog with comma-separated fields for each filter.
+
+        Args:
+            parent (QtWidgets.QWidget): Parent widget of the dialog.
+            label (str): Label of the container to cache.
+        """
+        super(CacheFiltersDialog, self).__init__(parent)
+        self.setWindowTitle(f"Cache {label}")
+        self.txt_types = QtWidgets.QLineEdit()
+        self.txt_types.setPlaceholderText("e.g. nifti, dicom")
+        self.txt_names = QtWidgets.QLineEdit()
+        self.txt_names.setPlaceholderText("e.g. *.nii.gz")
+        self.txt_modalities = QtWidgets.QLineEdit()
+        self.txt_modalities.setPlaceholderText("e.g. MR")
+        buttons = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel
+        )
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QtWidgets.QFormLayout(self)
+        layout.addRow("File types:", self.txt_types)
+        layout.addRow("File names:", self.txt_names)
+        layout.addRow("Modalities:", self.txt_modalities)
+        layout.addRow(buttons)
+
+    def filters(self):
+        """
+        Create the filters entered in the dialog.
+
+        Returns:
+            CacheFilters: Filters of the cache job.
+        """
+
+        def split(text):
+            return [value.strip() for value in text.split(",") if value.strip()]
+
+        return CacheFilters(
+            split(self.txt_types.text()),
+            split(self.txt_names.text()),
+            split(self.txt_modalities.text()),
+        )
+
+
+class SubtreeCacheJob:
+    """
+    Recursively cache every matching file below a container.
+
+    The hierarchy is walked on a worker thread and files are handed to the download
+    engine in batches as they are found, so downloads start while the walk is still
+    running. The job is recorded on disk until complete so it can be resumed if the
+    launcher is closed or interrupted. Files already cached are skipped on resume.
+    """
+
+    # Number of files handed to the download engine at a time
+    batch_size = 50
+
+    def __init__(self, main_window, job_file):
+        """
+        Initialize job from its record on disk.
+
+        Args:
+            main_window (AppLauncher): Main window with the flywheel client.
+            job_file (pathlib.Path): Path to the json record of the job.
+        """
+        self.main_window = main_window
+        self.job_file = Path(job_file)
+        with open(self.job_file, "r") as fp:
+            self.record = json.load(fp)
+        self.filters = CacheFilters.from_dict(self.record["filters"])
+        self.walker = None
+        self.walking = False
+        self.pending_batches = 0
+        self.n_files = 0
+        self.n_failed = 0
+
+    @classmethod
+    def jobs_dir(cls, main_window):
+        """
+        Directory holding the records of subtree cache jobs.
+
+        Args:
+            main_window (AppLauncher): Main window with the cache directory.
+
+        Returns:
+            pathlib.Path: Directory of job records.
+        """
+        return main_window.CacheDir / ".cache_jobs"
+
+    @classmethod
+    def create(cls, main_window, container, filters):
+        """
+        Record a new job for caching the subtree of a container.
+
+        Args:
+            main_window (AppLauncher): Main window with the flywheel client.
+            container (flywheel.Container): Root container of the subtree.
+            filters (CacheFilters): Filters selecting the files to cache.
+
+        Returns:
+            SubtreeCacheJob: The newly recorded job.
+        """
+        jobs_dir = cls.jobs_dir(main_window)
+        jobs_dir.mkdir(parents=True, exist_ok=True)
+        job_id = str(bson.ObjectId())
+        record = {
+            "id": job_id,
+            "container_id": container.id,
+            "label": container.label,
+            "filters": filters.to_dict(),
+        }
+        job_file = jobs_dir / (job_id + ".json")
+        with open(job_file, "w") as fp:
+            json.dump(record, fp, indent=4)
+        return cls(main_window, job_file)
+
+    @classmethod
+    def interrupted(cls, main_window):
+        """
+        List the jobs recorded on disk, which did not complete.
+
+        Args:
+            main_window (AppLauncher): Main window with the flywheel client.
+
+        Returns:
+            list: SubtreeCacheJobs to resume.
+        """
+        jobs = []
+        for job_file in sorted(cls.jobs_dir(main_window).glob("*.json")):
+            jobs.append(cls(main_window, job_file))
+        return jobs
+
+    def start(self, on_finished=None):
+        """
+        Start walking the subtree and downloading its matching files.
+
+        Args:
+            on_finished (callable, optional): Called with the job once all of its
+                files have been cached or have failed. Defaults to None.
+        """
+        self.on_finished = on_finished
+        self.walking = True
+        self.walker = Worker(self._matching_files, batch_size=self.batch_size)
+        self.walker.signals.batch.connect(self._download_batch)
+        self.walker.signals.error.connect(self._walk_failed)
+        self.walker.signals.finished.connect(self._walk_finished)
+        QThreadPool.globalInstance().start(self.walker)
+
+    def _matching_files(self):
+        """
+        Walk the subtree for the files matching the job's filters.
+
+        Runs on a worker thread.
+
+        Yields:
+            DownloadRequest: Request to download each matching file.
+        """
+        container = self.main_window.fw_client.get(self.record["container_id"])
+        for file_parent, file_obj in walk_files(container, self.main_window.limiter):
+            if self.filters.match(file_obj):
+                yield DownloadRequest(
+                    file_obj.id,
+                    file_parent,
+                    file_obj.name,
+                    get_cache_path(file_parent, file_obj),
+                    size=file_obj.size,
+                    hash=file_obj.hash,
+                    version=getattr(file_obj, "version", None),
+                    modified=file_obj.modified,
+                )
+
+    def _download_batch(self, requests):
+        """
+        Hand a batch of matching files to the download engine.
+
+        Args:
+            requests (list): DownloadRequests of the batch.
+        """
+        self.pending_batches += 1
+        self.n_files += len(requests)
+        self.main_window.download_management.download(
+            requests, on_finished=self._batch_finished, priority=PRIORITY_CACHE
+        )
+
+    def _batch_finished(self, batch):
+        """
+        Record the outcome of a batch of downloads.
+
+        Args:
+            batch (DownloadBatch): Completed batch.
+        """
+        self.pending_batches -= 1
+        self.n_failed += len(batch.failed)
+        self._check_finished()
+
+    def _walk_failed(self, error):
+        """
+        Record a failure to walk the subtree.
+
+        Args:
+            error (Exception): Exception raised while walking.
+        """
+        report_error(error)
+        self.n_failed += 1
+
+    def _walk_finished(self):
+        """
+        Record the end of the walk of the subtree.
+        """
+        self.walking = False
+        self._check_finished()
+
+    def _check_finished(self):
+        """
+        Complete the job once the walk and all of its downloads are done.
+
+        The job stays recorded, to be resumed, if anything failed.
+        """
+        if self.walking or self.pending_batches:
+            return
+        if not self.n_failed:
+            self.job_file.unlink()
+        if self.on_finished:
+            self.on_finished(self)
@@ -1,13 +1,24 @@
-from PyQt5 import QtGui, QtWidgets
-from PyQt5.QtCore import Qt
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QPoint, Qt, QThreadPool, QTimer
 from PyQt5.QtWidgets import QAbstractItemView
 
+from management.download_management import PRIORITY_CACHE, PRIORITY_OPEN
+from management.error_reporting import report_error
 from management.fw_container_items import (
+    AcquisitionItem,
     AnalysisFolderItem,
     ContainerItem,
+    ContainerModel,
     FileItem,
     GroupItem,
+    ProjectItem,
+    SessionItem,
+    SubjectItem,
+    patch_children,
 )
+from management.prefetch import Prefetcher
+from management.subtree_caching import CacheFiltersDialog, SubtreeCacheJob
+from management.workers import Worker
 
 
 class TreeManagement:
@@ -25,18 +36,46 @@ class TreeManagement:
         self.main_window = main_window
         self.ui = main_window.ui
         self.cache_files = {}
+        # Flywheel references of the files in cache_files, keyed by file id
+        self.input_refs = {}
+        self.cache_jobs = []
+        # Workers giving files opened in apps a content of their own
+        self.unsharers = set()
         tree = self.ui.treeView
         tree.setEditTriggers(QAbstractItemView.NoEditTriggers)
         tree.clicked.connect(self.tree_clicked)
         tree.doubleClicked.connect(self.tree_dblclicked)
         tree.expanded.connect(self.on_expanded)
+        tree.collapsed.connect(self.on_collapsed)
+        tree.verticalScrollBar().valueChanged.connect(self.on_scrolled)
 
         tree.setContextMenuPolicy(Qt.CustomContextMenu)
         tree.customContextMenuRequested.connect(self.open_menu)
-        self.source_model = QtGui.QStandardItemModel()
+        self.metadata_store = main_window.metadata_store
+        self.source_model = ContainerModel(self.metadata_store, main_window.cache_index)
+        self.prefetcher = Prefetcher(main_window)
         tree.setModel(self.source_model)
+        # Coalesces the checks for folders whose last listed child is shown, as the
+        # tree is scrolled, expanded or listed
+        self.page_timer = QTimer()
+        self.page_timer.setSingleShot(True)
+        self.page_timer.timeout.connect(self.fetch_shown_pages)
+        self.source_model.rowsInserted.connect(lambda *args: self.page_timer.start())
+        self.source_model.rowsInserted.connect(self.on_rows_inserted)
+
+        menu = self.ui.menubar.addMenu("Metadata")
+        action = menu.addAction("Export Snapshot...")
+        action.triggered.connect(self.export_snapshot)
+        action = menu.addAction("Import Snapshot...")
+        action.triggered.connect(self.import_snapshot)
+        menu.addSeparator()
+        action = menu.addAction("Fetch Whole Projects on Expand")
+        action.setCheckable(True)
+        action.toggled.connect(self._snapshot_toggled)
+        action.setChecked(main_window.settings["bulk_project_snapshot"])
 
         self.populateTree()
+        self.resume_cache_jobs()
 
     def tree_clicked(self, index):
         """
@@ -66,10 +105,55 @@ class TreeManagement:
     def populateTree(self):
         """
         Populate the tree starting with groups
+
+        Groups are rendered from the metadata store and revalidated in the
+        background.
+        """
+        root = self.source_model.invisibleRootItem()
+        groups = self.metadata_store.children(None, "group")
+        root.appendRows([GroupItem(root, group) for group in groups or []])
+
+        if self.metadata_store.is_stale(None, "group"):
+            self.group_loader = Worker(
+                self.metadata_store.fetch_children, None, "group"
+            )
+            self.group_loader.signals.batch.connect(
+                lambda groups: patch_children(root, GroupItem, groups)
+            )
+            self.group_loader.signals.error.connect(report_error)
+            QThreadPool.globalInstance().start(self.group_loader)
+
+    def _snapshot_toggled(self, checked):
+        """
+        Enable or disable fetching the whole hierarchy of projects as they are first
+        expanded.
+
+        Args:
+            checked (bool): True to fetch project snapshots.
+        """
+        self.source_model.snapshot_projects = checked
+
+    def export_snapshot(self):
+        """
+        Export the metadata store to a snapshot for other workstations.
+        """
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self.main_window, "Export Metadata Snapshot", "", "SQLite (*.sqlite)"
+        )
+        if path:
+            self.metadata_store.export_snapshot(path)
+
+    def import_snapshot(self):
+        """
+        Import a metadata snapshot and re-render the tree from it.
         """
-        groups = self.main_window.fw_client.groups()
-        for group in groups:
-            group_item = GroupItem(self.source_model, group)
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self.main_window, "Import Metadata Snapshot", "", "SQLite (*.sqlite)"
+        )
+        if path:
+            self.metadata_store.import_snapshot(path)
+            self.source_model.clear()
+            self.populateTree()
 
     def get_id(self, index):
         """
@@ -79,7 +163,7 @@ class TreeManagement:
             index (QtCore.QModelIndex): Index from selected tree node.
 
         Returns:
-            QtGui.QStandardItem: Returns the item with designated index.
+            TreeNode: Returns the item with designated index.
         """
         item = self.source_model.itemFromIndex(index)
         id = item.data()
@@ -97,15 +181,23 @@ class TreeManagement:
         indexes = self.ui.treeView.selectedIndexes()
         if len(indexes) > 0:
             hasFile = False
+            containers = []
             for index in indexes:
                 item = self.source_model.itemFromIndex(index)
                 if isinstance(item, FileItem):
                     hasFile = True
+                elif isinstance(
+                    item, (ProjectItem, SubjectItem, SessionItem, AcquisitionItem)
+                ):
+                    containers.append(item)
 
             menu = QtWidgets.QMenu()
             if hasFile:
                 action = menu.addAction("Cache Selected Files")
                 action.triggered.connect(self._cache_selected)
+            if containers:
+                action = menu.addAction("Cache Subtree...")
+                action.triggered.connect(lambda: self._cache_subtrees(containers))
             menu.exec_(self.ui.treeView.viewport().mapToGlobal(position))
 
     def _cache_selected(self):
@@ -114,50 +206,259 @@ class TreeManagement:
         """
         # TODO: Acknowledge this is for files only or change for all files of selected
         #       Acquisitions.
-        indexes = self.ui.treeView.selectedIndexes()
-        if len(indexes) > 0:
-            for index in indexes:
-                item = self.source_model.itemFromIndex(index)
-                if isinstance(item, FileItem):
-                    item._add_to_cache()
+        self._download_items(self._selected_files(), PRIORITY_CACHE)
+
+    def _cache_subtrees(self, container_items):
+        """
+        Recursively cache the files below the selected containers.
+
+        Args:
+            container_items (list): ContainerItems whose subtrees are cached.
+        """
+        label = ", ".join(item.container.label for item in container_items)
+        dialog = CacheFiltersDialog(self.main_window, label)
+        if dialog.exec_() != QtWidgets.QDialog.Accepted:
+            return
+        filters = dialog.filters()
+        for item in container_items:
+            job = SubtreeCacheJob.create(self.main_window, item.container, filters)
+            self._start_cache_job(job)
+
+    def _start_cache_job(self, job):
+        """
+        Start a subtree cache job and track it until it is finished.
+
+        Args:
+            job (SubtreeCacheJob): Job to start.
+        """
+        self.cache_jobs.append(job)
+        job.start(on_finished=self._cache_job_finished)
+
+    def _cache_job_finished(self, job):
+        """
+        Report the outcome of a subtree cache job.
+
+        Args:
+            job (SubtreeCacheJob): Finished job.
+        """
+        self.cache_jobs.remove(job)
+        label = job.record["label"]
+        if job.n_failed:
+            message = f"Caching {label} incomplete: {job.n_failed} failures."
+        else:
+            message = f"Cached {job.n_files} files of {label}."
+        self.ui.statusbar.showMessage(message)
+
+    def resume_cache_jobs(self):
+        """
+        Offer to resume subtree cache jobs that were interrupted.
+        """
+        jobs = SubtreeCacheJob.interrupted(self.main_window)
+        if not jobs:
+            return
+        labels = "\n".join(job.record["label"] for job in jobs)
+        answer = QtWidgets.QMessageBox.question(
+            self.main_window,
+            "Resume Caching",
+            f"Caching of the following was interrupted. Resume?\n{labels}",
+        )
+        for job in jobs:
+            if answer == QtWidgets.QMessageBox.Yes:
+                self._start_cache_job(job)
+            else:
+                job.job_file.unlink()
+
+    def _selected_files(self):
+        """
+        List the file items selected in the tree.
+
+        Returns:
+            list: FileItems selected in the tree.
+        """
+        file_items = []
+        for index in self.ui.treeView.selectedIndexes():
+            item = self.source_model.itemFromIndex(index)
+            if isinstance(item, FileItem):
+                file_items.append(item)
+        return file_items
+
+    def _download_items(self, file_items, priority, on_finished=None):
+        """
+        Download file items into the cache in parallel.
+
+        Items are marked as cached through the cache index as their files arrive.
+
+        Args:
+            file_items (list): FileItems to cache.
+            priority (int): Priority class of the downloads (e.g. PRIORITY_OPEN).
+            on_finished (callable, optional): Called with the DownloadBatch once all
+                downloads have completed or failed. Defaults to None.
+
+        Returns:
+            DownloadBatch: The batch tracking the requested downloads.
+        """
+        return self.main_window.download_management.download(
+            [item._download_request() for item in file_items],
+            on_finished=on_finished,
+            priority=priority,
+        )
+
+    def on_scrolled(self, value):
+        """
+        Triggered on vertical scrolling of the tree.
+
+        Args:
+            value (int): Position of the vertical scroll bar.
+        """
+        self.page_timer.start()
+
+    def fetch_shown_pages(self):
+        """
+        List the next page of every folder whose last listed child is shown.
+
+        Tree views only fetch children of a node as it is expanded. Folders list
+        their next page once their last child is in view, wherever they are in the
+        tree.
+        """
+        tree = self.ui.treeView
+        model = self.source_model
+        bottom = tree.viewport().height()
+        index = tree.indexAt(QPoint(0, 0))
+        while index.isValid() and tree.visualRect(index).top() < bottom:
+            parent = index.parent()
+            node = model.itemFromIndex(parent)
+            if node is not None and index.row() == node.rowCount() - 1:
+                node.request_more()
+                if model.canFetchMore(parent):
+                    model.fetchMore(parent)
+            index = tree.indexBelow(index)
 
     def on_expanded(self, index):
         """
         Triggered on the expansion of any tree node.
 
-        Used to populate subtree on expanding only.  This significantly speeds up the
-        population of the tree.
+        Prefetches what is likely to be expanded or opened next.
 
         Args:
             index (QtCore.QModelIndex): Index of expanded tree node.
         """
+        self.page_timer.start()
+        self.prefetcher.node_expanded(self.source_model.itemFromIndex(index))
+
+    def on_rows_inserted(self, parent, first, last):
+        """
+        Triggered as children are added to any tree node.
+
+        Prefetches for the children added to an expanded folder as it loads.
+
+        Args:
+            parent (QtCore.QModelIndex): Index of the node the children were added to.
+            first (int): Row of the first added child.
+            last (int): Row of the last added child.
+        """
+        self.prefetcher.children_added(
+            self.source_model.itemFromIndex(parent), first, last
+        )
+
+    def on_collapsed(self, index):
+        """
+        Triggered on the collapse of any tree node.
+
+        Cancels any listing of child containers still in progress for the node.
+
+        Args:
+            index (QtCore.QModelIndex): Index of collapsed tree node.
+        """
         item = self.source_model.itemFromIndex(index)
-        if hasattr(item, "_on_expand"):
-            item._on_expand()
+        if hasattr(item, "_on_collapse"):
+            item._on_collapse()
 
-    def cache_selected_for_open(self):
+    def cache_selected_for_open(self, on_cached, priority=PRIORITY_OPEN):
         """
         Cache selected files (entire acq??) if necessary for opening in application.
 
+        Files are downloaded in parallel. on_cached is only called once every selected
+        file is present in the cache.
+
         TODO: I may want to rework this according to what files are needed where:
             * View-Only?
             * As a part of analysis.
             * Do I want to add selected files to an analysis via context menu?
+
+        Args:
+            on_cached (callable): Called with the cache paths and the Flywheel
+                references of the selected files, keyed by file id, once they are
+                all cached.
+            priority (int, optional): Priority class of the downloads. Defaults to
+                PRIORITY_OPEN.
         """
-        tree = self.ui.treeView
-        self.cache_files.clear()
-        for index in tree.selectedIndexes():
-            file_path = self.main_window.CacheDir
-            item = self.source_model.itemFromIndex(index)
-            if isinstance(item, FileItem):
-                file_path = item._add_to_cache()
+        # New dicts, so opens still in progress keep their own selection
+        cache_files = self.cache_files = {}
+        input_refs = self.input_refs = {}
+        file_items = self._selected_files()
+        for item in file_items:
+            file_path = item._get_cache_path()
+
+            # TODO: Handle only NIfTIs for now.
+            # if ".zip" in str(file_path):
+            #     input_zip = ZipFile(file_path, "r")
+            #     zip_folder = Path(str(file_path).replace(".zip", ""))
+            #     if not zip_folder.exists():
+            #         os.makedirs(zip_folder)
+            #     input_zip.extractall(zip_folder)
 
-                # TODO: Handle only NIfTIs for now.
-                # if ".zip" in str(file_path):
-                #     input_zip = ZipFile(file_path, "r")
-                #     zip_folder = Path(str(file_path).replace(".zip", ""))
-                #     if not zip_folder.exists():
-                #         os.makedirs(zip_folder)
-                #     input_zip.extractall(zip_folder)
+            cache_files[item.container.id] = str(file_path)
+            input_refs[item.container.id] = item._file_ref()
 
-                self.cache_files[item.container.id] = str(file_path)
+        self.main_window.cache_management.touch(list(cache_files.keys()))
+        self._download_items(
+            file_items,
+            priority,
+            on_finished=lambda batch: self._cached_for_open(
+                batch, cache_files, input_refs, on_cached
+            ),
+        )
+
+    def _cached_for_open(self, batch, cache_files, input_refs, on_cached):
+        """
+        Continue opening files once their downloads have finished.
+
+        Args:
+            batch (DownloadBatch): Batch of downloaded files.
+            cache_files (dict): Cache paths of the files, keyed by file id.
+            input_refs (dict): Flywheel references of the files, keyed by file id.
+            on_cached (callable): Called with cache_files and input_refs if all
+                files are cached.
+        """
+        if batch.succeeded:
+            # Apps may write to the files they open, which must not reach the other
+            # cache paths sharing their content
+            unsharer = Worker(
+                self.main_window.content_store.unshare, list(cache_files.values())
+            )
+            unsharer.signals.batch.connect(lambda _: on_cached(cache_files, input_refs))
+            unsharer.signals.error.connect(self._unshare_failed)
+            unsharer.signals.finished.connect(lambda: self.unsharers.discard(unsharer))
+            self.unsharers.add(unsharer)
+            QThreadPool.globalInstance().start(unsharer)
+        else:
+            names = [batch.requests[key].file_name for key in batch.failed]
+            QtWidgets.QMessageBox.warning(
+                self.main_window,
+                "Download Failed",
+                "The following files could not be cached:\n" + "\n".join(names),
+            )
+
+    def _unshare_failed(self, error):
+        """
+        Report files that could not be given a content of their own, which are then
+        not opened.
+
+        Args:
+            error (Exception): Exception raised while unsharing the files.
+        """
+        QtWidgets.QMessageBox.warning(
+            self.main_window,
+            "Open Failed",
+            f"The selected files could not be prepared for opening:\n{error}",
+        )
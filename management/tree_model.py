@@ -0,0 +1,495 @@
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, Qt
+
+# Role of the value of TreeNode.data and TreeNode.setData, as in QStandardItem
+USER_ROLE = Qt.UserRole + 1
+
+
+class TreeNode:
+    """
+    Node of a TreeModel, with the parts of the QStandardItem API used by the tree.
+
+    Nodes are plain Python objects: a node costs no Qt allocation until a view asks
+    for its index. Children are added in batches, with one row insertion per batch.
+    Nodes whose children are only known once they are shown override can_fetch_more
+    and fetch_more, which the view calls as the node is expanded or scrolled.
+    """
+
+    __slots__ = ("_parent", "_model", "_row", "_children", "_data", "_flags")
+
+    def __init__(self, text=""):
+        """
+        Initialize a detached node.
+
+        Args:
+            text (str, optional): Text displayed for the node. Defaults to "".
+        """
+        self._parent = None
+        self._model = None
+        self._row = 0
+        self._children = []
+        self._data = {Qt.DisplayRole: text}
+        self._flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def can_fetch_more(self):
+        """
+        Check if the node has children left to fetch.
+
+        Returns:
+            bool: True if fetch_more would add children.
+        """
+        return False
+
+    def fetch_more(self):
+        """
+        Add the next children of the node.
+        """
+
+    def request_more(self):
+        """
+        Ask for the next children, as the last listed child is scrolled into view.
+        """
+
+    def model(self):
+        """
+        Model of the node.
+
+        Returns:
+            TreeModel: Model the node is attached to, or None if it is detached.
+        """
+        return self._model
+
+    def parent(self):
+        """
+        Parent of the node, as for QStandardItem.
+
+        Returns:
+            TreeNode: Parent node, or None for top-level and detached nodes.
+        """
+        if self._parent is None or self._parent._parent is None:
+            return None
+        return self._parent
+
+    def row(self):
+        """
+        Row of the node under its parent.
+
+        Returns:
+            int: Row of the node.
+        """
+        return self._row
+
+    def index(self):
+        """
+        Index of the node in its model.
+
+        Returns:
+            QtCore.QModelIndex: Index of the node, invalid for the root or when
+                detached.
+        """
+        if self._model is None or self._parent is None:
+            return QModelIndex()
+        return self._model.createIndex(self._row, 0, self)
+
+    def rowCount(self):
+        """
+        Number of children of the node.
+
+        Returns:
+            int: Number of children.
+        """
+        return len(self._children)
+
+    def child(self, row):
+        """
+        Child of the node.
+
+        Args:
+            row (int): Row of the child.
+
+        Returns:
+            TreeNode: Child at row, or None.
+        """
+        if 0 <= row < len(self._children):
+            return self._children[row]
+        return None
+
+    def hasChildren(self):
+        """
+        Check if the node has, or may fetch, children.
+
+        Returns:
+            bool: True if the node should be expandable.
+        """
+        return bool(self._children) or self.can_fetch_more()
+
+    def appendRow(self, node):
+        """
+        Add a child to the node.
+
+        Args:
+            node (TreeNode): Detached node to add.
+        """
+        self.appendRows([node])
+
+    def appendRows(self, nodes):
+        """
+        Add children to the node in a single row insertion.
+
+        Args:
+            nodes (list): Detached nodes to add.
+        """
+        if not nodes:
+            return
+        first = len(self._children)
+        if self._model is not None:
+            self._model.beginInsertRows(self.index(), first, first + len(nodes) - 1)
+        for row, node in enumerate(nodes, first):
+            node._parent = self
+            node._row = row
+            node._set_model(self._model)
+        self._children.extend(nodes)
+        if self._model is not None:
+            self._model.endInsertRows()
+
+    def removeRow(self, row):
+        """
+        Remove a child of the node.
+
+        Args:
+            row (int): Row of the child.
+        """
+        self.removeRows(row, 1)
+
+    def removeRows(self, row, count):
+        """
+        Remove children of the node in a single row removal.
+
+        Args:
+            row (int): Row of the first child to remove.
+            count (int): Number of children to remove.
+        """
+        if count <= 0:
+            return
+        if self._model is not None:
+            self._model.beginRemoveRows(self.index(), row, row + count - 1)
+        removed = self._children[row : row + count]
+        del self._children[row : row + count]
+        for node in removed:
+            node._parent = None
+            node._set_model(None)
+        for row, node in enumerate(self._children[row:], row):
+            node._row = row
+        if self._model is not None:
+            self._model.endRemoveRows()
+
+    def _set_model(self, model):
+        """
+        Attach the node and its descendants to a model, or detach them.
+
+        Args:
+            model (TreeModel): Model to attach to, or None to detach.
+        """
+        self._model = model
+        for node in self._children:
+            node._set_model(model)
+
+    def data(self, role=USER_ROLE):
+        """
+        Value of the node for a role.
+
+        Args:
+            role (int, optional): Item data role. Defaults to USER_ROLE.
+
+        Returns:
+            object: Value for the role, or None.
+        """
+        return self._data.get(role)
+
+    def setData(self, value, role=USER_ROLE):
+        """
+        Set the value of the node for a role.
+
+        Args:
+            value (object): Value for the role, or None to unset it.
+            role (int, optional): Item data role. Defaults to USER_ROLE.
+        """
+        if value is None:
+            self._data.pop(role, None)
+        else:
+            self._data[role] = value
+        if self._model is not None and self._parent is not None:
+            index = self.index()
+            self._model.dataChanged.emit(index, index, [role])
+
+    def text(self):
+        """
+        Text displayed for the node.
+
+        Returns:
+            str: Displayed text.
+        """
+        return self.data(Qt.DisplayRole)
+
+    def setText(self, text):
+        """
+        Set the text displayed for the node.
+
+        Args:
+            text (str): Displayed text.
+        """
+        self.setData(text, Qt.DisplayRole)
+
+    def setIcon(self, icon):
+        """
+        Set the icon displayed for the node.
+
+        Args:
+            icon (QtGui.QIcon): Displayed icon.
+        """
+        self.setData(icon, Qt.DecorationRole)
+
+    def setToolTip(self, tool_tip):
+        """
+        Set the tooltip of the node.
+
+        Args:
+            tool_tip (str): Tooltip text.
+        """
+        self.setData(tool_tip, Qt.ToolTipRole)
+
+    def setForeground(self, brush):
+        """
+        Set the brush the text of the node is drawn with.
+
+        Args:
+            brush (QtGui.QBrush): Foreground brush.
+        """
+        self.setData(brush, Qt.ForegroundRole)
+
+    def flags(self):
+        """
+        Item flags of the node.
+
+        Returns:
+            Qt.ItemFlags: Flags of the node.
+        """
+        return self._flags
+
+    def setEnabled(self, enabled):
+        """
+        Enable or disable the node.
+
+        Args:
+            enabled (bool): True to enable the node.
+        """
+        self._set_flag(Qt.ItemIsEnabled, enabled)
+
+    def setSelectable(self, selectable):
+        """
+        Allow or prevent selection of the node.
+
+        Args:
+            selectable (bool): True to make the node selectable.
+        """
+        self._set_flag(Qt.ItemIsSelectable, selectable)
+
+    def _set_flag(self, flag, on):
+        """
+        Set or clear an item flag of the node.
+
+        Args:
+            flag (Qt.ItemFlag): Flag to set or clear.
+            on (bool): True to set the flag.
+        """
+        if on:
+            self._flags |= flag
+        else:
+            self._flags &= ~flag
+
+
+class TreeModel(QAbstractItemModel):
+    """
+    Single-column tree model over TreeNodes.
+
+    Children are fetched through the nodes' can_fetch_more and fetch_more, so views
+    only populate the nodes they show.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty model.
+        """
+        super(TreeModel, self).__init__()
+        self.root = TreeNode()
+        self.root._model = self
+
+    def invisibleRootItem(self):
+        """
+        Root node of the model, as for QStandardItemModel.
+
+        Returns:
+            TreeNode: Root node.
+        """
+        return self.root
+
+    def itemFromIndex(self, index):
+        """
+        Node of an index, as for QStandardItemModel.
+
+        Args:
+            index (QtCore.QModelIndex): Index of the node.
+
+        Returns:
+            TreeNode: Node of the index, or None if the index is invalid.
+        """
+        if not index.isValid():
+            return None
+        return index.internalPointer()
+
+    def _node(self, index):
+        """
+        Node of an index, or the root for an invalid index.
+
+        Args:
+            index (QtCore.QModelIndex): Index of the node.
+
+        Returns:
+            TreeNode: Node of the index.
+        """
+        return index.internalPointer() if index.isValid() else self.root
+
+    def clear(self):
+        """
+        Remove all nodes.
+        """
+        self.beginResetModel()
+        for node in self.root._children:
+            node._parent = None
+            node._set_model(None)
+        self.root._children = []
+        self.endResetModel()
+
+    def index(self, row, column, parent=QModelIndex()):
+        """
+        Index of a child node.
+
+        Args:
+            row (int): Row of the child.
+            column (int): Column (only 0).
+            parent (QtCore.QModelIndex, optional): Index of the parent node.
+
+        Returns:
+            QtCore.QModelIndex: Index of the child, invalid if there is none.
+        """
+        node = self._node(parent).child(row)
+        if column != 0 or node is None:
+            return QModelIndex()
+        return self.createIndex(row, column, node)
+
+    def parent(self, index=None):
+        """
+        Index of the parent of a node.
+
+        Args:
+            index (QtCore.QModelIndex, optional): Index of the node. Without it, the
+                QObject parent of the model is returned.
+
+        Returns:
+            QtCore.QModelIndex: Index of the parent, invalid for top-level nodes.
+        """
+        if index is None:
+            return super(TreeModel, self).parent()
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer()._parent
+        if parent is None or parent is self.root:
+            return QModelIndex()
+        return parent.index()
+
+    def rowCount(self, parent=QModelIndex()):
+        """
+        Number of children of a node.
+
+        Args:
+            parent (QtCore.QModelIndex, optional): Index of the node.
+
+        Returns:
+            int: Number of children.
+        """
+        if parent.column() > 0:
+            return 0
+        return self._node(parent).rowCount()
+
+    def columnCount(self, parent=QModelIndex()):
+        """
+        Number of columns.
+
+        Args:
+            parent (QtCore.QModelIndex, optional): Index of the node.
+
+        Returns:
+            int: 1.
+        """
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        """
+        Check if a node is expandable.
+
+        Args:
+            parent (QtCore.QModelIndex, optional): Index of the node.
+
+        Returns:
+            bool: True if the node has, or may fetch, children.
+        """
+        return self._node(parent).hasChildren()
+
+    def canFetchMore(self, parent):
+        """
+        Check if a node has children left to fetch.
+
+        Args:
+            parent (QtCore.QModelIndex): Index of the node.
+
+        Returns:
+            bool: True if more children can be fetched.
+        """
+        return self._node(parent).can_fetch_more()
+
+    def fetchMore(self, parent):
+        """
+        Fetch the next children of a node.
+
+        Args:
+            parent (QtCore.QModelIndex): Index of the node.
+        """
+        self._node(parent).fetch_more()
+
+    def data(self, index, role=Qt.DisplayRole):
+        """
+        Value of a node for a role.
+
+        Args:
+            index (QtCore.QModelIndex): Index of the node.
+            role (int, optional): Item data role. Defaults to Qt.DisplayRole.
+
+        Returns:
+            object: Value for the role, or None.
+        """
+        if not index.isValid():
+            return None
+        return index.internalPointer().data(role)
+
+    def flags(self, index):
+        """
+        Item flags of a node.
+
+        Args:
+            index (QtCore.QModelIndex): Index of the node.
+
+        Returns:
+            Qt.ItemFlags: Flags of the node.
+        """
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return index.internalPointer().flags()
@@ -0,0 +1,77 @@
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+
+class WorkerSignals(QObject):
+    """
+    Signals emitted by a Worker.
+
+    QRunnable is not a QObject, so it cannot host signals itself. Signals emitted from
+    the worker thread are queued to the GUI thread.
+    """
+
+    batch = pyqtSignal(object)
+    error = pyqtSignal(object)
+    finished = pyqtSignal()
+
+
+class Worker(QRunnable):
+    """
+    Run a (blocking) function on a QThreadPool thread and emit its results.
+    """
+
+    def __init__(self, fn, *args, batch_size=None, **kwargs):
+        """
+        Initialize Worker with the function to run in the background.
+
+        Args:
+            fn (callable): Function to run off of the GUI thread.
+            *args: Positional arguments to fn.
+            batch_size (int, optional): If given, fn returns an iterable whose items
+                are emitted in lists of batch_size. Otherwise the result of fn is
+                emitted as a single batch. Defaults to None.
+            **kwargs: Keyword arguments to fn.
+        """
+        super(Worker, self).__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.batch_size = batch_size
+        self.cancelled = False
+        self.signals = WorkerSignals()
+
+    def cancel(self):
+        """
+        Request cancellation of the worker.
+
+        Cancellation is cooperative: no further batches are emitted, but a blocking
+        call already in progress runs to completion.
+        """
+        self.cancelled = True
+
+    def run(self):
+        """
+        Run fn and emit its results in batches.
+        """
+        try:
+            if self.cancelled:
+                return
+            result = self.fn(*self.args, **self.kwargs)
+            if self.batch_size is None:
+                if not self.cancelled:
+                    self.signals.batch.emit(result)
+                return
+            batch = []
+            for res in result:
+                if self.cancelled:
+                    return
+                batch.append(res)
+                if len(batch) >= self.batch_size:
+                    self.signals.batch.emit(batch)
+                    batch = []
+            if batch and not self.cancelled:
+                self.signals.batch.emit(batch)
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.error.emit(e)
+        finally:
+            self.signals.finished.emit()
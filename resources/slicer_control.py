@@ -0,0 +1,34 @@
+import json
+import os
+
+import qt
+import slicer
+
+# Run in a pre-started Slicer with --python-script. The launcher delivers the files to
+# open by writing load.json next to this script.
+CONTROL_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUEST_FILE = os.path.join(CONTROL_DIR, "load.json")
+
+
+def load_requested():
+    """
+    Load the files of a pending request into a cleared scene.
+    """
+    if not os.path.exists(REQUEST_FILE):
+        return
+    with open(REQUEST_FILE, "r") as fp:
+        request = json.load(fp)
+    os.remove(REQUEST_FILE)
+    slicer.mrmlScene.Clear(0)
+    if request.get("scene"):
+        slicer.util.loadScene(request["scene"])
+    for path in request.get("files", []):
+        try:
+            slicer.app.ioManager().loadFile(path)
+        except Exception as e:
+            print(e)
+
+
+control_timer = qt.QTimer()
+control_timer.timeout.connect(load_requested)
+control_timer.start(1000)
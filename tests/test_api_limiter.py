@@ -0,0 +1,211 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from management import api_limiter
+from management.api_limiter import (
+    AdaptiveLimiter,
+    RetryableStatus,
+    is_refused,
+    is_retryable,
+)
+
+
+class FakeTime:
+    """
+    Clock advanced by sleeps and by the requests themselves.
+    """
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(api_limiter, "time", clock)
+    return clock
+
+
+def status_error(status, headers=None):
+    response = SimpleNamespace(
+        status_code=status, url="https://flywheel.example", headers=headers or {}
+    )
+    return RetryableStatus(response)
+
+
+class Flaky:
+    """
+    Request raising the given errors before succeeding.
+    """
+
+    def __init__(self, *errors, duration=0.0, clock=None, limiter=None):
+        self.errors = list(errors)
+        self.duration = duration
+        self.clock = clock
+        self.limiter = limiter
+        self.calls = 0
+        self.in_use = []
+
+    def __call__(self):
+        self.calls += 1
+        if self.limiter is not None:
+            self.in_use.append(self.limiter.in_use)
+        if self.clock is not None:
+            self.clock.now += self.duration
+        if self.errors:
+            raise self.errors.pop(0)
+        return "result"
+
+
+def refused_error():
+    error = requests.exceptions.ConnectionError("refused")
+    error.__cause__ = NewConnectionError(None, "Failed to establish a connection")
+    return error
+
+
+@pytest.mark.parametrize(
+    "error, retryable, refused",
+    [
+        (status_error(429), True, True),
+        (status_error(503), True, False),
+        (status_error(404), False, False),
+        (requests.exceptions.Timeout(), True, False),
+        (ConnectionRefusedError(), True, True),
+        (refused_error(), True, True),
+        (ValueError(), False, False),
+    ],
+)
+def test_error_classification(error, retryable, refused):
+    assert is_retryable(error) is retryable
+    assert is_refused(error) is refused
+
+
+def test_success_grows_limit_additively(clock):
+    limiter = AdaptiveLimiter(initial=4)
+    assert limiter.call(Flaky()) == "result"
+    assert limiter.limit == pytest.approx(4.25)
+    assert limiter.in_use == 0
+
+
+def test_limit_is_bounded(clock):
+    limiter = AdaptiveLimiter(initial=2, minimum=2, maximum=2)
+    limiter.call(Flaky())
+    assert limiter.limit == 2
+    limiter.call(Flaky(status_error(503)))
+    assert limiter.limit == 2
+
+
+def test_failure_halves_limit_and_retries(clock):
+    limiter = AdaptiveLimiter(initial=8)
+    request = Flaky(status_error(503))
+    assert limiter.call(request) == "result"
+    assert request.calls == 2
+    assert len(clock.sleeps) == 1
+    assert 0 <= clock.sleeps[0] <= limiter.base_delay
+    # Halved by the failure, then grown by the retry
+    assert limiter.limit == pytest.approx(4.25)
+    assert limiter.error_rate > 0
+
+
+def test_slow_request_halves_limit(clock):
+    limiter = AdaptiveLimiter(initial=8, latency_target=5.0)
+    limiter.call(Flaky(duration=6.0, clock=clock))
+    assert limiter.limit == 4
+
+
+def test_failures_of_the_same_round_decrease_once(clock):
+    limiter = AdaptiveLimiter(initial=8)
+    start = clock.now
+    clock.now += 1
+    limiter._adapt(start, True)
+    limiter._adapt(start, True)
+    assert limiter.limit == 4
+    limiter._adapt(clock.now + 1, True)
+    assert limiter.limit == 2
+
+
+def test_retry_after_is_honored_and_capped(clock):
+    limiter = AdaptiveLimiter()
+    limiter.call(
+        Flaky(
+            status_error(429, {"Retry-After": "3"}),
+            status_error(429, {"Retry-After": "3600"}),
+        )
+    )
+    assert clock.sleeps == [3.0, limiter.max_delay]
+
+
+def test_delay_backs_off_exponentially(monkeypatch):
+    monkeypatch.setattr(api_limiter.random, "uniform", lambda low, high: high)
+    limiter = AdaptiveLimiter()
+    delays = [limiter._delay(ValueError(), attempt) for attempt in range(8)]
+    assert delays == [0.5, 1, 2, 4, 8, 16, 30, 30]
+
+
+def test_non_retryable_errors_are_raised_at_once(clock):
+    limiter = AdaptiveLimiter(initial=8)
+    request = Flaky(status_error(404))
+    with pytest.raises(RetryableStatus):
+        limiter.call(request)
+    assert request.calls == 1
+    # Answered by the instance, which is neither throttling nor failing
+    assert limiter.limit > 8
+    assert limiter.error_rate == 0
+    assert limiter.in_use == 0
+
+
+def test_retries_are_bounded(clock):
+    limiter = AdaptiveLimiter()
+    request = Flaky(*[status_error(503)] * limiter.attempts)
+    with pytest.raises(RetryableStatus):
+        limiter.call(request)
+    assert request.calls == limiter.attempts
+    assert limiter.in_use == 0
+
+
+@pytest.mark.parametrize("error", [status_error(503), requests.exceptions.Timeout()])
+def test_writes_are_not_retried_unless_refused(clock, error):
+    limiter = AdaptiveLimiter(initial=8)
+    request = Flaky(error)
+    with pytest.raises(type(error)):
+        limiter.write(request)
+    assert request.calls == 1
+    assert limiter.limit == 4
+
+
+@pytest.mark.parametrize("error", [status_error(429), refused_error()])
+def test_refused_writes_are_retried(clock, error):
+    request = Flaky(error)
+    assert AdaptiveLimiter().write(request) == "result"
+    assert request.calls == 2
+
+
+def test_uploads_hold_no_slot_while_transferring(clock):
+    limiter = AdaptiveLimiter(initial=1)
+    request = Flaky(limiter=limiter, duration=60.0, clock=clock)
+    assert limiter.upload(request) == "result"
+    assert request.in_use == [0]
+    # The duration of the transfer is not taken as latency
+    assert limiter.limit == 1
+
+
+def test_failed_uploads_decrease_limit_only_if_retryable(clock):
+    limiter = AdaptiveLimiter(initial=8)
+    with pytest.raises(ValueError):
+        limiter.upload(Flaky(ValueError()))
+    assert limiter.limit == 8
+    with pytest.raises(RetryableStatus):
+        limiter.upload(Flaky(status_error(503)))
+    assert limiter.limit == 4
+    assert limiter.in_use == 0
@@ -0,0 +1,49 @@
+import pytest
+
+from management.cache_management import is_cache_path, scan_cache
+
+
+@pytest.mark.parametrize(
+    "relative, expected",
+    [
+        ("group/project/file_id/a.nii.gz", True),
+        ("group/project/subject/session/acquisition/file_id/a.dcm", True),
+        ("settings.json", False),
+        ("group/project/a.nii.gz", False),
+        ("Analyses/project/analysis/file_id/a.nii.gz", False),
+        ("group/project/file_id/.version.json", False),
+        ("group/.store/file_id/a.nii.gz", False),
+        ("group/project/file_id/a.nii.gz.part", False),
+    ],
+)
+def test_is_cache_path(tmp_path, relative, expected):
+    assert is_cache_path(tmp_path, tmp_path / relative) is expected
+
+
+def test_paths_outside_the_cache_are_not_cached(tmp_path):
+    assert not is_cache_path(tmp_path / "cache", tmp_path / "g/p/file_id/a.dcm")
+
+
+def test_scan_cache_keys_cached_files_by_file_id(tmp_path):
+    cached = [
+        tmp_path / "group/project/file_1/a.nii.gz",
+        tmp_path / "group/project/subject/session/acquisition/file_2/b.dcm",
+    ]
+    skipped = [
+        tmp_path / "settings.json",
+        tmp_path / "group/project/file_3/c.dcm.part",
+        tmp_path / "group/project/file_1/.version.json",
+        tmp_path / "Analyses/project/analysis/file_4/d.dcm",
+        tmp_path / ".store/ab/file_5/e.dcm",
+    ]
+    for path in cached + skipped:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x")
+
+    assert scan_cache(str(tmp_path), tmp_path) == {
+        "file_1": cached[0],
+        "file_2": cached[1],
+    }
+    # Subdirectories of the cache are scanned relative to its root
+    subtree = tmp_path / "group/project/subject"
+    assert scan_cache(str(subtree), tmp_path) == {"file_2": cached[1]}
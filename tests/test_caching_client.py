@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pytest
+
+from management.api_limiter import AdaptiveLimiter
+from management.caching_client import CachingClient
+
+
+class FakeClient:
+    """
+    Client counting the requests sent for each container.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def get_project(self, project_id):
+        self.requests.append(project_id)
+        self.started.set()
+        self.release.wait()
+        return {"id": project_id, "request": len(self.requests)}
+
+    def get_failing(self, project_id):
+        self.requests.append(project_id)
+        self.started.set()
+        self.release.wait()
+        raise KeyError(project_id)
+
+    def add_note(self, container_id, note):
+        return note
+
+    def groups(self):
+        self.requests.append("groups")
+        return []
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+@pytest.fixture
+def caching_client(client):
+    return CachingClient(client, AdaptiveLimiter())
+
+
+def test_reads_are_memoized(client, caching_client):
+    first = caching_client.get_project("p1")
+    assert caching_client.get_project("p1") is first
+    assert caching_client.get_project(project_id="p1") is not first
+    assert client.requests == ["p1", "p1"]
+    assert caching_client.stats() == {
+        "hits": 1,
+        "misses": 2,
+        "coalesced": 0,
+        "size": 2,
+    }
+
+
+def test_other_methods_are_not_memoized(client, caching_client):
+    caching_client.groups()
+    caching_client.groups()
+    assert client.requests == ["groups", "groups"]
+
+
+def test_write_invalidates_the_container_written_to(client, caching_client):
+    caching_client.get_project("p1")
+    caching_client.get_project("p2")
+    assert caching_client.add_note("p1", "note") == "note"
+    caching_client.get_project("p1")
+    caching_client.get_project("p2")
+    assert client.requests == ["p1", "p2", "p1"]
+
+
+def test_invalidate_drops_every_result(client, caching_client):
+    caching_client.get_project("p1")
+    caching_client.get_project("p2")
+    caching_client.invalidate()
+    caching_client.get_project("p1")
+    caching_client.get_project("p2")
+    assert client.requests == ["p1", "p2", "p1", "p2"]
+
+
+def test_results_expire(client):
+    caching_client = CachingClient(client, AdaptiveLimiter(), ttl=0)
+    caching_client.get_project("p1")
+    caching_client.get_project("p1")
+    assert client.requests == ["p1", "p1"]
+
+
+def test_least_recently_used_results_are_evicted(client):
+    caching_client = CachingClient(client, AdaptiveLimiter(), max_entries=2)
+    caching_client.get_project("p1")
+    caching_client.get_project("p2")
+    caching_client.get_project("p1")
+    caching_client.get_project("p3")
+    caching_client.get_project("p1")
+    caching_client.get_project("p2")
+    assert client.requests == ["p1", "p2", "p3", "p2"]
+
+
+def test_unhashable_reads_are_not_memoized(client, caching_client):
+    caching_client.get_project(["p1"])
+    caching_client.get_project(["p1"])
+    assert client.requests == [["p1"], ["p1"]]
+
+
+def read_concurrently(caching_client, client, method, count):
+    """
+    Start count identical reads while the first one is in flight.
+    """
+    client.release.clear()
+    results = []
+    errors = []
+
+    def read():
+        try:
+            results.append(getattr(caching_client, method)("p1"))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read) for _ in range(count)]
+    threads[0].start()
+    assert client.started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while caching_client.stats()["coalesced"] < count - 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    return threads, results, errors
+
+
+def join(client, threads):
+    client.release.set()
+    for thread in threads:
+        thread.join(5)
+
+
+def test_identical_reads_in_flight_share_one_request(client, caching_client):
+    threads, results, errors = read_concurrently(
+        caching_client, client, "get_project", 5
+    )
+    join(client, threads)
+    assert client.requests == ["p1"]
+    assert not errors
+    assert len(results) == 5
+    assert all(result is results[0] for result in results)
+
+
+def test_errors_are_shared_and_not_cached(client, caching_client):
+    threads, results, errors = read_concurrently(
+        caching_client, client, "get_failing", 3
+    )
+    join(client, threads)
+    assert client.requests == ["p1"]
+    assert not results
+    assert len(errors) == 3 and all(isinstance(e, KeyError) for e in errors)
+    with pytest.raises(KeyError):
+        caching_client.get_failing("p1")
+    assert client.requests == ["p1", "p1"]
+
+
+def test_reads_invalidated_in_flight_are_not_cached(client, caching_client):
+    client.release.clear()
+    thread = threading.Thread(target=caching_client.get_project, args=("p1",))
+    thread.start()
+    assert client.started.wait(5)
+    caching_client.invalidate("p1")
+    join(client, [thread])
+    caching_client.get_project("p1")
+    assert client.requests == ["p1", "p1"]
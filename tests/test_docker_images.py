@@ -0,0 +1,17 @@
+import pytest
+
+from management.docker_images import full_tag
+
+
+@pytest.mark.parametrize(
+    "tag, expected",
+    [
+        ("stevepieper/slicer-chronicle", "stevepieper/slicer-chronicle:latest"),
+        ("stevepieper/slicer-chronicle:4.11", "stevepieper/slicer-chronicle:4.11"),
+        ("ubuntu", "ubuntu:latest"),
+        ("localhost:5000/slicer", "localhost:5000/slicer:latest"),
+        ("localhost:5000/slicer:1.0", "localhost:5000/slicer:1.0"),
+    ],
+)
+def test_full_tag(tag, expected):
+    assert full_tag(tag) == expected
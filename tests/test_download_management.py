@@ -0,0 +1,140 @@
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+from management.download_management import DownloadRequest
+
+CONTENT = bytes(range(256)) * 64
+
+
+def fw_hash(content):
+    return "v0-sha384-" + hashlib.sha384(content).hexdigest()
+
+
+class FakeResponse:
+    def __init__(self, content, status_code, chunk_size=1000):
+        self.content = content
+        self.status_code = status_code
+        self.chunk_size = chunk_size
+        self.url = "https://flywheel.example/api/files/a.dcm"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), self.chunk_size):
+            yield self.content[start : start + self.chunk_size]
+
+
+class FakeHttp:
+    """
+    Serves content, honoring Range requests unless ranges are ignored.
+    """
+
+    def __init__(self, content, ranges=True):
+        self.content = content
+        self.ranges = ranges
+        self.offsets = []
+
+    def file_url(self, file_parent, file_name):
+        return f"https://flywheel.example/api/files/{file_name}"
+
+    def get(self, url, offset=0):
+        self.offsets.append(offset)
+        if offset and self.ranges:
+            return FakeResponse(self.content[offset:], 206)
+        return FakeResponse(self.content, 200)
+
+    def throttle(self, url, size):
+        pass
+
+
+def request(tmp_path, content=CONTENT, size=None, hash=True):
+    return DownloadRequest(
+        "file_id",
+        SimpleNamespace(container_type="acquisition", id="acquisition_id"),
+        "a.dcm",
+        tmp_path / "file_id" / "a.dcm",
+        size=len(content) if size is None else size,
+        hash=fw_hash(content) if hash else None,
+    )
+
+
+def part_path(req):
+    return req.path.with_name(req.path.name + ".part")
+
+
+def test_fetch_verifies_and_renames_into_place(tmp_path):
+    req = request(tmp_path)
+    http = FakeHttp(CONTENT)
+    progress = []
+    req.fetch(http, progress.append)
+    assert req.path.read_bytes() == CONTENT
+    assert not part_path(req).exists()
+    assert http.offsets == [0]
+    assert progress[0] == 0 and progress[-1] == len(CONTENT)
+
+
+def test_fetch_resumes_partial_download(tmp_path):
+    req = request(tmp_path)
+    part_path(req).parent.mkdir(parents=True)
+    part_path(req).write_bytes(CONTENT[:5000])
+    http = FakeHttp(CONTENT)
+    progress = []
+    req.fetch(http, progress.append)
+    assert http.offsets == [5000]
+    assert progress[0] == 5000
+    assert req.path.read_bytes() == CONTENT
+
+
+def test_fetch_starts_over_if_range_is_ignored(tmp_path):
+    req = request(tmp_path)
+    part_path(req).parent.mkdir(parents=True)
+    part_path(req).write_bytes(CONTENT[:5000])
+    http = FakeHttp(CONTENT, ranges=False)
+    req.fetch(http, lambda offset: None)
+    assert http.offsets == [5000]
+    assert req.path.read_bytes() == CONTENT
+
+
+def test_fetch_restarts_partial_download_larger_than_file(tmp_path):
+    req = request(tmp_path)
+    part_path(req).parent.mkdir(parents=True)
+    part_path(req).write_bytes(CONTENT + b"extra")
+    http = FakeHttp(CONTENT)
+    req.fetch(http, lambda offset: None)
+    assert http.offsets == [0]
+    assert req.path.read_bytes() == CONTENT
+
+
+def test_fetch_rejects_hash_mismatch(tmp_path):
+    req = request(tmp_path)
+    http = FakeHttp(CONTENT[:-1] + b"\x00")
+    with pytest.raises(ValueError, match="hash"):
+        req.fetch(http, lambda offset: None)
+    assert not req.path.exists()
+    assert not part_path(req).exists()
+
+
+def test_fetch_keeps_short_download_for_resume(tmp_path):
+    req = request(tmp_path, size=len(CONTENT) + 10, hash=False)
+    with pytest.raises(ValueError, match="received"):
+        req.fetch(FakeHttp(CONTENT), lambda offset: None)
+    assert not req.path.exists()
+    assert part_path(req).read_bytes() == CONTENT
+
+
+def test_fetch_rejects_resumed_download_with_corrupt_part(tmp_path):
+    req = request(tmp_path)
+    part_path(req).parent.mkdir(parents=True)
+    part_path(req).write_bytes(b"\x00" * 5000)
+    with pytest.raises(ValueError, match="hash"):
+        req.fetch(FakeHttp(CONTENT), lambda offset: None)
+    assert not req.path.exists()
@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+import pytest
+
+from management.prefetch import Prefetcher
+
+
+def container(container_type="acquisition", label="T1 MPRAGE"):
+    return SimpleNamespace(container_type=container_type, label=label)
+
+
+@pytest.mark.parametrize(
+    "pattern, expected",
+    [
+        ({}, True),
+        ({"container": "acquisition"}, True),
+        ({"container": "session"}, False),
+        ({"label": "T1*"}, True),
+        ({"label": "T2*"}, False),
+        ({"container": "acquisition", "label": "*MPRAGE"}, True),
+    ],
+)
+def test_matches(pattern, expected):
+    assert Prefetcher._matches(pattern, container()) is expected
+
+
+def test_nodes_without_container_type_never_match():
+    assert not Prefetcher._matches({}, SimpleNamespace(label="a.dcm"))
+    assert not Prefetcher._matches({"label": "*"}, SimpleNamespace(name="a.dcm"))
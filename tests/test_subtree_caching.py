@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+import pytest
+
+from management.subtree_caching import CacheFilters
+
+
+def file_entry(name="scan.nii.gz", type="nifti", modality="MR"):
+    return SimpleNamespace(name=name, type=type, modality=modality)
+
+
+def test_empty_filters_match_every_file():
+    assert CacheFilters().match(file_entry())
+    assert CacheFilters().match(file_entry(type=None, modality=None))
+
+
+@pytest.mark.parametrize(
+    "filters, expected",
+    [
+        (CacheFilters(types=["NIfTI"]), True),
+        (CacheFilters(types=["dicom"]), False),
+        (CacheFilters(names=["*.dcm", "*.nii.gz"]), True),
+        (CacheFilters(names=["*.dcm"]), False),
+        (CacheFilters(modalities=["mr"]), True),
+        (CacheFilters(modalities=["CT"]), False),
+        (CacheFilters(["nifti"], ["*.nii.gz"], ["CT"]), False),
+        (CacheFilters(["nifti"], ["*.nii.gz"], ["MR"]), True),
+    ],
+)
+def test_match(filters, expected):
+    assert filters.match(file_entry()) is expected
+
+
+def test_missing_type_or_modality_fails_their_filters():
+    assert not CacheFilters(types=["nifti"]).match(file_entry(type=None))
+    assert not CacheFilters(modalities=["MR"]).match(file_entry(modality=None))
+
+
+def test_dict_round_trip():
+    filters = CacheFilters(["nifti"], ["*.nii.gz"], ["MR"])
+    restored = CacheFilters.from_dict(filters.to_dict())
+    assert restored.to_dict() == filters.to_dict()